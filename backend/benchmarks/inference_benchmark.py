@@ -0,0 +1,288 @@
+"""
+Inference benchmark for AIModelService
+
+Sweeps batch sizes from 1 (live scanner) to 100k (PCAP analysis) across
+scoring backends and reports rows/s and p50/p95/p99 latency. Results can
+be stored as a baseline and later runs compared against it.
+
+Run from the backend directory:
+    python -m benchmarks.inference_benchmark
+    python -m benchmarks.inference_benchmark --save-baseline
+    python -m benchmarks.inference_benchmark --batch-sizes 1 100 10000 --backends model service
+    python -m benchmarks.inference_benchmark --cascade-parity flows.csv
+
+Uses the registry's active model when its artifacts exist, otherwise a
+stand-in RandomForest with the same input shape (and the real scaler if
+it can be loaded). Exits with status 1 when a result regresses beyond the
+tolerance against the stored baseline.
+
+With --cascade-parity the model's cascade is also checked against the
+full model over a labelled flow CSV (cicflowmeter or CIC-IDS columns):
+agreement, stage-1 clear rate, attacks cleared by stage 1, recall of
+both and the speedup.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from services.ai_model_service import AIModelService
+from services.cascade import cascade_parity_report
+from services.feature_schema import FeaturePlan
+from services.model_mmap import CompiledTreeEnsemble
+from services.model_registry import ModelBundle, synthetic_batch
+from services.prediction_cache import PredictionCache
+from services.threat_rules import ThreatRuleTable
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DIR = Path(__file__).parent
+DEFAULT_BASELINE_FILE = BENCHMARK_DIR / "baselines.json"
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1000, 10000, 100000]
+BACKENDS = ["model", "service", "service-cached", "compiled"]
+
+def load_bundle(service: AIModelService) -> ModelBundle:
+    """
+    Load the active model bundle, or build a stand-in with the same shape
+    """
+    version = service.registry.active_version()
+    try:
+        return service.registry.load_bundle(version)
+    except Exception as e:
+        logger.warning(f"Model {version} unavailable ({str(e)}); using a stand-in RandomForest")
+
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    paths = service.registry.artifact_paths(version)
+    with open(paths["features"], 'r') as f:
+        selected_features = tuple(json.load(f))
+
+    try:
+        scaler = joblib.load(paths["scaler"])
+    except Exception:
+        scaler = StandardScaler().fit(np.random.default_rng(0).random((1000, len(selected_features))))
+
+    stand_in = ModelBundle(
+        version=f"{version}-standin",
+        model=None,
+        scaler=scaler,
+        selected_features=selected_features,
+        threat_rules=ThreatRuleTable(),
+        source_dir=paths["dir"]
+    )
+    features = synthetic_batch(stand_in, 20000, seed=1)
+    labels = (scaler.transform(features)[:, :3].sum(axis=1) > 0).astype(int)
+    model = RandomForestClassifier(n_estimators=100, random_state=0).fit(scaler.transform(features), labels)
+
+    return ModelBundle(
+        version=stand_in.version,
+        model=model,
+        scaler=scaler,
+        selected_features=selected_features,
+        threat_rules=stand_in.threat_rules,
+        source_dir=stand_in.source_dir
+    )
+
+def make_backends(bundle: ModelBundle, duplicate_ratio: float) -> Dict[str, Callable[[np.ndarray], Any]]:
+    """
+    Scoring functions keyed by backend name
+    """
+    service = AIModelService()
+    service.prediction_cache = None
+    service._bundle = bundle
+
+    cached_service = AIModelService()
+    cached_service.prediction_cache = PredictionCache()
+    cached_service._bundle = bundle
+
+    def run_model(batch):
+        return bundle.model.predict_proba(bundle.scaler.transform(batch))
+
+    def run_service(batch):
+        return service._predict_vectors(batch, bundle)
+
+    def run_cached_service(batch):
+        # Repetitive traffic: a share of rows repeats vectors already seen
+        repeated = int(len(batch) * duplicate_ratio)
+        if repeated:
+            batch = batch.copy()
+            batch[:repeated] = batch[0]
+        return cached_service._predict_vectors(batch, bundle)
+
+    backends = {
+        "model": run_model,
+        "service": run_service,
+        "service-cached": run_cached_service
+    }
+
+    if CompiledTreeEnsemble.supports(bundle.model):
+        compiled = CompiledTreeEnsemble.from_estimator(bundle.model)
+        backends["compiled"] = lambda batch: compiled.predict_proba(bundle.scaler.transform(batch))
+
+    return backends
+
+def run_sweep(
+    bundle: ModelBundle,
+    batch_sizes: List[int],
+    backend_names: List[str],
+    max_rows_per_point: int,
+    duplicate_ratio: float
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Time every backend at every batch size
+    """
+    backends = make_backends(bundle, duplicate_ratio)
+    pool = synthetic_batch(bundle, max(batch_sizes), seed=2)
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+    for backend_name in backend_names:
+        if backend_name not in backends:
+            logger.warning(f"Backend {backend_name} not available for this model, skipping")
+            continue
+
+        score = backends[backend_name]
+        results[backend_name] = {}
+
+        for batch_size in batch_sizes:
+            batch = pool[:batch_size]
+            repeats = int(min(200, max(3, max_rows_per_point // batch_size)))
+
+            score(batch)  # Warm-up
+            timings = []
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                score(batch)
+                timings.append(time.perf_counter() - start_time)
+
+            timings = np.asarray(timings)
+            results[backend_name][str(batch_size)] = {
+                "repeats": repeats,
+                "rows_per_second": float(batch_size * repeats / timings.sum()),
+                "p50_ms": float(np.percentile(timings, 50) * 1000),
+                "p95_ms": float(np.percentile(timings, 95) * 1000),
+                "p99_ms": float(np.percentile(timings, 99) * 1000)
+            }
+
+    return results
+
+def run_cascade_parity(bundle: ModelBundle, csv_file: Path, label_column: str) -> Dict[str, Any]:
+    """
+    Cascade against full-model scoring over the flows of a CSV, with recall
+    when it has a label column (anything but BENIGN counts as an attack)
+    """
+    frame = pd.read_csv(csv_file, low_memory=False)
+    frame.columns = [column.strip() for column in frame.columns]  # CIC-IDS headers have leading spaces
+
+    labels = None
+    if label_column in frame.columns:
+        labels = (frame.pop(label_column).astype(str).str.strip().str.upper() != "BENIGN").to_numpy(dtype=int)
+    else:
+        logger.warning(f"No {label_column} column in {csv_file}; reporting parity without recall")
+
+    plan = FeaturePlan.build(bundle, list(frame.columns))
+    report = cascade_parity_report(bundle, plan.feature_matrix(frame), labels)
+    report["csv"] = str(csv_file)
+    return report
+
+def compare_to_baseline(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    List regressions: throughput below or p95 latency above baseline by more than the tolerance
+    """
+    regressions = []
+    for backend_name, by_size in results.items():
+        for batch_size, current in by_size.items():
+            reference = baseline.get("results", {}).get(backend_name, {}).get(batch_size)
+            if not reference:
+                continue
+            if current["rows_per_second"] < reference["rows_per_second"] * (1 - tolerance):
+                regressions.append(
+                    f"{backend_name} @ {batch_size}: {current['rows_per_second']:.0f} rows/s "
+                    f"vs baseline {reference['rows_per_second']:.0f}"
+                )
+            if current["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{backend_name} @ {batch_size}: p95 {current['p95_ms']:.3f} ms "
+                    f"vs baseline {reference['p95_ms']:.3f} ms"
+                )
+    return regressions
+
+def print_report(results: Dict):
+    print(f"{'backend':<16}{'batch':>8}{'rows/s':>14}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for backend_name, by_size in results.items():
+        for batch_size, stats in by_size.items():
+            print(
+                f"{backend_name:<16}{batch_size:>8}{stats['rows_per_second']:>14.0f}"
+                f"{stats['p50_ms']:>12.3f}{stats['p95_ms']:>12.3f}{stats['p99_ms']:>12.3f}"
+            )
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ANUBIS model inference across batch sizes and backends")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--max-rows-per-point", type=int, default=200000, help="Caps repeats at large batch sizes")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.8, help="Share of repeated rows for service-cached")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--output", type=Path, help="Also write the results as JSON")
+    parser.add_argument("--cascade-parity", type=Path, metavar="CSV", help="Labelled flow CSV to check the cascade on")
+    parser.add_argument("--label-column", default="Label", help="Label column of the --cascade-parity CSV")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    bundle = load_bundle(AIModelService())
+    results = run_sweep(bundle, sorted(args.batch_sizes), args.backends, args.max_rows_per_point, args.duplicate_ratio)
+    print_report(results)
+
+    report = {
+        "model_version": bundle.version,
+        "model_type": type(bundle.model).__name__,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "created_at": datetime.utcnow().isoformat(),
+        "results": results
+    }
+
+    if args.cascade_parity:
+        try:
+            report["cascade_parity"] = run_cascade_parity(bundle, args.cascade_parity, args.label_column)
+        except ValueError as e:
+            print(f"Cascade parity check failed: {str(e)}")
+            return 1
+        print(json.dumps(report["cascade_parity"], indent=2))
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("model_version") != bundle.version:
+            print(f"Baseline was recorded with model {baseline.get('model_version')}, comparing anyway")
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions against baseline")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
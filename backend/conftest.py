@@ -0,0 +1 @@
+# Puts backend/ on sys.path, so tests import services.* and models.* however pytest is started
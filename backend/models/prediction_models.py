@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from models.network_models import AIModelOutput
+
+@dataclass(frozen=True)
+class PredictionBatch:
+    """
+    Struct-of-arrays prediction results for a batch of flows.
+
+    Rows stay as NumPy arrays through the analyzer and aggregation stages;
+    AIModelOutput objects or dicts are only materialized for the rows
+    actually returned by the API.
+    """
+    is_attack: np.ndarray       # bool, True for ATTACK
+    confidence: np.ndarray      # float64, probability of the predicted class
+    risk_score: np.ndarray      # float64
+    threat_code: np.ndarray     # int16, index into threat_labels, -1 for benign rows
+    threat_labels: tuple = ()
+
+    def __len__(self) -> int:
+        return len(self.is_attack)
+
+    @classmethod
+    def empty(cls, threat_labels: Sequence[str] = ()) -> "PredictionBatch":
+        return cls(
+            is_attack=np.zeros(0, dtype=bool),
+            confidence=np.zeros(0, dtype=np.float64),
+            risk_score=np.zeros(0, dtype=np.float64),
+            threat_code=np.zeros(0, dtype=np.int16),
+            threat_labels=tuple(threat_labels)
+        )
+
+    @classmethod
+    def fallback(cls, size: int, threat_labels: Sequence[str] = ()) -> "PredictionBatch":
+        """
+        Safe default (BENIGN, 0.5 confidence) for every row when inference fails
+        """
+        return cls(
+            is_attack=np.zeros(size, dtype=bool),
+            confidence=np.full(size, 0.5, dtype=np.float64),
+            risk_score=np.full(size, 0.5, dtype=np.float64),
+            threat_code=np.full(size, -1, dtype=np.int16),
+            threat_labels=tuple(threat_labels)
+        )
+
+    @classmethod
+    def concat(cls, batches: List["PredictionBatch"]) -> "PredictionBatch":
+        """
+        Concatenate batches, remapping threat codes onto a shared label table
+        """
+        batches = [batch for batch in batches if batch is not None]
+        if not batches:
+            return cls.empty()
+
+        labels: List[str] = []
+        for batch in batches:
+            for label in batch.threat_labels:
+                if label not in labels:
+                    labels.append(label)
+        label_index = {label: code for code, label in enumerate(labels)}
+
+        threat_codes = []
+        for batch in batches:
+            if batch.threat_labels == tuple(labels):
+                threat_codes.append(batch.threat_code)
+                continue
+            # Extra trailing -1 entry maps benign rows (code -1) to -1
+            remap = np.array([label_index[label] for label in batch.threat_labels] + [-1], dtype=np.int16)
+            threat_codes.append(remap[batch.threat_code])
+
+        return cls(
+            is_attack=np.concatenate([batch.is_attack for batch in batches]),
+            confidence=np.concatenate([batch.confidence for batch in batches]),
+            risk_score=np.concatenate([batch.risk_score for batch in batches]),
+            threat_code=np.concatenate(threat_codes).astype(np.int16),
+            threat_labels=tuple(labels)
+        )
+
+    def take(self, indices: np.ndarray) -> "PredictionBatch":
+        """
+        Select a subset of rows
+        """
+        return PredictionBatch(
+            is_attack=self.is_attack[indices],
+            confidence=self.confidence[indices],
+            risk_score=self.risk_score[indices],
+            threat_code=self.threat_code[indices],
+            threat_labels=self.threat_labels
+        )
+
+    @property
+    def classification(self) -> np.ndarray:
+        return np.where(self.is_attack, "ATTACK", "BENIGN").astype(object)
+
+    @property
+    def threat_type(self) -> np.ndarray:
+        # Extra trailing None entry maps code -1 to None
+        lookup = np.array(list(self.threat_labels) + [None], dtype=object)
+        return lookup[self.threat_code]
+
+    def threat_counts(self) -> Dict[str, int]:
+        """
+        Number of attack rows per threat type
+        """
+        codes = self.threat_code[self.is_attack & (self.threat_code >= 0)]
+        counts = np.bincount(codes, minlength=len(self.threat_labels))
+        return {label: int(count) for label, count in zip(self.threat_labels, counts) if count}
+
+    def to_dicts(self, indices: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Materialize prediction dicts (API shape) for the selected rows
+        """
+        batch = self if indices is None else self.take(indices)
+        return [
+            {
+                'classification': classification,
+                'confidence': confidence,
+                'risk_score': risk_score,
+                'threat_type': threat_type if attack else None
+            }
+            for attack, classification, confidence, risk_score, threat_type in zip(
+                batch.is_attack.tolist(),
+                batch.classification.tolist(),
+                batch.confidence.tolist(),
+                batch.risk_score.tolist(),
+                batch.threat_type.tolist()
+            )
+        ]
+
+    def to_outputs(self, indices: Optional[np.ndarray] = None) -> List[AIModelOutput]:
+        """
+        Materialize AIModelOutput objects for the selected rows
+        """
+        return [AIModelOutput(**prediction) for prediction in self.to_dicts(indices)]
@@ -141,6 +141,12 @@ async def require_user(request: Request) -> User:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
+async def require_admin(request: Request) -> User:
+    user = await require_user(request)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return user
+
 # Logout routes
 @router.post("/logout")
 async def logout(request: Request, response: Response):
@@ -1,26 +1,80 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
-from typing import Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Request, Header, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import asyncio
+import hashlib
+import json
 import logging
 from datetime import datetime
+from pathlib import Path
 import uuid
 
-from services.pcap_analyzer import pcap_analyzer
+from services.admission_control import AdmissionRejected, sync_analysis_admission
+from services.ai_model_service import ai_model_service
+from services.analysis_store import analysis_store
+from services.capture_archive import (
+    ARCHIVE_SUFFIXES, MAX_BATCH_CAPTURES, ArchiveError, capture_name, extract_captures, is_archive, is_capture
+)
+from services.flow_result_store import flow_result_store
+from services.job_queue import FINISHED_STATES, PRIORITY_LARGE, PRIORITY_SMALL, job_queue
+from services.pcap_analyzer import CAPTURE_EXTENSIONS, pcap_analyzer
+from services.upload_spool import (
+    MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES, MultipartUpload, SpooledUpload, UploadError, UploadTooLarge,
+    check_content_length, chunked_upload_manager, spool_stream
+)
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
 
+# Idle event streams send a comment this often so proxies keep them open
+EVENTS_KEEPALIVE_SECONDS = 15.0
+
 router = APIRouter(prefix="/api/pcap", tags=["pcap-analysis"])
 
+# Request body of endpoints that parse their multipart upload themselves
+CAPTURE_FORM_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}}
+                }
+            }
+        }
+    }
+}
+
+BATCH_FORM_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}}
+                }
+            }
+        }
+    }
+}
+
 # Pydantic models for API responses
 class AnalysisStatus(BaseModel):
     analysis_id: str
-    status: str  # "processing", "completed", "failed"
+    status: str  # "queued", "processing", "completed", "failed", "cancelled"
     progress: int  # 0-100
     message: str
     started_at: datetime
     completed_at: Optional[datetime] = None
+    partial_results: Optional[Dict[str, Any]] = None  # Running totals while processing
+    attempts: int = 0  # Runs started, including ones lost to a worker crash
+    stats: Optional[Dict[str, Any]] = None  # bytes/packets read, flows finished and scored, ETA
+    revision: int = 0  # Changes whenever the status does; pass as `since` to long-poll
 
 class AnalysisSummary(BaseModel):
     total_flows: int
@@ -36,6 +90,11 @@ class ThreatInfo(BaseModel):
     threat_types: dict
     top_threats: list
 
+class ChunkedUploadRequest(BaseModel):
+    filename: str
+    total_size: int
+    sha256: Optional[str] = None  # Of the whole file, checked on finalize
+
 class AnalysisResult(BaseModel):
     analysis_id: str
     filename: str
@@ -43,113 +102,139 @@ class AnalysisResult(BaseModel):
     summary: AnalysisSummary
     threats: ThreatInfo
     detailed_results: list
+    top_flows: dict
     statistics: dict
 
-# In-memory storage for analysis status (use database in production)
-analysis_status_store: Dict[str, AnalysisStatus] = {}
-analysis_results_store: Dict[str, Dict[str, Any]] = {}
+def analysis_status(job: Dict[str, Any]) -> AnalysisStatus:
+    """
+    API view of an analysis job
+    """
+    return AnalysisStatus(
+        analysis_id=job["job_id"],
+        status="processing" if job["status"] == "running" else job["status"],
+        progress=job["progress"],
+        message=job["message"],
+        started_at=datetime.utcfromtimestamp(job["created_at"]),
+        completed_at=datetime.utcfromtimestamp(job["finished_at"]) if job["finished_at"] else None,
+        partial_results=job["partial_results"],
+        attempts=job["attempts"],
+        stats=job["stats"],
+        revision=job["revision"]
+    )
 
-async def process_pcap_analysis(file_content: bytes, filename: str, analysis_id: str):
+async def completed_job(analysis_id: str) -> Dict[str, Any]:
     """
-    Background task for processing pcap analysis
+    The analysis' job, if it has finished successfully
+    """
+    job = await analysis_store.get(analysis_id)
+    if job is None or job["status"] != "completed":
+        raise HTTPException(status_code=404, detail="Analysis results not found")
+    return job
+
+async def analysis_results(analysis_id: str) -> Dict[str, Any]:
+    await completed_job(analysis_id)
+    results = await analysis_store.results(analysis_id)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Analysis results not found")
+    return results
+
+async def queue_analysis(analysis_id: str, spooled: SpooledUpload, filename: str, reuse: bool = True) -> Dict[str, str]:
+    """
+    Queue a spooled capture for the analysis workers and build the upload response.
+    Captures small enough for the sync endpoint are picked up first. Unless reuse is off,
+    a capture identical to one already queued, running or analyzed with the active model
+    is not analyzed again: the caller gets the existing analysis instead.
+    """
+    priority = PRIORITY_SMALL if spooled.size <= pcap_analyzer.in_memory_max_bytes else PRIORITY_LARGE
+    loop = asyncio.get_running_loop()
+    job = await loop.run_in_executor(None, lambda: job_queue.enqueue(
+        analysis_id, spooled.path, filename, spooled.size, priority,
+        content_sha256=spooled.sha256,
+        model_version=ai_model_service.registry.active_version(),
+        reuse_existing=reuse
+    ))
+    
+    response = {
+        "analysis_id": job["job_id"],
+        "message": "File uploaded successfully. Analysis started.",
+        "filename": filename,
+        "file_size": str(spooled.size),
+        "sha256": spooled.sha256
+    }
+    if job["job_id"] != analysis_id:
+        # Only the spooled copy is dropped; the existing analysis keeps its own input
+        await pcap_analyzer.cleanup_analysis(analysis_id)
+        if job["status"] == "completed":
+            response["message"] = "Identical capture already analyzed with this model. Returning that analysis."
+        else:
+            response["message"] = "Identical capture is already being analyzed with this model. Following that analysis."
+        response["reused"] = "true"
+    return response
+
+async def open_capture_upload(request: Request) -> Tuple[MultipartUpload, str]:
+    """
+    Read a capture upload's multipart body up to the file's content and validate its filename
     """
     try:
-        # Update status to processing
-        analysis_status_store[analysis_id].status = "processing"
-        analysis_status_store[analysis_id].progress = 10
-        analysis_status_store[analysis_id].message = "Validating file..."
-        
-        # Process the file
-        analysis_status_store[analysis_id].progress = 25
-        analysis_status_store[analysis_id].message = "Extracting flow features..."
-        
-        # Run the actual analysis
-        results = await pcap_analyzer.analyze_pcap_file(file_content, filename, analysis_id)
-        
-        # Store results
-        analysis_results_store[analysis_id] = results
-        
-        # Update status to completed
-        analysis_status_store[analysis_id].status = "completed"
-        analysis_status_store[analysis_id].progress = 100
-        analysis_status_store[analysis_id].message = "Analysis completed successfully"
-        analysis_status_store[analysis_id].completed_at = datetime.utcnow()
-        
-        logger.info(f"Analysis {analysis_id} completed successfully")
-        
-    except Exception as e:
-        logger.error(f"Analysis {analysis_id} failed: {str(e)}")
-        
-        # Update status to failed
-        analysis_status_store[analysis_id].status = "failed"
-        analysis_status_store[analysis_id].progress = 0
-        analysis_status_store[analysis_id].message = f"Analysis failed: {str(e)}"
-        analysis_status_store[analysis_id].completed_at = datetime.utcnow()
-
-@router.post("/upload", response_model=Dict[str, str])
-async def upload_pcap_file(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
-):
+        upload = MultipartUpload(request.stream(), request.headers.get("content-type"))
+        filename = await upload.open()
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Validate file type
+    if not filename:
+        raise HTTPException(status_code=400, detail="No filename provided")
+    
+    valid_extensions = ['.pcap', '.pcapng', '.cap']
+    file_extension = '.' + filename.split('.')[-1].lower()
+    
+    if file_extension not in valid_extensions:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Invalid file type. Supported types: {valid_extensions}"
+        )
+    
+    return upload, filename
+
+@router.post("/upload", response_model=Dict[str, str], openapi_extra=CAPTURE_FORM_OPENAPI)
+async def upload_pcap_file(request: Request, reuse: bool = True):
     """
-    Upload and analyze a pcap/pcapng file
-    Returns analysis_id for tracking progress
+    Upload and analyze a pcap/pcapng file (multipart form field "file")
+    Returns analysis_id for tracking progress (an existing one for a capture
+    already analyzed with the same model, unless reuse=false)
     """
     try:
-        # Validate file type
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="No filename provided")
-        
-        valid_extensions = ['.pcap', '.pcapng', '.cap']
-        file_extension = '.' + file.filename.split('.')[-1].lower()
-        
-        if file_extension not in valid_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Invalid file type. Supported types: {valid_extensions}"
-            )
-        
-        # Check file size (limit to 100MB)
-        file_content = await file.read()
-        max_size = 100 * 1024 * 1024  # 100MB
-        
-        if len(file_content) > max_size:
-            raise HTTPException(
-                status_code=400,
-                detail="File too large. Maximum size is 100MB"
-            )
-        
-        if len(file_content) == 0:
-            raise HTTPException(status_code=400, detail="Empty file")
+        # The body is parsed as it arrives and the file written once, straight
+        # to the analysis directory; a declared size over the limit is refused unread
+        try:
+            check_content_length(request.headers.get("content-length"))
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        upload, filename = await open_capture_upload(request)
         
         # Generate analysis ID
         analysis_id = str(uuid.uuid4())
         
-        # Initialize status tracking
-        analysis_status_store[analysis_id] = AnalysisStatus(
-            analysis_id=analysis_id,
-            status="queued",
-            progress=0,
-            message="File uploaded, queued for analysis",
-            started_at=datetime.utcnow()
-        )
+        # Stream the upload to disk, checking the size limit as it arrives
+        try:
+            spooled = await spool_stream(upload.pieces(), pcap_analyzer.input_path(analysis_id, filename))
+        except (UploadTooLarge, UploadError) as e:
+            await pcap_analyzer.cleanup_analysis(analysis_id)
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception:
+            await pcap_analyzer.cleanup_analysis(analysis_id)
+            raise
         
-        # Start background analysis
-        background_tasks.add_task(
-            process_pcap_analysis, 
-            file_content, 
-            file.filename, 
-            analysis_id
-        )
+        if spooled.size == 0:
+            await pcap_analyzer.cleanup_analysis(analysis_id)
+            raise HTTPException(status_code=400, detail="Empty file")
         
-        logger.info(f"Started analysis {analysis_id} for file: {file.filename}")
+        # Queue the analysis; only the spooled file's path is handed over
+        response = await queue_analysis(analysis_id, spooled, filename, reuse)
         
-        return {
-            "analysis_id": analysis_id,
-            "message": "File uploaded successfully. Analysis started.",
-            "filename": file.filename,
-            "file_size": str(len(file_content))
-        }
+        logger.info(f"Started analysis {response['analysis_id']} for file: {filename}")
+        
+        return response
         
     except HTTPException:
         raise
@@ -157,25 +242,249 @@ async def upload_pcap_file(
         logger.error(f"Upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@router.post("/uploads", response_model=Dict[str, Any])
+async def initiate_chunked_upload(upload: ChunkedUploadRequest):
+    """
+    Start a resumable chunked upload.
+    Send chunks with PUT /uploads/{upload_id}?offset=N, then POST /uploads/{upload_id}/finalize
+    """
+    valid_extensions = ['.pcap', '.pcapng', '.cap']
+    file_extension = Path(upload.filename).suffix.lower()
+    
+    if file_extension not in valid_extensions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Supported types: {valid_extensions}"
+        )
+    
+    try:
+        return await chunked_upload_manager.create(upload.filename, upload.total_size, upload.sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.put("/uploads/{upload_id}", response_model=Dict[str, Any])
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    chunk_sha256: Optional[str] = Header(None, alias="X-Chunk-SHA256")
+):
+    """
+    Upload one chunk (raw request body) at the given byte offset.
+    With X-Chunk-SHA256 the chunk is only accepted if its checksum matches.
+    """
+    try:
+        return await chunked_upload_manager.write_chunk(upload_id, offset, request.stream(), chunk_sha256)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/uploads/{upload_id}", response_model=Dict[str, Any])
+async def get_chunked_upload(upload_id: str):
+    """
+    Get the byte ranges received so far, to resume an interrupted upload
+    """
+    try:
+        return await chunked_upload_manager.status(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+@router.post("/uploads/{upload_id}/finalize", response_model=Dict[str, str])
+async def finalize_chunked_upload(upload_id: str, reuse: bool = True):
+    """
+    Verify the assembled file and start its analysis
+    (or return an existing one for the same capture and model, unless reuse=false)
+    """
+    analysis_id = str(uuid.uuid4())
+    try:
+        upload_status = await chunked_upload_manager.status(upload_id)
+        destination = pcap_analyzer.input_path(analysis_id, upload_status["filename"])
+        spooled = await chunked_upload_manager.finalize(upload_id, destination)
+    except KeyError:
+        # Aborted or expired meanwhile; the analysis directory may already exist
+        await pcap_analyzer.cleanup_analysis(analysis_id)
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadError as e:
+        await pcap_analyzer.cleanup_analysis(analysis_id)
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    response = await queue_analysis(analysis_id, spooled, upload_status["filename"], reuse)
+    logger.info(f"Started analysis {response['analysis_id']} for chunked upload {upload_id}")
+    
+    return response
+
+@router.delete("/uploads/{upload_id}")
+async def abort_chunked_upload(upload_id: str):
+    """
+    Abort a chunked upload and discard the received data
+    """
+    try:
+        await chunked_upload_manager.abort(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    return {"message": f"Upload {upload_id} aborted"}
+
+@router.post("/batch", response_model=Dict[str, str], openapi_extra=BATCH_FORM_OPENAPI)
+async def upload_pcap_batch(request: Request, reuse: bool = True):
+    """
+    Upload several captures, or zip/tar archives of captures, to analyze as one batch
+    (multipart form field "files", repeated). Captures are read in the order they start
+    and flows continuing from one into the next are stitched together; the results hold
+    the combined report plus one per capture under "captures". Returns a single
+    analysis_id for tracking progress.
+    """
+    # The body is parsed as it arrives, each file written straight to the batch directory
+    try:
+        check_content_length(
+            request.headers.get("content-length"), MAX_UPLOAD_BYTES + MAX_BATCH_CAPTURES * MULTIPART_OVERHEAD_BYTES
+        )
+        upload = MultipartUpload(request.stream(), request.headers.get("content-type"), field_name="files")
+    except (UploadTooLarge, UploadError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    analysis_id = str(uuid.uuid4())
+    analysis_dir = pcap_analyzer.temp_dir / analysis_id
+    captures_dir = analysis_dir / "captures"
+    
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, lambda: captures_dir.mkdir(parents=True))
+    taken: set = set()
+    filenames = []
+    digests = []
+    total_size = 0
+    try:
+        while True:
+            filename = await upload.next_file()
+            if filename is None:
+                break
+            if not filename or not (is_capture(filename) or is_archive(filename)):
+                raise UploadError(
+                    f"Invalid file type: {filename}. Supported types: {list(CAPTURE_EXTENSIONS + ARCHIVE_SUFFIXES)}"
+                )
+            if len(filenames) == MAX_BATCH_CAPTURES:
+                raise UploadError(f"Too many files in batch. Maximum is {MAX_BATCH_CAPTURES}")
+            filenames.append(filename)
+            
+            # The size limit applies to the whole batch, after unpacking
+            remaining = MAX_UPLOAD_BYTES - total_size
+            if is_capture(filename):
+                spooled = await spool_stream(upload.pieces(), captures_dir / capture_name(filename, taken), remaining)
+                total_size += spooled.size
+            else:
+                spooled = await spool_stream(upload.pieces(), analysis_dir / f"archive-{len(filenames) - 1}", remaining)
+                captures = await loop.run_in_executor(
+                    None, extract_captures, spooled.path, filename, captures_dir, remaining, taken
+                )
+                await loop.run_in_executor(None, spooled.path.unlink)
+                total_size += sum(path.stat().st_size for path in captures)
+            digests.append(spooled.sha256)
+    except (UploadTooLarge, UploadError, ArchiveError) as e:
+        await pcap_analyzer.cleanup_analysis(analysis_id)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await pcap_analyzer.cleanup_analysis(analysis_id)
+        logger.error(f"Batch upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    if total_size == 0:
+        await pcap_analyzer.cleanup_analysis(analysis_id)
+        raise HTTPException(status_code=400, detail="Empty batch")
+    
+    # The same files uploaded again, in the same order, reuse the analysis
+    batch_sha256 = hashlib.sha256(",".join(digests).encode()).hexdigest()
+    name = filenames[0] if len(filenames) == 1 else f"{filenames[0]} (+{len(filenames) - 1} more)"
+    response = await queue_analysis(
+        analysis_id, SpooledUpload(path=captures_dir, size=total_size, sha256=batch_sha256), name, reuse
+    )
+    response["captures"] = str(len(taken))
+    logger.info(f"Started batch analysis {response['analysis_id']} of {len(taken)} captures: {name}")
+    
+    return response
+
 @router.get("/analysis/{analysis_id}/status", response_model=AnalysisStatus)
-async def get_analysis_status(analysis_id: str):
+async def get_analysis_status(
+    analysis_id: str,
+    since: Optional[int] = None,
+    wait: float = Query(0, ge=0, le=60)
+):
+    """
+    Get the current status of an analysis.
+    Long-poll: with since (the last revision seen) and wait, the response is held
+    until the status changes or wait seconds have passed.
+    """
+    if since is not None and wait > 0:
+        job = await analysis_store.wait_for_change(analysis_id, since, wait)
+    else:
+        job = await analysis_store.get(analysis_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    return analysis_status(job)
+
+@router.get("/analysis/{analysis_id}/events")
+async def stream_analysis_events(
+    analysis_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None)
+):
     """
-    Get the current status of an analysis
+    Server-sent events: the analysis status every time it changes, until it finishes.
+    Each event's id is the status revision, so reconnecting clients resume where they left off.
     """
-    if analysis_id not in analysis_status_store:
+    job = await analysis_store.get(analysis_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
-    return analysis_status_store[analysis_id]
+    async def events():
+        current = job
+        since = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        while True:
+            finished = current["status"] in FINISHED_STATES
+            if current["revision"] != since or finished:
+                since = current["revision"]
+                yield f"id: {since}\ndata: {json.dumps(jsonable_encoder(analysis_status(current)))}\n\n"
+                if finished:
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            if await request.is_disconnected():
+                return
+            current = await analysis_store.wait_for_change(analysis_id, since, EVENTS_KEEPALIVE_SECONDS)
+            if current is None:
+                return  # Deleted
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/analysis/{analysis_id}/cancel", response_model=AnalysisStatus)
+async def cancel_analysis(analysis_id: str):
+    """
+    Cancel a queued or running analysis
+    """
+    job = await analysis_store.cancel(analysis_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    if job["status"] == "cancelled":
+        await pcap_analyzer.cleanup_analysis(analysis_id)
+    
+    return analysis_status(job)
 
 @router.get("/analysis/{analysis_id}/results", response_model=Dict[str, Any])
 async def get_analysis_results(analysis_id: str):
     """
     Get the complete results of an analysis
     """
-    if analysis_id not in analysis_status_store:
+    job = await analysis_store.get(analysis_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
-    status = analysis_status_store[analysis_id]
+    status = analysis_status(job)
     
     if status.status == "processing" or status.status == "queued":
         raise HTTPException(
@@ -189,20 +498,21 @@ async def get_analysis_results(analysis_id: str):
             detail=f"Analysis failed: {status.message}"
         )
     
-    if analysis_id not in analysis_results_store:
+    if status.status == "cancelled":
+        raise HTTPException(status_code=404, detail="Analysis was cancelled")
+    
+    results = await analysis_store.results(analysis_id)
+    if results is None:
         raise HTTPException(status_code=404, detail="Results not found")
     
-    return analysis_results_store[analysis_id]
+    return results
 
 @router.get("/analysis/{analysis_id}/summary", response_model=Dict[str, Any])
 async def get_analysis_summary(analysis_id: str):
     """
     Get a summary of the analysis results
     """
-    if analysis_id not in analysis_results_store:
-        raise HTTPException(status_code=404, detail="Analysis results not found")
-    
-    results = analysis_results_store[analysis_id]
+    results = await analysis_results(analysis_id)
     
     # Return only summary information
     summary = {
@@ -216,28 +526,177 @@ async def get_analysis_summary(analysis_id: str):
             "threat_types": results["threats"]["threat_types"],
             "top_threats": results["threats"]["top_threats"]
         },
+        "top_flows": {
+            "overall": results["top_flows"]["overall"][:10],  # Limit to the 10 riskiest
+            "by_threat_type": {
+                threat_type: flows[:10] for threat_type, flows in results["top_flows"]["by_threat_type"].items()
+            }
+        },
         "statistics": results["statistics"]
     }
     
     return summary
 
+async def read_flow_results(analysis_id: str, read: Callable[[Any], Any]) -> Any:
+    """
+    Open an analysis' stored per-flow results and read them with read(table), off the event loop
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, lambda: read(flow_result_store.open(analysis_id)))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Flow results not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def query_flow_results(analysis_id: str, **query) -> Dict[str, Any]:
+    """
+    Run a query against an analysis' stored per-flow results, off the event loop
+    """
+    return await read_flow_results(analysis_id, lambda table: table.query(**query))
+
+@router.get("/analysis/{analysis_id}/flows", response_model=Dict[str, Any])
+async def get_analysis_flows(
+    analysis_id: str,
+    classification: Optional[str] = None,
+    threat_type: Optional[str] = None,
+    ip: Optional[str] = None,
+    port: Optional[int] = None,
+    protocol: Optional[int] = None,
+    min_risk: Optional[float] = None,
+    sort: str = "risk",
+    cursor: Optional[str] = None,
+    limit: int = 100
+):
+    """
+    Get per-flow results of an analysis, one page at a time.
+    Sort by "risk" (highest first) or "index" (flow order); filter by
+    classification, threat type, IP or port (either endpoint), protocol or minimum risk.
+    Pass next_cursor back as cursor to get the following page.
+    """
+    await completed_job(analysis_id)
+    
+    page = await query_flow_results(
+        analysis_id,
+        classification=classification,
+        threat_type=threat_type,
+        ip=ip,
+        port=port,
+        protocol=protocol,
+        min_risk=min_risk,
+        sort=sort,
+        cursor=cursor,
+        limit=limit
+    )
+    return {"analysis_id": analysis_id, **page}
+
+@router.get("/analysis/{analysis_id}/aggregate", response_model=Dict[str, Any])
+async def aggregate_analysis_flows(
+    analysis_id: str,
+    group_by: List[str] = Query(...),
+    metrics: List[str] = Query(["count"]),
+    sort: Optional[str] = None,
+    limit: int = 100,
+    bucket_seconds: float = 60.0,
+    prefix_length: int = 24,
+    classification: Optional[str] = None,
+    threat_type: Optional[str] = None,
+    ip: Optional[str] = None,
+    port: Optional[int] = None,
+    protocol: Optional[int] = None,
+    min_risk: Optional[float] = None
+):
+    """
+    Aggregate an analysis' flows, e.g. attacks by destination port or bytes per source /24.
+    group_by: src_ip, dst_ip, src_net, dst_net (by prefix_length), src_port, dst_port,
+    protocol, classification, threat_type, time (buckets of bucket_seconds).
+    metrics: count, attacks, bytes, packets, mean_risk, max_risk.
+    Both accept repeated parameters or comma-separated lists; the flow filters also apply.
+    """
+    await completed_job(analysis_id)
+    
+    group_by = [key.strip() for value in group_by for key in value.split(",") if key.strip()]
+    metrics = [metric.strip() for value in metrics for metric in value.split(",") if metric.strip()]
+    
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(None, lambda: flow_result_store.aggregate(
+            analysis_id,
+            group_by,
+            metrics,
+            sort=sort,
+            limit=limit,
+            bucket_seconds=bucket_seconds,
+            prefix_length=prefix_length,
+            classification=classification,
+            threat_type=threat_type,
+            ip=ip,
+            port=port,
+            protocol=protocol,
+            min_risk=min_risk
+        ))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Flow results not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"analysis_id": analysis_id, **result}
+
+@router.get("/analysis/{analysis_id}/hosts", response_model=Dict[str, Any])
+async def get_analysis_hosts(
+    analysis_id: str,
+    ranking: str = "talkers",
+    cursor: Optional[str] = None,
+    limit: int = 100
+):
+    """
+    Get per-host rollups (flows, attacks, bytes, peak risk, distinct peers and ports),
+    as top talkers (by bytes) or top risk (by peak risk score), paginated by cursor
+    """
+    await completed_job(analysis_id)
+    
+    page = await read_flow_results(analysis_id, lambda table: table.hosts(ranking, cursor, limit))
+    return {"analysis_id": analysis_id, **page}
+
+@router.get("/analysis/{analysis_id}/hosts/{ip}", response_model=Dict[str, Any])
+async def get_analysis_host(analysis_id: str, ip: str):
+    """
+    Get the rollup of a single host
+    """
+    await completed_job(analysis_id)
+    
+    host = await read_flow_results(analysis_id, lambda table: table.host(ip))
+    if host is None:
+        raise HTTPException(status_code=404, detail="Host not found in this analysis")
+    
+    return {"analysis_id": analysis_id, **host}
+
 @router.get("/analysis/{analysis_id}/threats", response_model=Dict[str, Any])
-async def get_analysis_threats(analysis_id: str):
+async def get_analysis_threats(analysis_id: str, cursor: Optional[str] = None, limit: int = 100):
     """
-    Get detailed threat information from the analysis
+    Get detailed threat information from the analysis.
+    Malicious flows come from every flow of the analysis, riskiest first, paginated by cursor.
     """
-    if analysis_id not in analysis_results_store:
-        raise HTTPException(status_code=404, detail="Analysis results not found")
+    results = await analysis_results(analysis_id)
     
-    results = analysis_results_store[analysis_id]
+    if not await asyncio.get_running_loop().run_in_executor(None, flow_result_store.exists, analysis_id):
+        # Analyses without stored flow results only have their detailed_results sample
+        return {
+            "analysis_id": analysis_id,
+            "threats": results["threats"],
+            "malicious_flows": [
+                flow for flow in results["detailed_results"]
+                if flow["prediction"]["classification"] == "ATTACK"
+            ],
+            "next_cursor": None
+        }
     
+    page = await query_flow_results(analysis_id, classification="ATTACK", sort="risk", cursor=cursor, limit=limit)
     return {
         "analysis_id": analysis_id,
         "threats": results["threats"],
-        "malicious_flows": [
-            flow for flow in results["detailed_results"]
-            if flow["prediction"]["classification"] == "ATTACK"
-        ]
+        "malicious_flows": page["flows"],
+        "next_cursor": page["next_cursor"]
     }
 
 @router.get("/analysis/list", response_model=Dict[str, Any])
@@ -247,19 +706,11 @@ async def list_analyses(limit: int = 50, offset: int = 0):
     """
     analyses_list = []
     
-    # Get all analyses sorted by start time (most recent first)
-    sorted_analyses = sorted(
-        analysis_status_store.items(),
-        key=lambda x: x[1].started_at,
-        reverse=True
-    )
-    
-    # Apply pagination
-    paginated_analyses = sorted_analyses[offset:offset + limit]
-    
-    for analysis_id, status in paginated_analyses:
+    # Most recent first, one page read from the store's index
+    for job in await analysis_store.list(limit, offset):
+        status = analysis_status(job)
         analysis_info = {
-            "analysis_id": analysis_id,
+            "analysis_id": status.analysis_id,
             "status": status.status,
             "started_at": status.started_at,
             "completed_at": status.completed_at,
@@ -267,20 +718,19 @@ async def list_analyses(limit: int = 50, offset: int = 0):
         }
         
         # Add summary if available
-        if analysis_id in analysis_results_store:
-            results = analysis_results_store[analysis_id]
+        if job["summary"]:
             analysis_info["summary"] = {
-                "filename": results["filename"],
-                "total_flows": results["summary"]["total_flows"],
-                "malicious_flows": results["summary"]["malicious_flows"],
-                "overall_status": results["summary"]["overall_status"]
+                "filename": job["summary"]["filename"],
+                "total_flows": job["summary"]["total_flows"],
+                "malicious_flows": job["summary"]["malicious_flows"],
+                "overall_status": job["summary"]["overall_status"]
             }
         
         analyses_list.append(analysis_info)
     
     return {
         "analyses": analyses_list,
-        "total": len(analysis_status_store),
+        "total": await analysis_store.count(),
         "offset": offset,
         "limit": limit
     }
@@ -290,57 +740,121 @@ async def delete_analysis(analysis_id: str):
     """
     Delete an analysis and its results
     """
-    if analysis_id not in analysis_status_store:
+    # A running analysis is stopped by its worker once the job is gone
+    if not await analysis_store.delete(analysis_id):
         raise HTTPException(status_code=404, detail="Analysis not found")
     
-    # Remove from both stores
-    del analysis_status_store[analysis_id]
-    if analysis_id in analysis_results_store:
-        del analysis_results_store[analysis_id]
+    await pcap_analyzer.cleanup_analysis(analysis_id)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, flow_result_store.delete, analysis_id)
     
     return {"message": f"Analysis {analysis_id} deleted successfully"}
 
-@router.post("/analyze-sync", response_model=Dict[str, Any])
-async def analyze_pcap_sync(file: UploadFile = File(...)):
+@router.get("/analyze-sync/metrics", response_model=Dict[str, Any])
+async def get_sync_admission_metrics():
     """
-    Synchronous analysis endpoint (for smaller files)
-    Returns results immediately without background processing
+    Admission control counters and queue wait / service time percentiles for analyze-sync
     """
+    return sync_analysis_admission.get_stats()
+
+@router.post("/analyze-sync", response_model=Dict[str, Any], openapi_extra=CAPTURE_FORM_OPENAPI)
+async def analyze_pcap_sync(
+    request: Request,
+    overflow: str = Query("reject", pattern="^(reject|queue)$")
+):
+    """
+    Synchronous analysis endpoint (for smaller files, multipart form field "file")
+    Returns results immediately without background processing.
+    Only a few run at once: when they are all busy and the short wait queue is full
+    (or the wait runs out) the request gets a 429 with Retry-After, or with
+    overflow=queue is handed to the job queue instead (202 with the analysis_id).
+    A request that would be refused outright is refused before any of the upload
+    is read; otherwise the upload is read first and a slot is only held while analyzing.
+    """
+    # Size limit for sync analysis (10MB)
+    max_size = 10 * 1024 * 1024
+    too_large = HTTPException(
+        status_code=400,
+        detail="File too large for synchronous analysis. Use async upload endpoint for files > 10MB"
+    )
+    
     try:
-        # Validate file
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="No filename provided")
+        try:
+            check_content_length(request.headers.get("content-length"), max_size)
+        except UploadTooLarge:
+            raise too_large
         
-        valid_extensions = ['.pcap', '.pcapng', '.cap']
-        file_extension = '.' + file.filename.split('.')[-1].lower()
+        try:
+            sync_analysis_admission.check_capacity()
+            rejected = None
+        except AdmissionRejected as e:
+            if overflow != "queue":
+                raise sync_busy(e)
+            rejected = e
         
-        if file_extension not in valid_extensions:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid file type. Supported types: {valid_extensions}"
-            )
+        upload, filename = await open_capture_upload(request)
         
         # Read file content
-        file_content = await file.read()
+        file_content = bytearray()
+        try:
+            async for piece in upload.pieces():
+                file_content += piece
+                if len(file_content) > max_size:
+                    raise too_large
+        except UploadError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Size limit for sync analysis (10MB)
-        max_size = 10 * 1024 * 1024
-        if len(file_content) > max_size:
-            raise HTTPException(
-                status_code=400,
-                detail="File too large for synchronous analysis. Use async upload endpoint for files > 10MB"
-            )
+        if rejected is None:
+            try:
+                async with sync_analysis_admission.admit():
+                    # Perform analysis
+                    return await pcap_analyzer.analyze_pcap_file(bytes(file_content), filename, str(uuid.uuid4()))
+            except AdmissionRejected as e:
+                if overflow != "queue":
+                    raise sync_busy(e)
+                rejected = e
         
-        # Generate analysis ID
-        analysis_id = str(uuid.uuid4())
-        
-        # Perform analysis
-        results = await pcap_analyzer.analyze_pcap_file(file_content, file.filename, analysis_id)
-        
-        return results
+        logger.info(f"Sync analysis not admitted ({rejected.reason}), queueing it")
+        return await queue_overflow(bytes(file_content), filename)
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Sync analysis failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+def sync_busy(rejection: AdmissionRejected) -> HTTPException:
+    """
+    429 for a sync analysis that was not admitted
+    """
+    logger.warning(f"Rejected sync analysis: {rejection.reason}")
+    return HTTPException(
+        status_code=429,
+        detail=f"Server busy ({rejection.reason}). Retry later or use the async upload endpoint",
+        headers={"Retry-After": str(rejection.retry_after)}
+    )
+
+async def queue_overflow(file_content: bytes, filename: str) -> JSONResponse:
+    """
+    Hand a sync analysis that was not admitted to the job queue
+    """
+    analysis_id = str(uuid.uuid4())
+    
+    async def pieces():
+        yield file_content
+    
+    spooled = await spool_stream(pieces(), pcap_analyzer.input_path(analysis_id, filename))
+    if spooled.size == 0:
+        await pcap_analyzer.cleanup_analysis(analysis_id)
+        raise HTTPException(status_code=400, detail="Empty file")
+    
+    response = await queue_analysis(analysis_id, spooled, filename)
+    if not response.get("reused"):
+        response["message"] = "Server busy, analysis queued instead. Check status endpoint."
+    logger.info(f"Queued sync analysis {response['analysis_id']} of {filename} after admission overflow")
+    
+    return JSONResponse(
+        status_code=202,
+        content=response,
+        headers={"Location": f"{router.prefix}/analysis/{response['analysis_id']}/status"}
+    )
@@ -11,6 +11,7 @@ from models.network_models import (
     ScanStatistics, LiveScanUpdate, ScanHistoryItem
 )
 from services.network_scanner import network_scanner
+from services.spool_ingest import spool_ingest_service
 from services.ai_model_service import ai_model_service
 
 router = APIRouter(prefix="/api/scan", tags=["scanning"])
@@ -88,6 +89,13 @@ async def get_scan_status(user: User = Depends(require_user)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/spool/status", response_model=dict)
+async def get_spool_status(user: User = Depends(require_user)):
+    """
+    Get the spool directory ingestion status: current file and offset, counters and lag behind the sensor
+    """
+    return spool_ingest_service.get_status()
+
 @router.get("/results", response_model=List[ScanResult])
 async def get_all_results(user: User = Depends(require_user)):
     """
@@ -1,5 +1,9 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from pydantic import BaseModel
+from typing import Optional
 from models.network_models import MonitoringSettings, SystemStatus
+from models.user_models import User
+from routers.auth_router import require_admin
 from services.ai_model_service import ai_model_service
 import os
 
@@ -8,6 +12,16 @@ router = APIRouter(prefix="/api/settings", tags=["settings"])
 # In-memory settings storage (replace with database in production)
 current_settings = MonitoringSettings()
 
+def get_retention_days() -> int:
+    """
+    Current data retention period, read by the analysis store's retention sweep
+    """
+    return current_settings.data_retention_days
+
+class ModelReloadRequest(BaseModel):
+    version: Optional[str] = None  # Defaults to the registry's active version
+    skip_parity: bool = False  # Swap in even if it disagrees with the served model
+
 @router.get("", response_model=MonitoringSettings)
 async def get_settings():
     """
@@ -58,4 +72,29 @@ async def get_system_status():
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/model", response_model=dict)
+async def get_model_status():
+    """
+    Get the served model version and the versions available in the registry
+    """
+    return ai_model_service.get_model_info()
+
+@router.post("/model/reload", response_model=dict)
+async def reload_model(reload_request: ModelReloadRequest = ModelReloadRequest(), user: User = Depends(require_admin)):
+    """
+    Hot-reload a model version without interrupting in-flight inference (admin role required)
+    """
+    version = reload_request.version
+    if version and version not in ai_model_service.registry.list_versions():
+        raise HTTPException(status_code=404, detail=f"Model version {version} not found")
+    
+    try:
+        report = await ai_model_service.reload_model(version, reload_request.skip_parity)
+        return {
+            "message": f"Model {report['version']} is now active",
+            "reload": report
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Model reload failed: {str(e)}")
@@ -2,6 +2,7 @@ from fastapi import FastAPI, APIRouter
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
 from pathlib import Path
@@ -12,11 +13,15 @@ from datetime import datetime
 
 # Import new routers and services
 from routers.scan_router import router as scan_router
-from routers.settings_router import router as settings_router
+from routers.settings_router import router as settings_router, get_retention_days
 from routers.history_router import router as history_router
 from routers.pcap_router import router as pcap_router
 from routers.auth_router import router as auth_router
 from services.ai_model_service import ai_model_service
+from services.analysis_store import analysis_store
+from services.analysis_worker import analysis_worker_pool
+from services.pcap_analyzer import shutdown_extraction_pool
+from services.spool_ingest import spool_ingest_service
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -93,11 +98,31 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Failed to initialize AI model service: {str(e)}")
     
+    # A model reload is handled by one uvicorn worker; the others pick it up from ACTIVE_VERSION
+    app.state.model_watch_task = asyncio.create_task(ai_model_service.follow_active_version())
+    
+    # PCAP analyses run in dedicated worker processes fed by the job queue,
+    # started by one uvicorn worker only (the others stand by to take over)
+    if not analysis_worker_pool.start():
+        logger.info("Analysis workers run in another process")
+    analysis_worker_pool.start_supervisor()
+    
+    # Finished analyses older than the configured retention period are purged hourly
+    app.state.retention_task = asyncio.create_task(analysis_store.run_retention(get_retention_days))
+    
+    # Rotating sensor captures in ANUBIS_SPOOL_DIR, if set, are analyzed as they are written
+    spool_ingest_service.start()
+    
     logger.info("ANUBIS API server started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down ANUBIS API server...")
+    app.state.retention_task.cancel()
+    app.state.model_watch_task.cancel()
+    await spool_ingest_service.stop()
+    analysis_worker_pool.stop()
+    shutdown_extraction_pool()
     client.close()
     logger.info("ANUBIS API server shutdown complete")
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+from services.latency_histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is not admitted: the wait queue is full, or it waited too long
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Concurrency limit with a small, bounded wait queue for expensive request handlers.
+
+    Up to max_concurrent requests run at once and up to max_queue more wait,
+    each for at most max_wait_seconds; anything beyond that is rejected right
+    away, so overload is answered quickly instead of piling up on the CPU.
+    Rejections carry a retry delay estimated from recent service times.
+    Limits are per process (each uvicorn worker has its own controller).
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait_seconds: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.queue_wait = LatencyHistogram()
+        self.service_time = LatencyHistogram()
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a slot is likely free: mean service time times the queue ahead, per slot
+        """
+        mean_seconds = self.service_time.total_seconds / self.service_time.count if self.service_time.count else 1.0
+        return max(1, math.ceil(mean_seconds * (self.waiting + 1) / self.max_concurrent))
+
+    def check_capacity(self):
+        """
+        Raise AdmissionRejected now if admit would refuse right away (every slot
+        busy and the wait queue full), so a caller can refuse before reading a request body
+        """
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(f"{self.waiting} requests already waiting", self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Hold one of the concurrent slots for the duration of the block.
+        Raises AdmissionRejected if none can be had in time.
+        """
+        queued_at = time.monotonic()
+        self.check_capacity()
+        if not self._slots.locked():
+            # A slot is free and nobody is queued for it: taken without suspending
+            await self._slots.acquire()
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.max_wait_seconds)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise AdmissionRejected(f"no slot free within {self.max_wait_seconds:g}s", self.retry_after())
+            finally:
+                self.waiting -= 1
+
+        started = time.monotonic()
+        self.queue_wait.record(started - queued_at)
+        self.running += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._slots.release()
+            self.service_time.record(time.monotonic() - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "max_wait_seconds": self.max_wait_seconds,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "queue_wait": self.queue_wait.get_stats(),
+            "service_time": self.service_time.get_stats()
+        }
+
+# Global instance for /api/pcap/analyze-sync
+sync_analysis_admission = AdmissionController(
+    "analyze-sync",
+    max_concurrent=int(os.environ.get("ANUBIS_SYNC_MAX_CONCURRENT", 2)),
+    max_queue=int(os.environ.get("ANUBIS_SYNC_MAX_QUEUE", 4)),
+    max_wait_seconds=float(os.environ.get("ANUBIS_SYNC_MAX_WAIT_SECONDS", 5))
+)
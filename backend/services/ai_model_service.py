@@ -1,14 +1,20 @@
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from models.network_models import NetworkFlow, AIModelOutput
+from models.prediction_models import PredictionBatch
+from services.prediction_cache import PredictionCache
+from services.model_registry import ModelRegistry, ModelBundle, smoke_test_bundle
+from services.feature_schema import CICFLOW_FEATURE_COLUMNS, FeaturePlan
+from services.model_mmap import current_rss_bytes
+from services.latency_histogram import BatchLatencyTracker
+from services.threat_rules import ThreatRuleTable, rule_packet_rates
 import asyncio
+import os
+import time
 import numpy as np
 import pandas as pd
 from datetime import datetime
 from pathlib import Path
-import json
-import joblib
-import random
 
 logger = logging.getLogger(__name__)
 
@@ -18,98 +24,183 @@ class AIModelService:
     """
     
     def __init__(self):
-        self.model = None
-        self.scaler = None
-        self.selected_features = None
-        self.is_loaded = False
-        self.model_name = "ANUBIS-NetworkSecurityModel-v0"
+        # All artifacts live in one immutable bundle that is swapped atomically on reload
+        self._bundle: Optional[ModelBundle] = None
         self.model_dir = Path("../backend/models/trained_models")
+        self.registry = ModelRegistry(self.model_dir)
+        self._reload_lock = asyncio.Lock()
+        self.last_reload: Optional[Dict[str, Any]] = None
         
-    async def load_model(self, model_path: str = None):
+        # Optional prediction cache in front of the scaler/model call
+        self.prediction_cache = None
+        if os.environ.get("ANUBIS_PREDICTION_CACHE", "1").lower() not in ("0", "false", "no"):
+            self.prediction_cache = PredictionCache(
+                max_entries=int(os.environ.get("ANUBIS_PREDICTION_CACHE_SIZE", 50000)),
+                ttl_seconds=float(os.environ.get("ANUBIS_PREDICTION_CACHE_TTL", 300)),
+                decimals=int(os.environ.get("ANUBIS_PREDICTION_CACHE_DECIMALS", 3))
+            )
+        
+        # Runtime latency histograms per batch size class
+        self.latency = BatchLatencyTracker()
+        
+        # Minimum share of identical predictions vs. the served model for a reload to go through
+        # (a reload can skip the check explicitly, e.g. for a deliberately different model)
+        self.min_reload_agreement = float(os.environ.get("ANUBIS_MODEL_MIN_AGREEMENT", 0.95))
+        
+        # Threat typing used until a bundle (with its own rule table) is loaded
+        self._default_threat_rules = ThreatRuleTable()
+    
+    @property
+    def bundle(self) -> Optional[ModelBundle]:
+        return self._bundle
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self._bundle is not None
+    
+    @property
+    def model(self):
+        return self._bundle.model if self._bundle else None
+    
+    @property
+    def scaler(self):
+        return self._bundle.scaler if self._bundle else None
+    
+    @property
+    def selected_features(self) -> Optional[List[str]]:
+        return list(self._bundle.selected_features) if self._bundle else None
+    
+    @property
+    def threat_rules(self) -> ThreatRuleTable:
+        return self._bundle.threat_rules if self._bundle else self._default_threat_rules
+    
+    @property
+    def model_version(self) -> Optional[str]:
+        return self._bundle.version if self._bundle else None
+    
+    @property
+    def model_name(self) -> str:
+        if self._bundle:
+            return self._bundle.model_name
+        return f"ANUBIS-NetworkSecurityModel-{self.registry.active_version()}"
+    
+    async def load_model(self, version: str = None):
         """
         Load the trained ANUBIS AI model and scaler
         """
         try:
-            logger.info(f"Loading AI model: {self.model_name}")
-            
-            # Load the trained model
-            model_file = self.model_dir / "ANUBIS_AI_Model_v0.pkl"
-            scaler_file = self.model_dir / "ANUBIS_AI_Scaler.pkl"
-            features_file = self.model_dir / "selected_features.json"
-            
-            if not model_file.exists():
-                raise FileNotFoundError(f"Model file not found: {model_file}")
-            if not scaler_file.exists():
-                raise FileNotFoundError(f"Scaler file not found: {scaler_file}")
-            if not features_file.exists():
-                raise FileNotFoundError(f"Features file not found: {features_file}")
+            await self.reload_model(version)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load AI model: {str(e)}")
+            return False
+    
+    async def reload_model(self, version: str = None, skip_parity: bool = False) -> Dict[str, Any]:
+        """
+        Load a model version in the background, warm it up, smoke-test it
+        against the served model and atomically swap it in.
+        With skip_parity it may disagree with the served model on any share of the test batch.
+        In-flight inference keeps using the bundle it started with.
+        Raises ValueError for another version while ANUBIS_MODEL_VERSION pins one.
+        """
+        pinned_version = self.registry.pinned_version()
+        if pinned_version and version and version != pinned_version:
+            raise ValueError(f"ANUBIS_MODEL_VERSION pins the model to {pinned_version}; unset it to reload {version}")
+        version = version or self.registry.active_version()
+        
+        async with self._reload_lock:
+            logger.info(f"Loading AI model version {version}")
+            loop = asyncio.get_event_loop()
+            
+            # Blocking artifact loading and warm-up run off the event loop
+            candidate = await loop.run_in_executor(None, self.registry.load_bundle, version)
+            report = await loop.run_in_executor(
+                None, smoke_test_bundle, candidate, self._bundle, 256, 0.0 if skip_parity else self.min_reload_agreement
+            )
             
-            # Load model components
-            self.model = joblib.load(model_file)
-            self.scaler = joblib.load(scaler_file)
+            previous_version = self.model_version
+            self._bundle = candidate
             
-            # Load selected features
-            with open(features_file, 'r') as f:
-                self.selected_features = json.load(f)
+            # Cached predictions belong to the previous model
+            if self.prediction_cache is not None:
+                self.prediction_cache.invalidate()
             
-            self.is_loaded = True
+            # Other server processes follow ACTIVE_VERSION (see follow_active_version)
+            if not pinned_version:
+                self.registry.set_active_version(version)
             
-            logger.info(f"AI model loaded successfully with {len(self.selected_features)} features")
-            logger.info(f"Model type: {type(self.model).__name__}")
-            logger.info(f"Scaler type: {type(self.scaler).__name__}")
+            report["previous_version"] = previous_version
+            report["parity_skipped"] = skip_parity
+            report["swapped_at"] = datetime.utcnow().isoformat()
+            self.last_reload = report
             
-            return True
+            logger.info(f"AI model {candidate.model_name} loaded successfully with {len(candidate.selected_features)} features")
+            logger.info(f"Model type: {type(candidate.model).__name__}")
+            logger.info(f"Scaler type: {type(candidate.scaler).__name__}")
             
-        except Exception as e:
-            logger.error(f"Failed to load AI model: {str(e)}")
-            self.is_loaded = False
-            return False
+            return report
     
-    def preprocess_flow_data(self, flow_features: Dict[str, Any]) -> np.ndarray:
+    async def use_version(self, version: str):
+        """
+        Serve a model version in this process only, e.g. in an analysis worker
+        for a job queued under it. Unlike reload_model it does not persist the
+        version as the active one or compare it with the served model (older
+        versions legitimately disagree). Raises if the version cannot be loaded.
+        """
+        async with self._reload_lock:
+            if self.model_version == version:
+                return
+            loop = asyncio.get_event_loop()
+            candidate = await loop.run_in_executor(None, self.registry.load_bundle, version)
+            await loop.run_in_executor(None, smoke_test_bundle, candidate)
+            self._bundle = candidate
+            if self.prediction_cache is not None:
+                self.prediction_cache.invalidate()
+            logger.info(f"Serving AI model {candidate.model_name} in this process")
+    
+    async def follow_active_version(self, interval: float = None):
+        """
+        Serve the version in ACTIVE_VERSION whenever a reload in another
+        server process changes it. That process already ran the parity check,
+        so the new version is loaded and smoke-tested like use_version does.
+        """
+        if interval is None:
+            interval = float(os.environ.get("ANUBIS_MODEL_WATCH_INTERVAL", 5))
+        loop = asyncio.get_event_loop()
+        stamp = await loop.run_in_executor(None, self.registry.active_version_stamp)
+        
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                current_stamp = await loop.run_in_executor(None, self.registry.active_version_stamp)
+                if current_stamp == stamp:
+                    continue
+                stamp = current_stamp
+                version = await loop.run_in_executor(None, self.registry.active_version)
+                if version != self.model_version:
+                    logger.info(f"ACTIVE_VERSION changed to {version}, following")
+                    await self.use_version(version)
+            except Exception as e:
+                logger.error(f"Failed to follow ACTIVE_VERSION: {str(e)}")
+    
+    def preprocess_flow_data(self, flow_features: Dict[str, Any], selected_features: List[str] = None) -> np.ndarray:
         """
         Preprocess flow features for the trained ANUBIS model
         Maps cicflowmeter features to the exact features used in training
         """
-        if not self.selected_features:
+        selected_features = selected_features or self.selected_features
+        if not selected_features:
             raise Exception("Selected features not loaded")
         
         # Create feature mapping from cicflowmeter output to model features
         feature_mapping = {
-            "Destination Port": flow_features.get("Dst Port", 0),
-            "Flow Duration": flow_features.get("Flow Duration", 0),
-            "Fwd Packet Length Min": flow_features.get("Fwd Pkt Len Min", 0),
-            "Bwd Packet Length Max": flow_features.get("Bwd Pkt Len Max", 0),
-            "Bwd Packet Length Min": flow_features.get("Bwd Pkt Len Min", 0),
-            "Bwd Packet Length Mean": flow_features.get("Bwd Pkt Len Mean", 0),
-            "Bwd Packet Length Std": flow_features.get("Bwd Pkt Len Std", 0),
-            "Flow IAT Mean": flow_features.get("Flow IAT Mean", 0),
-            "Flow IAT Std": flow_features.get("Flow IAT Std", 0),
-            "Flow IAT Max": flow_features.get("Flow IAT Max", 0),
-            "Fwd IAT Total": flow_features.get("Fwd IAT Tot", 0),
-            "Fwd IAT Mean": flow_features.get("Fwd IAT Mean", 0),
-            "Fwd IAT Std": flow_features.get("Fwd IAT Std", 0),
-            "Fwd IAT Max": flow_features.get("Fwd IAT Max", 0),
-            "Bwd IAT Std": flow_features.get("Bwd IAT Std", 0),
-            "Bwd IAT Max": flow_features.get("Bwd IAT Max", 0),
-            "Min Packet Length": flow_features.get("Min Pkt Len", 0),
-            "Max Packet Length": flow_features.get("Max Pkt Len", 0),
-            "Packet Length Mean": flow_features.get("Pkt Len Mean", 0),
-            "Packet Length Std": flow_features.get("Pkt Len Std", 0),
-            "Packet Length Variance": flow_features.get("Pkt Len Var", 0),
-            "FIN Flag Count": flow_features.get("FIN Flag Cnt", 0),
-            "PSH Flag Count": flow_features.get("PSH Flag Cnt", 0),
-            "ACK Flag Count": flow_features.get("ACK Flag Cnt", 0),
-            "URG Flag Count": flow_features.get("URG Flag Cnt", 0),
-            "Average Packet Size": flow_features.get("Pkt Size Avg", 0),
-            "Avg Bwd Segment Size": flow_features.get("Bwd Seg Size Avg", 0),
-            "Idle Mean": flow_features.get("Idle Mean", 0),
-            "Idle Max": flow_features.get("Idle Max", 0),
-            "Idle Min": flow_features.get("Idle Min", 0)
+            feature_name: flow_features.get(column, 0)
+            for feature_name, column in CICFLOW_FEATURE_COLUMNS.items()
         }
         
         # Extract features in the correct order
         feature_vector = []
-        for feature_name in self.selected_features:
+        for feature_name in selected_features:
             value = feature_mapping.get(feature_name, 0)
             # Handle NaN and infinite values
             if pd.isna(value) or np.isinf(value):
@@ -158,6 +249,85 @@ class AIModelService:
         
         return features
     
+    def _predict_vectors(self, batch_features: np.ndarray, bundle: ModelBundle) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score a batch of model-input vectors. With a cascade configured, the
+        cheap first stage clears obvious benign rows and only the rest reach
+        the full model.
+        """
+        cascade = bundle.cascade
+        if cascade is None:
+            return self._score_vectors(batch_features, bundle)
+        
+        start_time = time.perf_counter()
+        benign_confidence = cascade.benign_confidence(batch_features)
+        pending = np.isnan(benign_confidence)
+        stage1_seconds = time.perf_counter() - start_time
+        
+        # Cleared rows: BENIGN with the first stage's confidence
+        predictions = np.zeros(len(batch_features), dtype=np.int64)
+        probabilities = np.empty((len(batch_features), 2), dtype=np.float64)
+        probabilities[:, 0] = benign_confidence
+        probabilities[:, 1] = 1.0 - benign_confidence
+        
+        stage2_seconds = 0.0
+        if np.any(pending):
+            start_time = time.perf_counter()
+            full_predictions, full_probabilities = self._score_vectors(batch_features[pending], bundle)
+            stage2_seconds = time.perf_counter() - start_time
+            predictions[pending] = full_predictions
+            probabilities[pending] = full_probabilities[:, :2]
+        
+        cascade.record(len(batch_features), int(len(batch_features) - np.count_nonzero(pending)), stage1_seconds, stage2_seconds)
+        return predictions, probabilities
+    
+    def _score_vectors(self, batch_features: np.ndarray, bundle: ModelBundle) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Run scaler + model over a batch of model-input vectors,
+        serving repeated vectors from the prediction cache when enabled
+        """
+        cache = self.prediction_cache
+        if cache is None:
+            scaled_features = bundle.scaler.transform(batch_features)
+            return bundle.model.predict(scaled_features), bundle.model.predict_proba(scaled_features)
+        
+        # Writes from a bundle that was swapped out mid-call are dropped by the cache
+        generation = cache.generation if bundle is self._bundle else -1
+        keys = cache.make_keys(batch_features)
+        cached = cache.get_many(keys)
+        miss_rows = [i for i, entry in enumerate(cached) if entry is None]
+        
+        predictions = np.empty(len(keys), dtype=np.int64)
+        probabilities = None
+        
+        if miss_rows:
+            # Score each distinct missing vector once, even if repeated within the batch
+            unique_rows = {}
+            for i in miss_rows:
+                unique_rows.setdefault(keys[i], i)
+            unique_keys = list(unique_rows.keys())
+            unique_index = {key: j for j, key in enumerate(unique_keys)}
+            
+            scaled_features = bundle.scaler.transform(batch_features[list(unique_rows.values())])
+            miss_predictions = bundle.model.predict(scaled_features)
+            miss_probabilities = bundle.model.predict_proba(scaled_features)
+            cache.put_many(unique_keys, miss_predictions, miss_probabilities, generation)
+            
+            positions = [unique_index[keys[i]] for i in miss_rows]
+            probabilities = np.empty((len(keys), miss_probabilities.shape[1]), dtype=np.float64)
+            predictions[miss_rows] = miss_predictions[positions]
+            probabilities[miss_rows] = miss_probabilities[positions]
+        
+        for i, entry in enumerate(cached):
+            if entry is None:
+                continue
+            if probabilities is None:
+                probabilities = np.empty((len(keys), len(entry[1])), dtype=np.float64)
+            predictions[i] = entry[0]
+            probabilities[i] = entry[1]
+        
+        return predictions, probabilities
+    
     async def predict_single_flow(self, flow: NetworkFlow) -> AIModelOutput:
         """
         Predict classification for a single network flow using the trained model
@@ -166,48 +336,13 @@ class AIModelService:
             raise Exception("AI model not loaded")
             
         try:
-            # Convert NetworkFlow to cicflowmeter-like features
-            flow_features = self.preprocess_networkflow_data(flow)
-            
-            # Preprocess for model
-            feature_vector = self.preprocess_flow_data(flow_features)
-            
-            # Scale features using trained scaler
-            scaled_features = self.scaler.transform(feature_vector)
-            
-            # Get prediction
-            prediction = self.model.predict(scaled_features)[0]
-            probabilities = self.model.predict_proba(scaled_features)[0]
-            
-            # Get confidence (probability of predicted class)
-            if prediction == 1:  # Attack
-                confidence = probabilities[1]
-                classification = "ATTACK"
-                risk_score = confidence
-                # Determine threat type based on confidence and features
-                threat_type = self._determine_threat_type(flow_features, confidence)
-            else:  # Benign
-                confidence = probabilities[0]
-                classification = "BENIGN"
-                risk_score = 1 - confidence
-                threat_type = None
-            
-            return AIModelOutput(
-                classification=classification,
-                confidence=float(confidence),
-                threat_type=threat_type,
-                risk_score=float(risk_score)
-            )
+            batch = await self.score_flow_batch([flow])
+            return batch.to_outputs()[0]
             
         except Exception as e:
             logger.error(f"AI model prediction failed: {str(e)}")
             # Return safe default
-            return AIModelOutput(
-                classification="BENIGN",
-                confidence=0.5,
-                threat_type=None,
-                risk_score=0.5
-            )
+            return PredictionBatch.fallback(1).to_outputs()[0]
 
     async def predict_flow_features(self, flow_features: Dict[str, Any]) -> AIModelOutput:
         """
@@ -217,65 +352,157 @@ class AIModelService:
             raise Exception("AI model not loaded")
             
         try:
-            # Preprocess features for model
-            feature_vector = self.preprocess_flow_data(flow_features)
-            
-            # Scale features using trained scaler
-            scaled_features = self.scaler.transform(feature_vector)
-            
-            # Get prediction
-            prediction = self.model.predict(scaled_features)[0]
-            probabilities = self.model.predict_proba(scaled_features)[0]
-            
-            # Get confidence and classification
-            if prediction == 1:  # Attack
-                confidence = probabilities[1]
-                classification = "ATTACK"
-                risk_score = confidence
-                threat_type = self._determine_threat_type(flow_features, confidence)
-            else:  # Benign
-                confidence = probabilities[0]
-                classification = "BENIGN"
-                risk_score = 1 - confidence
-                threat_type = None
-            
-            return AIModelOutput(
-                classification=classification,
-                confidence=float(confidence),
-                threat_type=threat_type,
-                risk_score=float(risk_score)
-            )
+            batch = await self.score_feature_batch([flow_features])
+            return batch.to_outputs()[0]
             
         except Exception as e:
             logger.error(f"AI model prediction failed: {str(e)}")
-            return AIModelOutput(
-                classification="BENIGN",
-                confidence=0.5,
-                threat_type=None,
-                risk_score=0.5
-            )
+            return PredictionBatch.fallback(1).to_outputs()[0]
 
     def _determine_threat_type(self, flow_features: Dict[str, Any], confidence: float) -> str:
         """
         Determine threat type based on flow characteristics and confidence
         """
-        dst_port = flow_features.get("Dst Port", 0)
-        packet_rate = flow_features.get("Flow Pkts/s", 0)
-        
-        # Simple heuristic-based threat classification
-        if dst_port in [22, 23]:  # SSH, Telnet
-            return "Brute_Force"
-        elif dst_port in [80, 443, 8080]:  # HTTP/HTTPS
-            if packet_rate > 100:
-                return "DDoS"
-            else:
-                return "Web_Attack"
-        elif dst_port in [135, 139, 445]:  # SMB, NetBIOS
-            return "Lateral_Movement"
-        elif confidence > 0.9:
-            return "High_Confidence_Attack"
-        else:
-            return "Suspicious_Activity"
+        return str(self.threat_rules.classify(
+            [flow_features.get("Dst Port", 0)],
+            [flow_features.get("Flow Pkts/s", 0)],
+            [confidence]
+        )[0])
+    
+    def _build_prediction_batch(
+        self,
+        bundle: ModelBundle,
+        predictions: np.ndarray,
+        probabilities: np.ndarray,
+        dst_ports: np.ndarray,
+        packet_rates: np.ndarray
+    ) -> PredictionBatch:
+        """
+        Derive classification, confidence, risk and threat type for a whole batch at once
+        """
+        is_attack = np.asarray(predictions) == 1
+        confidences = np.where(is_attack, probabilities[:, 1], probabilities[:, 0]).astype(np.float64)
+        risk_scores = np.where(is_attack, confidences, 1 - confidences)
+        threat_codes = bundle.threat_rules.classify_codes(dst_ports, packet_rates, confidences)
+        
+        return PredictionBatch(
+            is_attack=is_attack,
+            confidence=confidences,
+            risk_score=risk_scores,
+            threat_code=np.where(is_attack, threat_codes, -1).astype(np.int16),
+            threat_labels=tuple(bundle.threat_rules.labels)
+        )
+    
+    async def score_flow_batch(self, flows: List[NetworkFlow]) -> PredictionBatch:
+        """
+        Predict classifications for multiple network flows as a columnar PredictionBatch
+        """
+        # One bundle for the whole call, even if a reload swaps it meanwhile
+        bundle = self._bundle
+        if bundle is None:
+            raise Exception("AI model not loaded")
+        
+        if not flows:
+            return PredictionBatch.empty(bundle.threat_rules.labels)
+        
+        start_time = time.perf_counter()
+        
+        # Convert all flows to feature vectors
+        feature_vectors = []
+        for flow in flows:
+            flow_features = self.preprocess_networkflow_data(flow)
+            feature_vector = self.preprocess_flow_data(flow_features, bundle.selected_features)
+            feature_vectors.append(feature_vector[0])  # Remove reshape dimension
+        
+        # Stack into batch
+        batch_features = np.vstack(feature_vectors)
+        
+        # Scale features and get batch predictions (cached for repeated vectors)
+        predictions, probabilities = self._predict_vectors(batch_features, bundle)
+        
+        # Threat typing only needs the destination port; live flows carry no packet rate
+        dst_ports = np.fromiter((flow.dst_port for flow in flows), dtype=np.int64, count=len(flows))
+        packet_rates = np.zeros(len(flows), dtype=np.float64)
+        
+        batch = self._build_prediction_batch(bundle, predictions, probabilities, dst_ports, packet_rates)
+        self.latency.record(len(batch), time.perf_counter() - start_time)
+        return batch
+    
+    async def score_feature_batch(self, features_list: List[Dict[str, Any]]) -> PredictionBatch:
+        """
+        Predict classifications for multiple flow feature dicts as a columnar PredictionBatch (for PCAP analysis)
+        """
+        # One bundle for the whole call, even if a reload swaps it meanwhile
+        bundle = self._bundle
+        if bundle is None:
+            raise Exception("AI model not loaded")
+        
+        if not features_list:
+            return PredictionBatch.empty(bundle.threat_rules.labels)
+        
+        start_time = time.perf_counter()
+        
+        # Convert all feature dicts to vectors
+        feature_vectors = []
+        for flow_features in features_list:
+            feature_vector = self.preprocess_flow_data(flow_features, bundle.selected_features)
+            feature_vectors.append(feature_vector[0])
+        
+        # Stack into batch
+        batch_features = np.vstack(feature_vectors)
+        
+        # Scale features and get batch predictions (cached for repeated vectors)
+        predictions, probabilities = self._predict_vectors(batch_features, bundle)
+        
+        # Columns used by the threat rule table
+        def column(name: str) -> np.ndarray:
+            return np.array([flow_features.get(name, 0) for flow_features in features_list], dtype=np.float64)
+        
+        dst_ports = column("Dst Port")
+        packet_rates = rule_packet_rates(
+            column("Flow Pkts/s"), column("Flow Duration"), column("Tot Fwd Pkts") + column("Tot Bwd Pkts")
+        )
+        
+        batch = self._build_prediction_batch(bundle, predictions, probabilities, dst_ports, packet_rates)
+        self.latency.record(len(batch), time.perf_counter() - start_time)
+        return batch
+    
+    def feature_plan(self, frame_columns: List[str]) -> FeaturePlan:
+        """
+        Validate flow frame columns against the served model's training schema (once per analysis)
+        """
+        bundle = self._bundle
+        if bundle is None:
+            raise Exception("AI model not loaded")
+        return FeaturePlan.build(bundle, frame_columns)
+    
+    def score_feature_frame(self, flow_df: pd.DataFrame, plan: FeaturePlan) -> PredictionBatch:
+        """
+        Score a frame of cicflowmeter flows as a PredictionBatch (blocking, for PCAP analysis).
+        Column selection and sanitizing happen in one pass into the model-input
+        matrix; the trained scaler is the only normalization applied.
+        """
+        bundle = plan.bundle
+        if len(flow_df) == 0:
+            return PredictionBatch.empty(bundle.threat_rules.labels)
+        
+        start_time = time.perf_counter()
+        batch_features = plan.feature_matrix(flow_df)
+        predictions, probabilities = self._predict_vectors(batch_features, bundle)
+        
+        # Columns used by the threat rule table (which handles NaN/inf itself)
+        def column(name: str) -> np.ndarray:
+            if name not in flow_df.columns:
+                return np.zeros(len(flow_df), dtype=np.float64)
+            return flow_df[name].to_numpy(dtype=np.float64, na_value=0.0)
+        
+        packet_rates = rule_packet_rates(
+            column("Flow Pkts/s"), column("Flow Duration"), column("Tot Fwd Pkts") + column("Tot Bwd Pkts")
+        )
+        
+        batch = self._build_prediction_batch(bundle, predictions, probabilities, column("Dst Port"), packet_rates)
+        self.latency.record(len(batch), time.perf_counter() - start_time)
+        return batch
     
     async def predict_batch_flows(self, flows: List[NetworkFlow]) -> List[AIModelOutput]:
         """
@@ -285,61 +512,12 @@ class AIModelService:
             raise Exception("AI model not loaded")
             
         try:
-            # Convert all flows to feature vectors
-            feature_vectors = []
-            for flow in flows:
-                flow_features = self.preprocess_networkflow_data(flow)
-                feature_vector = self.preprocess_flow_data(flow_features)
-                feature_vectors.append(feature_vector[0])  # Remove reshape dimension
-            
-            if not feature_vectors:
-                return []
-            
-            # Stack into batch
-            batch_features = np.vstack(feature_vectors)
-            
-            # Scale features
-            scaled_features = self.scaler.transform(batch_features)
-            
-            # Get batch predictions
-            predictions = self.model.predict(scaled_features)
-            probabilities = self.model.predict_proba(scaled_features)
-            
-            # Convert to AIModelOutput objects
-            results = []
-            for i, (pred, probs) in enumerate(zip(predictions, probabilities)):
-                flow_features = self.preprocess_networkflow_data(flows[i])
-                
-                if pred == 1:  # Attack
-                    confidence = probs[1]
-                    classification = "ATTACK"
-                    risk_score = confidence
-                    threat_type = self._determine_threat_type(flow_features, confidence)
-                else:  # Benign
-                    confidence = probs[0]
-                    classification = "BENIGN"
-                    risk_score = 1 - confidence
-                    threat_type = None
-                
-                results.append(AIModelOutput(
-                    classification=classification,
-                    confidence=float(confidence),
-                    threat_type=threat_type,
-                    risk_score=float(risk_score)
-                ))
-            
-            return results
+            batch = await self.score_flow_batch(flows)
+            return batch.to_outputs()
             
         except Exception as e:
             logger.error(f"Batch prediction failed: {str(e)}")
-            return [
-                AIModelOutput(
-                    classification="BENIGN",
-                    confidence=0.5,
-                    threat_type=None,
-                    risk_score=0.5
-                ) for _ in flows
-            ]
+            return PredictionBatch.fallback(len(flows)).to_outputs()
 
     async def predict_batch_features(self, features_list: List[Dict[str, Any]]) -> List[AIModelOutput]:
         """
@@ -349,78 +527,12 @@ class AIModelService:
             raise Exception("AI model not loaded")
             
         try:
-            if not features_list:
-                return []
-            
-            # Convert all feature dicts to vectors
-            feature_vectors = []
-            for flow_features in features_list:
-                feature_vector = self.preprocess_flow_data(flow_features)
-                feature_vectors.append(feature_vector[0])
-            
-            # Stack into batch
-            batch_features = np.vstack(feature_vectors)
-            
-            # Scale features
-            scaled_features = self.scaler.transform(batch_features)
-            
-            # Get batch predictions
-            predictions = self.model.predict(scaled_features)
-            probabilities = self.model.predict_proba(scaled_features)
-            
-            # Convert to AIModelOutput objects
-            results = []
-            for i, (pred, probs) in enumerate(zip(predictions, probabilities)):
-                if pred == 1:  # Attack
-                    confidence = probs[1]
-                    classification = "ATTACK"
-                    risk_score = confidence
-                    threat_type = self._determine_threat_type(features_list[i], confidence)
-                else:  # Benign
-                    confidence = probs[0]
-                    classification = "BENIGN"
-                    risk_score = 1 - confidence
-                    threat_type = None
-                
-                results.append(AIModelOutput(
-                    classification=classification,
-                    confidence=float(confidence),
-                    threat_type=threat_type,
-                    risk_score=float(risk_score)
-                ))
-            
-            return results
+            batch = await self.score_feature_batch(features_list)
+            return batch.to_outputs()
             
         except Exception as e:
             logger.error(f"Batch features prediction failed: {str(e)}")
-            return [
-                AIModelOutput(
-                    classification="BENIGN",
-                    confidence=0.5,
-                    threat_type=None,
-                    risk_score=0.5
-                ) for _ in features_list
-            ]
-    
-    # def _mock_prediction(self, features: Dict[str, Any]) -> bool:
-    #     """
-    #     Mock prediction logic - REMOVE THIS when integrating real model
-    #     This simulates attack detection based on some heuristics
-    #     """
-    #     # Simple heuristic: certain ports are more likely to be attacks
-    #     suspicious_ports = [22, 23, 135, 139, 445, 1433, 3389, 4444, 5432]
-        
-    #     # Higher chance of attack for suspicious ports
-    #     if features.get('dst_port') in suspicious_ports:
-    #         return random.random() < 0.3  # 30% chance of being classified as attack
-        
-    #     # Lower chance for common ports
-    #     common_ports = [80, 443, 53, 25, 110, 993, 995]
-    #     if features.get('dst_port') in common_ports:
-    #         return random.random() < 0.05  # 5% chance of being classified as attack
-            
-    #     # Default chance for other ports
-    #     return random.random() < 0.15  # 15% chance of being classified as attack
+            return PredictionBatch.fallback(len(features_list)).to_outputs()
     
     def get_model_info(self) -> Dict[str, Any]:
         """
@@ -428,8 +540,19 @@ class AIModelService:
         """
         return {
             "model_name": self.model_name,
+            "version": self.model_version,
+            "loaded_at": self._bundle.loaded_at.isoformat() if self._bundle else None,
+            "storage": self._bundle.storage if self._bundle else None,
+            "load_seconds": self._bundle.load_seconds if self._bundle else None,
+            "process_rss_bytes": current_rss_bytes(),
+            "available_versions": self.registry.list_versions(),
+            "last_reload": self.last_reload,
             "is_loaded": self.is_loaded,
             "status": "Active" if self.is_loaded else "Inactive",
+            "threat_types": self.threat_rules.labels,
+            "prediction_cache": self.prediction_cache.get_stats() if self.prediction_cache is not None else None,
+            "cascade": self._bundle.cascade.get_stats() if self._bundle and self._bundle.cascade else None,
+            "latency_by_batch_size": self.latency.get_stats(),
             "last_updated": datetime.utcnow().isoformat()
         }
 
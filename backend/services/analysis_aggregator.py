@@ -0,0 +1,251 @@
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models.prediction_models import PredictionBatch
+
+# Columns copied into each detailed result row, with their defaults
+DETAIL_COLUMNS = {
+    'src_ip': ('Src IP', 'Unknown', str),
+    'dst_ip': ('Dst IP', 'Unknown', str),
+    'src_port': ('Src Port', 0, int),
+    'dst_port': ('Dst Port', 0, int),
+    'protocol': ('Protocol', 0, int)
+}
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, highest first and ties in index order.
+    Partial selection (np.partition) keeps this O(n); only the k selected
+    rows are sorted.
+    """
+    if k <= 0 or len(scores) == 0:
+        return np.zeros(0, dtype=np.intp)
+    if len(scores) > k:
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > threshold)
+        ties = np.flatnonzero(scores == threshold)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+def format_duration(seconds: float) -> str:
+    """
+    Analysis duration as reported in results, e.g. '< 1 minute' or '3 minutes'
+    """
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return '< 1 minute'
+    return f"{minutes} minute{'s' if minutes > 1 else ''}"
+
+def overall_status(malicious_percentage: float) -> str:
+    """
+    Overall capture status from the share of malicious flows
+    """
+    if malicious_percentage > 20:
+        return "CRITICAL"
+    elif malicious_percentage > 10:
+        return "WARNING"
+    elif malicious_percentage > 5:
+        return "SUSPICIOUS"
+    return "CLEAN"
+
+class AnalysisAggregator:
+    """
+    Running aggregates of a PCAP analysis, updated one scored chunk of flows
+    at a time so results never need every flow in memory at once
+    """
+
+    def __init__(self, detail_limit: int = 100, top_k: int = 50):
+        self.detail_limit = detail_limit
+        self.top_k = top_k
+        self.started_at = time.perf_counter()
+
+        self.total_flows = 0
+        self.malicious_flows = 0
+        self.risk_sum = 0.0
+        self.confidence_sum = 0.0
+        self.chunks = 0
+        self.threat_counts: Counter = Counter()
+        self.malicious_ips: Set[str] = set()
+        self.src_ips: Set[str] = set()
+        self.dst_ips: Set[str] = set()
+        self.detailed_results: List[Dict[str, Any]] = []
+        # Highest-risk flows so far, overall and per threat type, as
+        # (flow index, detail row) so ties keep capture order
+        self._top_flows: List[Tuple[int, Dict[str, Any]]] = []
+        self._top_flows_by_threat: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+
+    @staticmethod
+    def _unique_strings(values: np.ndarray) -> List[str]:
+        return [str(value) for value in pd.unique(values)]
+
+    def update(self, flow_df: pd.DataFrame, predictions: PredictionBatch, first_index: Optional[int] = None):
+        """
+        Fold a chunk of flows and their row-aligned predictions into the aggregates.
+        first_index numbers the chunk's flows in detail rows (default: continuing this aggregator's count).
+        """
+        rows = len(predictions)
+        if rows == 0:
+            return
+
+        is_attack = predictions.is_attack
+        attacks = int(np.count_nonzero(is_attack))
+        first_index = self.total_flows if first_index is None else first_index
+        self._update_top_flows(flow_df, predictions, first_index)
+        self.total_flows += rows
+        self.malicious_flows += attacks
+        self.risk_sum += float(np.sum(predictions.risk_score))
+        self.confidence_sum += float(np.sum(predictions.confidence))
+        self.threat_counts.update(predictions.threat_counts())
+        self.chunks += 1
+
+        ip_columns = [
+            (flow_df[column].to_numpy(), seen)
+            for column, seen in (('Src IP', self.src_ips), ('Dst IP', self.dst_ips))
+            if column in flow_df.columns
+        ]
+        for ips, seen in ip_columns:
+            seen.update(self._unique_strings(ips))
+
+        if attacks and ip_columns:
+            attack_rows = np.flatnonzero(is_attack[:len(flow_df)])
+            endpoints = np.concatenate([ips[attack_rows] for ips, _ in ip_columns])
+            self.malicious_ips.update(self._unique_strings(endpoints))
+            self.malicious_ips.discard('Unknown')
+
+        remaining = self.detail_limit - len(self.detailed_results)
+        if remaining > 0:
+            self.detailed_results.extend(
+                row for _, row in self._detail_rows(flow_df, predictions, np.arange(min(remaining, rows)), first_index)
+            )
+
+    def _update_top_flows(self, flow_df: pd.DataFrame, predictions: PredictionBatch, first_index: int):
+        """
+        Merge the chunk's highest-risk flows into the running top-K lists.
+        Each chunk contributes at most K candidates per list, so detail rows
+        are only built for flows that can still make it.
+        """
+        risk = predictions.risk_score
+        selections = [(None, self._top_flows, top_k_indices(risk, self.top_k))]
+
+        attack_codes = predictions.threat_code[predictions.is_attack & (predictions.threat_code >= 0)]
+        for code in np.unique(attack_codes).tolist():
+            label = predictions.threat_labels[code]
+            rows = np.flatnonzero(predictions.is_attack & (predictions.threat_code == code))
+            selections.append((label, self._top_flows_by_threat.get(label, []), rows[top_k_indices(risk[rows], self.top_k)]))
+
+        candidates = {}
+        for label, current, selected in selections:
+            if len(current) >= self.top_k:
+                # Only rows beating the current K-th flow can enter the list
+                selected = selected[risk[selected] > current[-1][1]['prediction']['risk_score']]
+            candidates[label] = selected
+
+        selected_rows = np.unique(np.concatenate(list(candidates.values())))
+        if len(selected_rows) == 0:
+            return
+        rows_by_index = dict(self._detail_rows(flow_df, predictions, selected_rows, first_index))
+
+        for label, current, _ in selections:
+            merged = current + [
+                (first_index + row, rows_by_index[first_index + row]) for row in candidates[label].tolist()
+            ]
+            merged.sort(key=lambda entry: (-entry[1]['prediction']['risk_score'], entry[0]))
+            if label is None:
+                self._top_flows = merged[:self.top_k]
+            else:
+                self._top_flows_by_threat[label] = merged[:self.top_k]
+
+    @property
+    def top_flows(self) -> List[Dict[str, Any]]:
+        return [row for _, row in self._top_flows]
+
+    @property
+    def top_flows_by_threat(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {label: [row for _, row in flows] for label, flows in self._top_flows_by_threat.items()}
+
+    def _detail_rows(
+        self,
+        flow_df: pd.DataFrame,
+        predictions: PredictionBatch,
+        rows: np.ndarray,
+        first_index: int
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Build (flow index, detailed result row) pairs for the given rows of a chunk starting at flow first_index
+        """
+        columns = [column for column in ('Flow ID',) + tuple(spec[0] for spec in DETAIL_COLUMNS.values()) if column in flow_df.columns]
+        in_frame = rows[rows < len(flow_df)]
+        records = flow_df.iloc[in_frame][columns].to_dict('records')
+        records += [{}] * (len(rows) - len(records))
+
+        return [
+            (first_index + row, {
+                'flow_id': str(record.get('Flow ID', f'Flow_{first_index + row}')),
+                **{key: cast(record.get(column, default)) for key, (column, default, cast) in DETAIL_COLUMNS.items()},
+                'prediction': prediction
+            })
+            for row, record, prediction in zip(rows.tolist(), records, predictions.to_dicts(rows))
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        benign_flows = self.total_flows - self.malicious_flows
+        malicious_percentage = (self.malicious_flows / self.total_flows) * 100 if self.total_flows else 0
+        return {
+            'total_flows': int(self.total_flows),
+            'benign_flows': int(benign_flows),
+            'malicious_flows': int(self.malicious_flows),
+            'benign_percentage': float((benign_flows / self.total_flows) * 100 if self.total_flows else 0),
+            'malicious_percentage': float(malicious_percentage),
+            'overall_status': overall_status(malicious_percentage),
+            'overall_risk_score': float(self.risk_sum / self.total_flows) if self.total_flows else 0.0
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Partial results while the analysis is still running
+        """
+        return {
+            'summary': self.summary(),
+            'threat_types': dict(self.threat_counts),
+            'malicious_ips_count': len(self.malicious_ips),
+            'top_flows': self.top_flows[:10],
+            'chunks_processed': self.chunks
+        }
+
+    def finalize(self, filename: str, analysis_id: str) -> Dict[str, Any]:
+        """
+        Final analysis results
+        """
+        threat_types = {label: int(count) for label, count in self.threat_counts.items()}
+        duration = time.perf_counter() - self.started_at
+
+        return {
+            'analysis_id': analysis_id,
+            'filename': filename,
+            'timestamp': datetime.utcnow().isoformat(),
+            'summary': self.summary(),
+            'threats': {
+                'malicious_ips': list(self.malicious_ips),
+                'threat_types': threat_types,
+                'top_threats': sorted(threat_types.items(), key=lambda x: x[1], reverse=True)[:5]
+            },
+            'detailed_results': self.detailed_results,
+            'top_flows': {
+                'overall': self.top_flows,
+                'by_threat_type': self.top_flows_by_threat
+            },
+            'statistics': {
+                'average_confidence': float(self.confidence_sum / self.total_flows) if self.total_flows else 0.0,
+                'flows_analyzed': int(self.total_flows),
+                'unique_src_ips': len(self.src_ips),
+                'unique_dst_ips': len(self.dst_ips),
+                'analysis_duration': format_duration(duration)
+            }
+        }
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.flow_result_store import flow_result_store
+from services.job_queue import FINISHED_STATES, JobQueue, job_queue
+
+logger = logging.getLogger(__name__)
+
+class AnalysisStore:
+    """
+    Analysis status and results, shared by every API and worker process.
+
+    Rows live in the job queue's database (results zlib-compressed), so they
+    survive restarts and every uvicorn worker sees the same analyses. A small
+    LRU/TTL cache in front keeps hot analyses from being decompressed on
+    every request. Only finished analyses are cached: they no longer change.
+    Other processes can still delete them, so each hit is checked against
+    the row's revision (one primary key read) before it is served.
+    Reads and writes run in a worker thread, off the event loop.
+    Finished analyses older than the retention period are purged together
+    with their stored flow results.
+    """
+
+    def __init__(self, queue: JobQueue, max_entries: int = 32, ttl_seconds: float = 300.0, watch_seconds: float = 0.25):
+        self.queue = queue
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.watch_seconds = watch_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl_seconds and now - entry[0] > self.ttl_seconds):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _store(self, key: Tuple[str, str], value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, analysis_id: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == analysis_id]:
+                del self._entries[key]
+
+    async def _run(self, func: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _validated(self, key: Tuple[str, str]) -> Optional[Any]:
+        """
+        A cached entry, if its analysis still exists at the revision it was cached at
+        """
+        entry = self._cached(key)
+        if entry is None:
+            return None
+        revision, value = entry
+        if await self._run(self.queue.revision, key[0]) != revision:
+            # Deleted or purged (possibly by another process) since it was cached
+            self.evict(key[0])
+            return None
+        return value
+
+    async def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """
+        An analysis' job row (status, progress, summary), or None
+        """
+        job = await self._validated((analysis_id, "job"))
+        if job is None:
+            job = await self._run(self.queue.get, analysis_id)
+            if job is not None and job["status"] in FINISHED_STATES:
+                self._store((analysis_id, "job"), (job["revision"], job))
+        return job
+
+    async def wait_for_change(self, analysis_id: str, since: Optional[int], timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        An analysis' job row once its revision differs from since or it has finished,
+        or as it is when timeout runs out. None if the analysis does not exist (any more).
+        Workers live in other processes, so this watches the (indexed, single-row) database entry.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(analysis_id)
+            remaining = deadline - time.monotonic()
+            if job is None or since is None or job["revision"] != since or job["status"] in FINISHED_STATES or remaining <= 0:
+                return job
+            await asyncio.sleep(min(self.watch_seconds, remaining))
+
+    async def results(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Full results of a completed analysis, or None
+        """
+        results = await self._validated((analysis_id, "results"))
+        if results is None:
+            revision = await self._run(self.queue.revision, analysis_id)
+            results = await self._run(self.queue.results, analysis_id)
+            if results is not None and revision is not None:
+                self._store((analysis_id, "results"), (revision, results))
+        return results
+
+    async def list(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Analyses, most recent first, one page read from the submission time index
+        (the API's started_at)
+        """
+        return await self._run(self.queue.list, limit, offset)
+
+    async def count(self) -> int:
+        return await self._run(self.queue.count)
+
+    async def delete(self, analysis_id: str) -> bool:
+        self.evict(analysis_id)
+        return await self._run(self.queue.delete, analysis_id)
+
+    async def cancel(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        self.evict(analysis_id)
+        return await self._run(self.queue.cancel, analysis_id)
+
+    def apply_retention(self, retention_days: float) -> List[str]:
+        """
+        Drop finished analyses (and their stored flows) older than retention_days.
+        Flow result tables whose analysis no longer exists are removed as well.
+        """
+        if retention_days <= 0:
+            return []
+        cutoff = time.time() - retention_days * 86400
+
+        purged = self.queue.purge_finished(cutoff)
+        for analysis_id in purged:
+            self.evict(analysis_id)
+            flow_result_store.delete(analysis_id)
+
+        for directory in flow_result_store.root.iterdir():
+            if directory.is_dir() and directory.stat().st_mtime < cutoff and self.queue.get(directory.name.lstrip('.').split('.')[0]) is None:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        if purged:
+            logger.info(f"Retention: removed {len(purged)} analyses older than {retention_days} days")
+        return purged
+
+    async def run_retention(self, retention_days: Callable[[], float], interval_seconds: float = 3600.0):
+        """
+        Apply the (possibly changing) retention period periodically, off the event loop
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.apply_retention, retention_days())
+            except Exception as e:
+                logger.warning(f"Retention sweep failed: {str(e)}")
+            await asyncio.sleep(interval_seconds)
+
+# Global instance
+analysis_store = AnalysisStore(
+    job_queue,
+    max_entries=int(os.environ.get("ANUBIS_RESULTS_CACHE_SIZE", 32)),
+    ttl_seconds=float(os.environ.get("ANUBIS_RESULTS_CACHE_TTL", 300)),
+    watch_seconds=float(os.environ.get("ANUBIS_STATUS_WATCH_SECONDS", 0.25))
+)
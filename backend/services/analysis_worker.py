@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import fcntl
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from services.job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+# Worker processes started by the API server (0 = run them separately with python -m services.analysis_worker)
+WORKER_COUNT = int(os.environ.get("ANUBIS_ANALYSIS_WORKERS", 2))
+POLL_SECONDS = float(os.environ.get("ANUBIS_WORKER_POLL_SECONDS", 1.0))
+# How often a running job publishes its progress (the lease is renewed on the same tick)
+PROGRESS_SECONDS = float(os.environ.get("ANUBIS_PROGRESS_SECONDS", 1.0))
+
+class AnalysisWorker:
+    """
+    Runs queued PCAP analyses one at a time in its own process.
+
+    While a job runs, a heartbeat publishes its latest progress about once a
+    second and renews its lease at least every few seconds; the heartbeat
+    also notices cancellation requests and stops the analysis. On shutdown the running job is handed
+    back to the queue.
+    """
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.stopping = False
+        self.current_task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+
+        from services.pcap_analyzer import extraction_pool, shutdown_extraction_pool
+
+        try:
+            await self._ensure_model()
+        except Exception as e:
+            logger.error(f"Failed to load AI model: {str(e)}")
+        # Every job of this worker extracts flows in the same warm pool
+        extraction_pool()
+        logger.info(f"Analysis worker {self.worker_id} started")
+
+        while not self.stopping:
+            await self._cleanup_abandoned(job_queue.requeue_expired())
+            job = job_queue.claim(self.worker_id)
+            if job is None:
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+            await self._run_job(job)
+
+        shutdown_extraction_pool()
+        logger.info(f"Analysis worker {self.worker_id} stopped")
+
+    def stop(self):
+        self.stopping = True
+        if self.current_task:
+            self.current_task.cancel()
+
+    async def _cleanup_abandoned(self, jobs: List[Dict[str, Any]]):
+        from services.pcap_analyzer import pcap_analyzer
+
+        for job in jobs:
+            logger.error(f"Gave up on job {job['job_id']}: {job['message']}")
+            await pcap_analyzer.cleanup_analysis(job["job_id"])
+
+    async def _ensure_model(self, version: Optional[str] = None):
+        """
+        Load the model version a job was queued with (uploads are deduplicated per version),
+        by default the active one, which the API process persists on model swaps.
+        Only this worker's model changes: the active version is left alone.
+        Raises if the version cannot be loaded.
+        """
+        from services.ai_model_service import ai_model_service
+
+        await ai_model_service.use_version(version or ai_model_service.registry.active_version())
+
+    async def _run_job(self, job: Dict[str, Any]):
+        from services.flow_result_store import flow_result_store
+        from services.pcap_analyzer import pcap_analyzer
+
+        job_id = job["job_id"]
+        latest: Dict[str, Any] = {}
+        stop_reason: Optional[str] = None  # None while running or on worker shutdown
+
+        shown_progress = 25
+
+        def report_progress(progress: Dict[str, Any]):
+            nonlocal shown_progress
+            # Flows are scored while the file is still being read, so progress follows the pipeline's position;
+            # the flows still open at the end of the capture are all finished at once, so it can dip there
+            shown_progress = max(shown_progress, 25 + int(70 * progress["fraction_done"]))
+            latest["progress"] = shown_progress
+            latest["stats"] = {key: value for key, value in progress.items() if key != "partial"}
+            eta = progress["eta_seconds"]
+            if not progress["flows_scored"]:
+                position = f"{progress.get('packets_read', 0)} packets read"
+                if "captures_total" in progress:
+                    position = f"capture {progress['capture']} of {progress['captures_total']}, {position}"
+                latest["message"] = f"Extracting flow features ({position})..."
+            elif eta is None:
+                latest["message"] = f"Analyzed {progress['flows_scored']} flows..."
+            else:
+                minutes, seconds = divmod(int(eta), 60)
+                latest["message"] = f"Analyzed {progress['flows_scored']} flows, about {minutes}m {seconds:02d}s left..."
+            if "partial" in progress:
+                latest["partial_results"] = progress["partial"]
+
+        async def heartbeat():
+            nonlocal stop_reason
+            renew_seconds = min(5.0, job_queue.lease_seconds / 3)
+            renewed_at = time.monotonic()
+            while True:
+                await asyncio.sleep(min(PROGRESS_SECONDS, renew_seconds))
+                if not latest and time.monotonic() - renewed_at < renew_seconds:
+                    continue
+                update = dict(latest)
+                latest.clear()
+                if job_queue.heartbeat(job_id, self.worker_id, **update):
+                    renewed_at = time.monotonic()
+                    continue
+                current = job_queue.get(job_id)
+                if current is None or current["cancel_requested"]:
+                    stop_reason = "cancelled"
+                else:
+                    # Lease expired and the job was requeued; it belongs to another worker now
+                    stop_reason = "lost"
+                self.current_task.cancel()
+                return
+
+        logger.info(f"Worker {self.worker_id} running job {job_id} (attempt {job['attempts']})")
+        job_queue.heartbeat(job_id, self.worker_id, progress=25, message="Extracting flow features...")
+        try:
+            await self._ensure_model(job["model_version"])
+        except Exception as e:
+            # Results are stored and reused under the job's version, so no other model may stand in
+            logger.error(f"Analysis {job_id} failed: model {job['model_version']} unavailable: {str(e)}")
+            job_queue.fail(job_id, self.worker_id, f"Model version {job['model_version']} could not be loaded: {str(e)}")
+            await pcap_analyzer.cleanup_analysis(job_id)
+            return
+
+        # Batch uploads are queued as a directory of captures
+        input_path = Path(job["file_path"])
+        analyze = pcap_analyzer.analyze_pcap_batch if input_path.is_dir() else pcap_analyzer.analyze_pcap_path
+        self.current_task = asyncio.create_task(analyze(
+            input_path, job["filename"], job_id, report_progress, store_flows=True
+        ))
+        ticker = asyncio.create_task(heartbeat())
+        try:
+            results = await self.current_task
+            job_queue.complete(job_id, self.worker_id, results)
+            logger.info(f"Analysis {job_id} completed successfully")
+        except asyncio.CancelledError:
+            if stop_reason == "cancelled":
+                # Cancelled or deleted through the API
+                await pcap_analyzer.cleanup_analysis(job_id)
+                await asyncio.get_running_loop().run_in_executor(None, flow_result_store.delete, job_id)
+                job_queue.mark_cancelled(job_id)
+                logger.info(f"Analysis {job_id} cancelled")
+            elif stop_reason == "lost":
+                logger.warning(f"Lost the lease on job {job_id}, stopped working on it")
+            else:
+                # Worker shutting down: the input file is kept for whoever picks the job up next
+                job_queue.release(job_id, self.worker_id)
+                logger.info(f"Analysis {job_id} handed back to the queue")
+        except Exception as e:
+            logger.error(f"Analysis {job_id} failed: {str(e)}")
+            job_queue.fail(job_id, self.worker_id, str(e))
+        finally:
+            ticker.cancel()
+            self.current_task = None
+
+def run_worker_process(worker_id: str):
+    """
+    Entry point of a worker process
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(AnalysisWorker(worker_id).run())
+
+class AnalysisWorkerPool:
+    """
+    Fixed number of worker processes, restarted if they die.
+    With a lock file only one process per host runs the pool: every uvicorn
+    worker calls start(), and the others take over if its owner exits.
+    """
+
+    def __init__(self, workers: int = WORKER_COUNT, lock_file: Optional[Path] = None):
+        self.workers = workers
+        self.lock_file = lock_file
+        self.owner = False
+        self._lock_handle = None
+        self.processes: Dict[str, multiprocessing.Process] = {}
+        # Fresh interpreters: forking the API process would copy its event loop and threads
+        self.context = multiprocessing.get_context("spawn")
+        self._supervisor: Optional[asyncio.Task] = None
+
+    def _start(self, worker_id: str):
+        # Not daemonic: workers run their own process pools for flow extraction
+        process = self.context.Process(target=run_worker_process, args=(worker_id,), name=f"anubis-{worker_id}")
+        process.start()
+        self.processes[worker_id] = process
+
+    def _acquire_lock(self) -> bool:
+        if self.lock_file is None:
+            return True
+        handle = open(self.lock_file, 'w')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._lock_handle = handle
+        return True
+
+    def start(self) -> bool:
+        """
+        Start the worker processes, unless another process already runs them
+        """
+        if not self.workers or self.owner:
+            return self.owner
+        if not self._acquire_lock():
+            return False
+        self.owner = True
+
+        host = socket.gethostname()
+        for index in range(self.workers):
+            self._start(f"{host}-{os.getpid()}-{index}")
+        logger.info(f"Started {self.workers} analysis worker processes")
+        return True
+
+    def restart_dead(self):
+        for worker_id, process in list(self.processes.items()):
+            if not process.is_alive():
+                logger.warning(f"Analysis worker {worker_id} exited with code {process.exitcode}, restarting")
+                self._start(worker_id)
+
+    async def supervise(self, interval: float = 5.0):
+        while True:
+            await asyncio.sleep(interval)
+            if self.owner:
+                self.restart_dead()
+            elif self.start():
+                logger.info("Took over the analysis workers from a process that exited")
+
+    def start_supervisor(self):
+        self._supervisor = asyncio.get_running_loop().create_task(self.supervise())
+
+    def stop(self, timeout: float = 10.0):
+        if self._supervisor:
+            self._supervisor.cancel()
+        for process in self.processes.values():
+            process.terminate()  # SIGTERM: running jobs are handed back to the queue
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+        self.processes.clear()
+        if self._lock_handle:
+            self._lock_handle.close()
+            self._lock_handle = None
+        self.owner = False
+
+# Global instance
+analysis_worker_pool = AnalysisWorkerPool(lock_file=job_queue.db_path.with_suffix(".workers.lock"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run ANUBIS analysis workers")
+    parser.add_argument("--workers", type=int, default=max(WORKER_COUNT, 1), help="Number of worker processes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    pool = AnalysisWorkerPool(args.workers)
+    pool.start()
+
+    stop_requested = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_requested.set())
+
+    while not stop_requested.wait(POLL_SECONDS * 5):
+        pool.restart_dead()
+    pool.stop()
@@ -0,0 +1,104 @@
+import logging
+import os
+import re
+import stat
+import tarfile
+import zipfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, List, Set
+
+from services.pcap_analyzer import CAPTURE_EXTENSIONS
+from services.upload_spool import SPOOL_CHUNK_BYTES, UploadTooLarge, format_size
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Captures taken from one batch upload, across all its archives
+MAX_BATCH_CAPTURES = int(os.environ.get("ANUBIS_BATCH_MAX_CAPTURES", 1000))
+
+class ArchiveError(ValueError):
+    """
+    Raised for archives that cannot be read, or hold no (or too many) captures
+    """
+
+def is_capture(filename: str) -> bool:
+    return Path(filename).suffix.lower() in CAPTURE_EXTENSIONS
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+def capture_name(filename: str, taken: Set[str]) -> str:
+    """
+    Safe, unique file name for a batch member: the base name only, unusual
+    characters replaced, and a counter added if another member has the same name
+    """
+    base = re.sub(r'[^A-Za-z0-9._-]', '_', Path(filename.replace('\\', '/')).name).lstrip('.') or 'capture'
+    stem, suffix = os.path.splitext(base)
+    name, counter = base, 1
+    while name.lower() in taken:
+        counter += 1
+        name = f"{stem}-{counter}{suffix}"
+    taken.add(name.lower())
+    return name
+
+def _copy_member(source: BinaryIO, destination: Path, max_bytes: int) -> int:
+    """
+    Copy an archive member, counting what is actually decompressed rather
+    than trusting the archive's stated sizes
+    """
+    size = 0
+    try:
+        with open(destination, 'wb') as f:
+            for block in iter(lambda: source.read(SPOOL_CHUNK_BYTES), b''):
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Batch too large. Maximum size is {format_size(max_bytes)} unpacked")
+                f.write(block)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+    return size
+
+def extract_captures(archive: Path, filename: str, destination: Path, max_bytes: int, taken: Set[str]) -> List[Path]:
+    """
+    Unpack the capture files of a zip or tar archive (blocking, run in a thread)
+    flat into destination, using at most max_bytes. Directory structure,
+    links, special files and members that are not captures are skipped,
+    so nothing is ever written outside destination.
+    """
+    extracted: List[Path] = []
+    remaining = max_bytes
+
+    def add(member_name: str, source: BinaryIO):
+        nonlocal remaining
+        if len(taken) >= MAX_BATCH_CAPTURES:
+            raise ArchiveError(f"Too many captures in batch. Maximum is {MAX_BATCH_CAPTURES}")
+        path = destination / capture_name(member_name, taken)
+        remaining -= _copy_member(source, path, remaining)
+        extracted.append(path)
+
+    try:
+        if filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(archive) as zip_file:
+                for info in zip_file.infolist():
+                    if info.is_dir() or stat.S_ISLNK(info.external_attr >> 16) or not is_capture(info.filename):
+                        continue
+                    with zip_file.open(info) as source:
+                        add(info.filename, source)
+        else:
+            with tarfile.open(archive, 'r:*') as tar_file:
+                for member in tar_file:
+                    if not member.isfile() or not is_capture(member.name):
+                        continue
+                    with tar_file.extractfile(member) as source:
+                        add(member.name, source)
+    except (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError) as e:
+        raise ArchiveError(f"Could not read archive {filename}: {str(e)}")
+
+    if not extracted:
+        raise ArchiveError(f"No capture files ({', '.join(CAPTURE_EXTENSIONS)}) in archive {filename}")
+
+    logger.info(f"Unpacked {len(extracted)} captures from {filename} ({max_bytes - remaining} bytes)")
+    return extracted
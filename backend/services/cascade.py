@@ -0,0 +1,186 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class CascadeStage:
+    """
+    Cheap first-stage classifier that confidently clears obvious benign flows
+    so only uncertain ones reach the full ANUBIS model.
+
+    Configured from JSON (cascade.json next to the model artifacts):
+    {
+        "rules": [
+            {"ports": [53], "max": {"Flow Duration": 1000000, "Max Packet Length": 512}, "confidence": 0.99}
+        ],
+        "linear": {
+            "features": ["Destination Port", "Flow Duration", "Max Packet Length"],
+            "weights": [0.0001, 0.000001, 0.002],
+            "bias": -6.0,
+            "log_features": true,
+            "clear_threshold": 0.98
+        }
+    }
+
+    A rule clears a flow when its destination port is listed (if "ports" is
+    given) and every feature is within the "min"/"max" bounds. The linear
+    stage is a logistic model over a few raw features; flows whose benign
+    probability reaches clear_threshold are cleared. Anything not cleared by
+    either passes through to the full model.
+    """
+
+    def __init__(self, config: Dict[str, Any], selected_features: Sequence[str]):
+        self.feature_index = {name: i for i, name in enumerate(selected_features)}
+        self.rules = [self._compile_rule(rule) for rule in config.get("rules", [])]
+        self.linear = self._compile_linear(config["linear"]) if config.get("linear") else None
+
+        self._lock = threading.Lock()
+        self.rows_total = 0
+        self.rows_cleared = 0
+        self.stage1_seconds = 0.0
+        self.stage2_rows = 0
+        self.stage2_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config_path: Optional[Path], selected_features: Sequence[str]) -> Optional["CascadeStage"]:
+        """
+        Load a cascade stage from JSON; returns None when no config exists
+        or it is invalid (every flow then goes to the full model)
+        """
+        if config_path is None or not Path(config_path).exists():
+            return None
+
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+
+            stage = cls(config, selected_features)
+        except Exception as e:
+            logger.error(f"Failed to load cascade stage from {config_path}: {str(e)}. Cascade disabled")
+            return None
+
+        logger.info(f"Loaded cascade stage from {config_path} ({len(stage.rules)} rules, linear={stage.linear is not None})")
+        return stage
+
+    def _column(self, feature_name: str) -> int:
+        if feature_name not in self.feature_index:
+            raise ValueError(f"Cascade feature '{feature_name}' is not a model input")
+        return self.feature_index[feature_name]
+
+    def _compile_rule(self, rule: Dict[str, Any]) -> Dict[str, Any]:
+        compiled = {
+            "ports": np.asarray(rule["ports"], dtype=np.float64) if rule.get("ports") is not None else None,
+            "min": [(self._column(name), float(bound)) for name, bound in rule.get("min", {}).items()],
+            "max": [(self._column(name), float(bound)) for name, bound in rule.get("max", {}).items()],
+            "confidence": float(rule.get("confidence", 0.99))
+        }
+        if compiled["ports"] is not None:
+            compiled["port_column"] = self._column("Destination Port")
+        return compiled
+
+    def _compile_linear(self, linear: Dict[str, Any]) -> Dict[str, Any]:
+        if len(linear["features"]) != len(linear["weights"]):
+            raise ValueError("Cascade linear stage needs one weight per feature")
+        return {
+            "columns": np.array([self._column(name) for name in linear["features"]], dtype=np.int64),
+            "weights": np.asarray(linear["weights"], dtype=np.float64),
+            "bias": float(linear.get("bias", 0.0)),
+            "log_features": bool(linear.get("log_features", False)),
+            "clear_threshold": float(linear.get("clear_threshold", 0.98))
+        }
+
+    def benign_confidence(self, batch_features: np.ndarray) -> np.ndarray:
+        """
+        Benign confidence for rows the first stage clears, NaN for rows it passes on
+        """
+        confidence = np.full(len(batch_features), np.nan)
+
+        for rule in self.rules:
+            cleared = np.isnan(confidence)
+            if rule["ports"] is not None:
+                cleared &= np.isin(batch_features[:, rule["port_column"]], rule["ports"])
+            for column, bound in rule["min"]:
+                cleared &= batch_features[:, column] >= bound
+            for column, bound in rule["max"]:
+                cleared &= batch_features[:, column] <= bound
+            confidence[cleared] = rule["confidence"]
+
+        if self.linear is not None:
+            pending = np.isnan(confidence)
+            values = batch_features[pending][:, self.linear["columns"]]
+            if self.linear["log_features"]:
+                values = np.log1p(np.abs(values))
+            logits = values @ self.linear["weights"] + self.linear["bias"]
+            benign_probability = 1.0 - 1.0 / (1.0 + np.exp(-logits))
+            clears = benign_probability >= self.linear["clear_threshold"]
+            confidence[np.flatnonzero(pending)[clears]] = benign_probability[clears]
+
+        return confidence
+
+    def record(self, rows: int, cleared: int, stage1_seconds: float, stage2_seconds: float):
+        with self._lock:
+            self.rows_total += rows
+            self.rows_cleared += cleared
+            self.stage1_seconds += stage1_seconds
+            self.stage2_rows += rows - cleared
+            self.stage2_seconds += stage2_seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Per-stage pass-through rates and latency
+        """
+        return {
+            "rules": len(self.rules),
+            "linear": self.linear is not None,
+            "rows_total": self.rows_total,
+            "stage1_cleared": self.rows_cleared,
+            "stage1_clear_rate": (self.rows_cleared / self.rows_total) if self.rows_total else 0.0,
+            "stage2_pass_through_rate": (self.stage2_rows / self.rows_total) if self.rows_total else 0.0,
+            "stage1_seconds": self.stage1_seconds,
+            "stage2_seconds": self.stage2_seconds,
+            "stage1_us_per_row": (self.stage1_seconds / self.rows_total * 1e6) if self.rows_total else 0.0,
+            "stage2_us_per_row": (self.stage2_seconds / self.stage2_rows * 1e6) if self.stage2_rows else 0.0
+        }
+
+def cascade_parity_report(bundle, batch_features: np.ndarray, labels: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    Compare cascade scoring against running the full model on every row,
+    e.g. over the feature matrix of a labelled capture (labels: 1 = attack).
+    """
+    if bundle.cascade is None:
+        raise ValueError(f"Model {bundle.version} has no cascade configured")
+
+    start_time = time.perf_counter()
+    full_predictions = np.asarray(bundle.model.predict(bundle.scaler.transform(batch_features)))
+    full_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    cleared = ~np.isnan(bundle.cascade.benign_confidence(batch_features))
+    cascade_predictions = np.zeros(len(batch_features), dtype=full_predictions.dtype)
+    if np.any(~cleared):
+        cascade_predictions[~cleared] = bundle.model.predict(bundle.scaler.transform(batch_features[~cleared]))
+    cascade_seconds = time.perf_counter() - start_time
+
+    report = {
+        "rows": int(len(batch_features)),
+        "stage1_clear_rate": float(np.mean(cleared)) if len(cleared) else 0.0,
+        "agreement_with_full_model": float(np.mean(cascade_predictions == full_predictions)) if len(cleared) else 1.0,
+        "attacks_cleared_by_stage1": int(np.count_nonzero(cleared & (full_predictions == 1))),
+        "full_model_seconds": full_seconds,
+        "cascade_seconds": cascade_seconds,
+        "speedup": (full_seconds / cascade_seconds) if cascade_seconds else None
+    }
+
+    if labels is not None:
+        attacks = np.asarray(labels) == 1
+        if np.any(attacks):
+            report["full_model_recall"] = float(np.mean(full_predictions[attacks] == 1))
+            report["cascade_recall"] = float(np.mean(cascade_predictions[attacks] == 1))
+
+    return report
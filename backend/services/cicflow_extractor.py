@@ -1,21 +1,28 @@
 import asyncio
+import io
+import itertools
 import logging
+import mmap
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Iterator, Tuple, Optional, Union
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import multiprocessing
 from functools import partial
 import tempfile
+import threading
 import os
 
 # CICFlowMeter imports
 from cicflowmeter.flow_session import FlowSession, PacketDirection, get_packet_flow_key
-from scapy.all import rdpcap, IP, TCP, UDP
+from scapy.all import rdpcap, PcapReader, IP, TCP, UDP
 from collections import defaultdict
 import time
 
+from services.flow_table import FinishedFlow, PacketRecord, StreamingFlowTable, flow_id
+from services.pcap_buffer import GLOBAL_HEADER_BYTES, iter_buffer_packets, supports_buffer
+
 logger = logging.getLogger(__name__)
 
 class CICFlowExtractor:
@@ -83,7 +90,7 @@ class CICFlowExtractor:
         
         return packets
     
-    async def _group_packets_into_flows(self, packets: List) -> Dict[str, List]:
+    async def _group_packets_into_flows(self, packets: List) -> Dict[str, List[PacketRecord]]:
         """
         Group packets into flows based on 5-tuple
         """
@@ -92,25 +99,10 @@ class CICFlowExtractor:
             
             for packet in packet_batch:
                 try:
-                    if IP in packet:
-                        # Extract 5-tuple
-                        src_ip = packet[IP].src
-                        dst_ip = packet[IP].dst
-                        protocol = packet[IP].proto
-                        
-                        src_port = 0
-                        dst_port = 0
-                        
-                        if TCP in packet:
-                            src_port = packet[TCP].sport
-                            dst_port = packet[TCP].dport
-                        elif UDP in packet:
-                            src_port = packet[UDP].sport
-                            dst_port = packet[UDP].dport
-                        
-                        # Create flow key (bidirectional)
-                        flow_key = self._create_flow_key(src_ip, dst_ip, src_port, dst_port, protocol)
-                        flows[flow_key].append(packet)
+                    parsed = self._packet_record(packet)
+                    if parsed is not None:
+                        flow_key, record = parsed
+                        flows[flow_key].append(record)
                         
                 except Exception as e:
                     logger.debug(f"Error processing packet: {str(e)}")
@@ -132,6 +124,172 @@ class CICFlowExtractor:
         
         return dict(all_flows)
     
+    def _packet_record(self, packet) -> Optional[Tuple[str, PacketRecord]]:
+        """
+        Reduce a packet to its flow key and the compact record used for features
+        """
+        if IP not in packet:
+            return None
+        
+        # Extract 5-tuple
+        src_ip = packet[IP].src
+        dst_ip = packet[IP].dst
+        protocol = packet[IP].proto
+        
+        src_port = 0
+        dst_port = 0
+        flags = 0
+        
+        if TCP in packet:
+            src_port = packet[TCP].sport
+            dst_port = packet[TCP].dport
+            flags = int(packet[TCP].flags)
+        elif UDP in packet:
+            src_port = packet[UDP].sport
+            dst_port = packet[UDP].dport
+        
+        # Create flow key (bidirectional)
+        flow_key = self._create_flow_key(src_ip, dst_ip, src_port, dst_port, protocol)
+        return flow_key, (float(packet.time), len(packet), src_ip, flags)
+    
+    def _iter_packet_records(self, source: Union[Path, memoryview]) -> Iterator[Tuple[int, Optional[Tuple[str, PacketRecord]]]]:
+        """
+        Yield (bytes consumed, (flow_key, record) or None) for every packet of a
+        capture file or an in-memory capture buffer
+        """
+        if isinstance(source, memoryview):
+            if supports_buffer(source):
+                # Decode headers straight from the buffer, no scapy dissection
+                for position, fields in iter_buffer_packets(source):
+                    if fields is None:
+                        yield position, None
+                        continue
+                    src_ip, dst_ip, protocol, src_port, dst_port, flags, timestamp, length = fields
+                    flow_key = self._create_flow_key(src_ip, dst_ip, src_port, dst_port, protocol)
+                    yield position, (flow_key, (timestamp, length, src_ip, flags))
+                return
+            # pcapng and uncommon link types still go through scapy
+            reader = PcapReader(io.BytesIO(source))
+        elif os.path.getsize(source) >= GLOBAL_HEADER_BYTES:
+            # Classic pcap files are memory-mapped and decoded like a buffer: the kernel pages
+            # the file in, and reading stays far ahead of feature extraction
+            with open(source, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    if supports_buffer(view):
+                        records = self._iter_packet_records(view)
+                        try:
+                            yield from records
+                        finally:
+                            # Drops the decoder's views before the mapping is closed
+                            records.close()
+                        return
+                finally:
+                    view.release()
+            reader = PcapReader(str(source))
+        else:
+            reader = PcapReader(str(source))
+        
+        with reader:
+            for packet in reader:
+                try:
+                    parsed = self._packet_record(packet)
+                except Exception as e:
+                    logger.debug(f"Error processing packet: {str(e)}")
+                    parsed = None
+                yield reader.f.tell(), parsed
+    
+    def iter_packet_records_from(
+        self,
+        path: Path,
+        offset: int,
+        max_bytes: int
+    ) -> Iterator[Tuple[int, Optional[Tuple[str, PacketRecord]]]]:
+        """
+        Yield (file offset after the packet, (flow_key, record) or None) for the
+        complete packets of a classic pcap file from offset on, reading at most
+        max_bytes: the part of a capture still being written that is new since
+        the last read. A packet cut off at the end is left for the next read.
+        """
+        with open(path, 'rb') as f:
+            header = f.read(GLOBAL_HEADER_BYTES)
+            if not supports_buffer(memoryview(header)):
+                raise ValueError(f"{path.name} is not a classic pcap capture with a supported link type")
+            offset = max(offset, GLOBAL_HEADER_BYTES)
+            f.seek(offset)
+            data = f.read(max_bytes)
+        
+        # The new packets behind the file's own header decode like a whole capture
+        base = offset - GLOBAL_HEADER_BYTES
+        for position, parsed in self._iter_packet_records(memoryview(header + data)):
+            yield base + position, parsed
+    
+    def capture_start_time(self, source: Union[Path, memoryview], max_packets: int = 1000) -> Optional[float]:
+        """
+        Timestamp of a capture's first IPv4 packet (looking at most max_packets in), or None
+        """
+        records = self._iter_packet_records(source)
+        try:
+            for _, parsed in itertools.islice(records, max_packets):
+                if parsed is not None:
+                    return parsed[1][0]
+        except Exception as e:
+            logger.debug(f"Could not read start time of {source}: {str(e)}")
+        finally:
+            records.close()
+        return None
+    
+    def iter_flow_chunks(
+        self,
+        source: Union[Path, memoryview],
+        chunk_flows: int = 2000,
+        flow_table: StreamingFlowTable = None,
+        flush: bool = True,
+        progress: Dict[str, Any] = None,
+        stop_event: threading.Event = None
+    ) -> Iterator[List[FinishedFlow]]:
+        """
+        Read a capture (file path or in-memory buffer) packet by packet and yield
+        finished flows in chunks (blocking, run in a thread). Pass the same
+        flow_table with flush=False to carry unfinished flows over into the next file.
+        """
+        flow_table = flow_table if flow_table is not None else StreamingFlowTable()
+        pending: List[FinishedFlow] = []
+        total_bytes = len(source) if isinstance(source, memoryview) else os.path.getsize(source)
+        if progress is not None:
+            progress.update({"bytes_total": total_bytes, "bytes_read": 0, "packets_read": 0, "flows_finished": 0})
+        
+        packets_read = 0
+        flows_finished = 0
+        for position, parsed in self._iter_packet_records(source):
+            packets_read += 1
+            if parsed is not None:
+                flow_table.add(*parsed)
+            
+            # Check for finished flows once per batch of packets
+            if packets_read % self.batch_size == 0:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                pending.extend(flow_table.expire())
+                if progress is not None:
+                    progress.update({"bytes_read": position, "packets_read": packets_read})
+                
+                while len(pending) >= chunk_flows:
+                    flows_finished += chunk_flows
+                    if progress is not None:
+                        progress["flows_finished"] = flows_finished
+                    yield pending[:chunk_flows]
+                    pending = pending[chunk_flows:]
+        
+        pending.extend(flow_table.flush() if flush else flow_table.expire())
+        if progress is not None:
+            progress.update({
+                "bytes_read": total_bytes, "packets_read": packets_read, "flows_finished": flows_finished + len(pending)
+            })
+        
+        for i in range(0, len(pending), chunk_flows):
+            yield pending[i:i + chunk_flows]
+    
     def _create_flow_key(self, src_ip: str, dst_ip: str, src_port: int, dst_port: int, protocol: int) -> str:
         """
         Create a bidirectional flow key
@@ -205,9 +363,10 @@ class CICFlowExtractor:
         return chunk_features
     
     @staticmethod
-    def _extract_flow_features(flow_key: str, packets: List) -> Optional[Dict[str, Any]]:
+    def _extract_flow_features(flow_key: str, packets: List[PacketRecord]) -> Optional[Dict[str, Any]]:
         """
-        Extract CICFlowMeter features for a single flow
+        Extract CICFlowMeter features for a single flow from its packet records
+        (timestamp, length, src_ip, tcp_flags)
         """
         if not packets:
             return None
@@ -222,17 +381,17 @@ class CICFlowExtractor:
             src_port, dst_port, protocol = int(src_port), int(dst_port), int(protocol)
             
             # Sort packets by timestamp
-            packets = sorted(packets, key=lambda p: float(p.time))
+            packets = sorted(packets, key=lambda p: p[0])
             
             # Initialize flow statistics
             features = {
-                'Flow ID': flow_key,
+                'Flow ID': flow_id(flow_key, packets[0][0]),
                 'Src IP': src_ip,
                 'Src Port': src_port,
                 'Dst IP': dst_ip,
                 'Dst Port': dst_port,
                 'Protocol': protocol,
-                'Timestamp': packets[0].time if packets else 0
+                'Timestamp': packets[0][0] if packets else 0
             }
             
             # Extract basic flow features
@@ -240,28 +399,24 @@ class CICFlowExtractor:
             bwd_packets = []
             
             # Determine flow direction
-            first_packet = packets[0]
-            if IP in first_packet:
-                flow_src_ip = first_packet[IP].src
-                
-                for packet in packets:
-                    if IP in packet:
-                        if packet[IP].src == flow_src_ip:
-                            fwd_packets.append(packet)
-                        else:
-                            bwd_packets.append(packet)
+            flow_src_ip = packets[0][2]
+            for packet in packets:
+                if packet[2] == flow_src_ip:
+                    fwd_packets.append(packet)
+                else:
+                    bwd_packets.append(packet)
             
             # Calculate flow duration
             if len(packets) > 1:
-                flow_duration = float(packets[-1].time) - float(packets[0].time)
+                flow_duration = packets[-1][0] - packets[0][0]
             else:
                 flow_duration = 0.0
             
             features['Flow Duration'] = flow_duration * 1_000_000  # Convert to microseconds
             
             # Extract packet length features
-            fwd_lengths = [len(p) for p in fwd_packets]
-            bwd_lengths = [len(p) for p in bwd_packets]
+            fwd_lengths = [p[1] for p in fwd_packets]
+            bwd_lengths = [p[1] for p in bwd_packets]
             all_lengths = fwd_lengths + bwd_lengths
             
             # Forward packet features
@@ -299,7 +454,7 @@ class CICFlowExtractor:
             if len(packets) > 1:
                 iat_times = []
                 for i in range(1, len(packets)):
-                    iat = (float(packets[i].time) - float(packets[i-1].time)) * 1_000_000
+                    iat = (packets[i][0] - packets[i-1][0]) * 1_000_000
                     iat_times.append(iat)
                 
                 features['Flow IAT Mean'] = np.mean(iat_times) if iat_times else 0
@@ -316,7 +471,7 @@ class CICFlowExtractor:
             if len(fwd_packets) > 1:
                 fwd_iat = []
                 for i in range(1, len(fwd_packets)):
-                    iat = (float(fwd_packets[i].time) - float(fwd_packets[i-1].time)) * 1_000_000
+                    iat = (fwd_packets[i][0] - fwd_packets[i-1][0]) * 1_000_000
                     fwd_iat.append(iat)
                 
                 features['Fwd IAT Tot'] = sum(fwd_iat)
@@ -334,7 +489,7 @@ class CICFlowExtractor:
             if len(bwd_packets) > 1:
                 bwd_iat = []
                 for i in range(1, len(bwd_packets)):
-                    iat = (float(bwd_packets[i].time) - float(bwd_packets[i-1].time)) * 1_000_000
+                    iat = (bwd_packets[i][0] - bwd_packets[i-1][0]) * 1_000_000
                     bwd_iat.append(iat)
                 
                 features['Bwd IAT Tot'] = sum(bwd_iat)
@@ -351,16 +506,15 @@ class CICFlowExtractor:
             # TCP Flags (if TCP packets)
             tcp_flags = {'FIN': 0, 'PSH': 0, 'ACK': 0, 'URG': 0}
             for packet in packets:
-                if TCP in packet:
-                    tcp_layer = packet[TCP]
-                    if tcp_layer.flags & 0x01:  # FIN
-                        tcp_flags['FIN'] += 1
-                    if tcp_layer.flags & 0x08:  # PSH
-                        tcp_flags['PSH'] += 1
-                    if tcp_layer.flags & 0x10:  # ACK
-                        tcp_flags['ACK'] += 1
-                    if tcp_layer.flags & 0x20:  # URG
-                        tcp_flags['URG'] += 1
+                flags = packet[3]
+                if flags & 0x01:  # FIN
+                    tcp_flags['FIN'] += 1
+                if flags & 0x08:  # PSH
+                    tcp_flags['PSH'] += 1
+                if flags & 0x10:  # ACK
+                    tcp_flags['ACK'] += 1
+                if flags & 0x20:  # URG
+                    tcp_flags['URG'] += 1
             
             features.update({
                 'FIN Flag Cnt': tcp_flags['FIN'],
@@ -0,0 +1,91 @@
+import logging
+from dataclasses import dataclass
+from typing import Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.model_registry import ModelBundle
+
+logger = logging.getLogger(__name__)
+
+# Training feature name -> column produced by cicflow_extractor
+CICFLOW_FEATURE_COLUMNS = {
+    "Destination Port": "Dst Port",
+    "Flow Duration": "Flow Duration",
+    "Fwd Packet Length Min": "Fwd Pkt Len Min",
+    "Bwd Packet Length Max": "Bwd Pkt Len Max",
+    "Bwd Packet Length Min": "Bwd Pkt Len Min",
+    "Bwd Packet Length Mean": "Bwd Pkt Len Mean",
+    "Bwd Packet Length Std": "Bwd Pkt Len Std",
+    "Flow IAT Mean": "Flow IAT Mean",
+    "Flow IAT Std": "Flow IAT Std",
+    "Flow IAT Max": "Flow IAT Max",
+    "Fwd IAT Total": "Fwd IAT Tot",
+    "Fwd IAT Mean": "Fwd IAT Mean",
+    "Fwd IAT Std": "Fwd IAT Std",
+    "Fwd IAT Max": "Fwd IAT Max",
+    "Bwd IAT Std": "Bwd IAT Std",
+    "Bwd IAT Max": "Bwd IAT Max",
+    "Min Packet Length": "Min Pkt Len",
+    "Max Packet Length": "Max Pkt Len",
+    "Packet Length Mean": "Pkt Len Mean",
+    "Packet Length Std": "Pkt Len Std",
+    "Packet Length Variance": "Pkt Len Var",
+    "FIN Flag Count": "FIN Flag Cnt",
+    "PSH Flag Count": "PSH Flag Cnt",
+    "ACK Flag Count": "ACK Flag Cnt",
+    "URG Flag Count": "URG Flag Cnt",
+    "Average Packet Size": "Pkt Size Avg",
+    "Avg Bwd Segment Size": "Bwd Seg Size Avg",
+    "Idle Mean": "Idle Mean",
+    "Idle Max": "Idle Max",
+    "Idle Min": "Idle Min"
+}
+
+@dataclass(frozen=True)
+class FeaturePlan:
+    """
+    Mapping of flow frame columns onto a model's training features, validated
+    once per analysis and then applied to every chunk. Holds the bundle it was
+    built for, so one analysis is scored by one model even across a reload.
+    """
+    bundle: ModelBundle
+    columns: Tuple[Tuple[int, str], ...]  # (model feature index, frame column)
+    missing: Tuple[str, ...]
+
+    @classmethod
+    def build(cls, bundle: ModelBundle, frame_columns: Iterable[str]) -> "FeaturePlan":
+        """
+        Validate the frame's columns against the training schema
+        """
+        available = set(frame_columns)
+        columns, missing = [], []
+        for index, feature_name in enumerate(bundle.selected_features):
+            # Frames that already use the training names (e.g. CIC-IDS CSVs) map directly
+            column = CICFLOW_FEATURE_COLUMNS.get(feature_name, feature_name)
+            if column not in available and feature_name in available:
+                column = feature_name
+            if column in available:
+                columns.append((index, column))
+            else:
+                missing.append(feature_name)
+
+        if not columns:
+            raise ValueError("None of the model's features are present in the flow data")
+        if missing:
+            logger.warning(f"{len(missing)} model features missing from flow data, using 0: {missing}")
+
+        return cls(bundle=bundle, columns=tuple(columns), missing=tuple(missing))
+
+    def feature_matrix(self, frame: pd.DataFrame) -> np.ndarray:
+        """
+        Raw model-input matrix in training feature order, with NaN/inf set to 0.
+        Each column is written once into a preallocated array; the trained
+        scaler is applied by the scoring path.
+        """
+        matrix = np.zeros((len(frame), len(self.bundle.selected_features)), dtype=np.float64)
+        for index, column in self.columns:
+            matrix[:, index] = frame[column].to_numpy(dtype=np.float64, na_value=0.0)
+        matrix[~np.isfinite(matrix)] = 0.0
+        return matrix
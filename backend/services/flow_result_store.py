@@ -0,0 +1,713 @@
+import ipaddress
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models.prediction_models import PredictionBatch
+from services.analysis_aggregator import top_k_indices
+from services.flow_table import flow_id
+
+logger = logging.getLogger(__name__)
+
+# Per-flow result columns and their on-disk dtypes. IPs are codes into the
+# analysis' IP table and threat codes index its label table (-1 for benign).
+FLOW_COLUMNS = {
+    'src_ip': np.int32,
+    'dst_ip': np.int32,
+    'src_port': np.uint16,
+    'dst_port': np.uint16,
+    'protocol': np.uint8,
+    'timestamp': np.float64,  # Flow start, epoch seconds (NaN if unknown)
+    'bytes': np.int64,
+    'packets': np.int64,
+    'is_attack': np.bool_,
+    'confidence': np.float64,
+    'risk_score': np.float64,
+    'threat_code': np.int16
+}
+
+# Flow frame column -> result column, for the plain numeric columns
+FRAME_COLUMNS = {
+    'src_port': 'Src Port',
+    'dst_port': 'Dst Port',
+    'protocol': 'Protocol'
+}
+
+SORT_ORDERS = ('risk', 'index')
+MAX_PAGE_SIZE = 1000
+
+# Aggregation query vocabulary
+GROUP_KEYS = (
+    'src_ip', 'dst_ip', 'src_net', 'dst_net', 'src_port', 'dst_port',
+    'protocol', 'classification', 'threat_type', 'time'
+)
+METRICS = ('count', 'attacks', 'bytes', 'packets', 'mean_risk', 'max_risk')
+MAX_GROUPS = 10000
+
+# Per-host rollup columns, one row per entry of the IP table
+HOST_COLUMNS = {
+    'flows': np.int64,
+    'attacks': np.int64,
+    'bytes': np.int64,
+    'packets': np.int64,
+    'max_risk': np.float64,
+    'mean_risk': np.float64,
+    'peers': np.int64,       # Distinct other endpoints
+    'peer_ports': np.int64,  # Distinct ports on the other end of its flows
+    'first_seen': np.float64,
+    'last_seen': np.float64
+}
+
+# Host ranking -> sort keys, most significant first (all descending)
+HOST_RANKINGS = {
+    'talkers': ('bytes', 'flows'),
+    'risk': ('max_risk', 'attacks')
+}
+
+def _frame_column(flow_df: pd.DataFrame, column: str) -> np.ndarray:
+    if column not in flow_df.columns:
+        return np.zeros(len(flow_df))
+    return pd.to_numeric(flow_df[column], errors='coerce').fillna(0).to_numpy()
+
+def _frame_timestamps(flow_df: pd.DataFrame) -> np.ndarray:
+    """
+    Flow start times as epoch seconds; the extractor emits epoch floats,
+    other sources (e.g. the mock flows) emit CICFlowMeter-style date strings
+    """
+    if 'Timestamp' not in flow_df.columns:
+        return np.full(len(flow_df), np.nan)
+    timestamps = flow_df['Timestamp']
+    if pd.api.types.is_numeric_dtype(timestamps):
+        return timestamps.to_numpy(dtype=np.float64)
+    parsed = pd.to_datetime(timestamps, format='%d/%m/%Y %H:%M:%S', errors='coerce')
+    seconds = (parsed - pd.Timestamp(0)) / pd.Timedelta(seconds=1)
+    return seconds.to_numpy(dtype=np.float64, na_value=np.nan)
+
+def host_rollup(columns: Dict[str, np.ndarray], hosts: int) -> Dict[str, np.ndarray]:
+    """
+    Per-host totals over every flow, in one vectorized pass: each flow counts
+    towards both of its endpoints (once if they are the same host)
+    """
+    src, dst = np.asarray(columns['src_ip']), np.asarray(columns['dst_ip'])
+    other_end = np.flatnonzero(src != dst)
+    host = np.concatenate([src, dst[other_end]]).astype(np.int64)
+    peer = np.concatenate([dst, src[other_end]]).astype(np.int64)
+    peer_port = np.concatenate([columns['dst_port'], np.asarray(columns['src_port'])[other_end]]).astype(np.int64)
+    rows = np.concatenate([np.arange(len(src)), other_end])
+
+    def per_host(name: str) -> np.ndarray:
+        return np.bincount(host, weights=np.asarray(columns[name])[rows], minlength=hosts)
+
+    flows = np.bincount(host, minlength=hosts)
+    risk = np.asarray(columns['risk_score'])[rows]
+    timestamps = np.asarray(columns['timestamp'])[rows]
+    max_risk = np.zeros(hosts)
+    np.maximum.at(max_risk, host, risk)
+    first_seen, last_seen = np.full(hosts, np.inf), np.full(hosts, -np.inf)
+    np.fmin.at(first_seen, host, timestamps)
+    np.fmax.at(last_seen, host, timestamps)
+
+    return {
+        'flows': flows,
+        'attacks': per_host('is_attack'),
+        'bytes': per_host('bytes'),
+        'packets': per_host('packets'),
+        'max_risk': max_risk,
+        'mean_risk': np.bincount(host, weights=risk, minlength=hosts) / np.maximum(flows, 1),
+        'peers': np.bincount(np.unique(host * hosts + peer) // hosts, minlength=hosts),
+        'peer_ports': np.bincount(np.unique(host * 65536 + peer_port) // 65536, minlength=hosts),
+        'first_seen': np.where(np.isfinite(first_seen), first_seen, np.nan),
+        'last_seen': np.where(np.isfinite(last_seen), last_seen, np.nan)
+    }
+
+class FlowResultWriter:
+    """
+    Appends scored chunks of one analysis to per-column files as they come
+    out of the pipeline. Nothing is readable until close(), which writes the
+    manifest, the risk sort index and the per-host rollup, and moves the
+    directory into place.
+    """
+
+    def __init__(self, directory: Path, partial_directory: Path):
+        self.directory = directory
+        self.partial_directory = partial_directory
+        self.partial_directory.mkdir(parents=True, exist_ok=True)
+        self.files = {name: open(partial_directory / f"{name}.bin", 'wb') for name in FLOW_COLUMNS}
+        self.rows = 0
+        self.ips: List[str] = []
+        self.ip_codes: Dict[str, int] = {}
+        self.threat_labels: List[str] = []
+
+    def _ip_codes(self, flow_df: pd.DataFrame, column: str) -> np.ndarray:
+        if column not in flow_df.columns:
+            values = np.full(len(flow_df), 'Unknown', dtype=object)
+        else:
+            values = flow_df[column].astype(str).to_numpy()
+        local_codes, uniques = pd.factorize(values)
+        for ip in uniques:
+            if ip not in self.ip_codes:
+                self.ip_codes[ip] = len(self.ips)
+                self.ips.append(ip)
+        return np.array([self.ip_codes[ip] for ip in uniques], dtype=np.int32)[local_codes]
+
+    def _threat_codes(self, predictions: PredictionBatch) -> np.ndarray:
+        for label in predictions.threat_labels:
+            if label not in self.threat_labels:
+                self.threat_labels.append(label)
+        # Extra trailing -1 entry maps benign rows (code -1) to -1
+        remap = np.array(
+            [self.threat_labels.index(label) for label in predictions.threat_labels] + [-1], dtype=np.int16
+        )
+        return remap[predictions.threat_code]
+
+    def append(self, flow_df: pd.DataFrame, predictions: PredictionBatch):
+        """
+        Write a chunk of flows and their row-aligned predictions
+        """
+        rows = len(predictions)
+        if rows == 0:
+            return
+        flow_df = flow_df.iloc[:rows]
+
+        columns = {
+            'src_ip': self._ip_codes(flow_df, 'Src IP'),
+            'dst_ip': self._ip_codes(flow_df, 'Dst IP'),
+            **{name: _frame_column(flow_df, column) for name, column in FRAME_COLUMNS.items()},
+            'timestamp': _frame_timestamps(flow_df),
+            'bytes': _frame_column(flow_df, 'TotLen Fwd Pkts') + _frame_column(flow_df, 'TotLen Bwd Pkts'),
+            'packets': _frame_column(flow_df, 'Tot Fwd Pkts') + _frame_column(flow_df, 'Tot Bwd Pkts'),
+            'is_attack': predictions.is_attack,
+            'confidence': predictions.confidence,
+            'risk_score': predictions.risk_score,
+            'threat_code': self._threat_codes(predictions)
+        }
+        for name, dtype in FLOW_COLUMNS.items():
+            values = np.asarray(columns[name])
+            if len(values) < rows:  # Mock predictions can outnumber a short frame
+                values = np.concatenate([values, np.zeros(rows - len(values), dtype=values.dtype)])
+            self.files[name].write(values.astype(dtype, copy=False).tobytes())
+        self.rows += rows
+
+    def close(self):
+        """
+        Finish the analysis' result table and make it readable
+        """
+        for f in self.files.values():
+            f.close()
+
+        risk = np.fromfile(self.partial_directory / "risk_score.bin", dtype=FLOW_COLUMNS['risk_score'])
+        # Highest risk first, ties in flow order
+        np.argsort(-risk, kind='stable').astype(np.int64).tofile(self.partial_directory / "order_risk.bin")
+
+        if self.rows:
+            columns = {
+                name: np.memmap(self.partial_directory / f"{name}.bin", dtype=dtype, mode='r')
+                for name, dtype in FLOW_COLUMNS.items()
+            }
+            hosts = host_rollup(columns, len(self.ips))
+            del columns
+        else:
+            hosts = {name: np.zeros(0) for name in HOST_COLUMNS}
+        for name, dtype in HOST_COLUMNS.items():
+            hosts[name].astype(dtype).tofile(self.partial_directory / f"host_{name}.bin")
+        for ranking, keys in HOST_RANKINGS.items():
+            # Highest first, ties in IP table order
+            order = np.lexsort([np.arange(len(self.ips))] + [-hosts[key] for key in reversed(keys)])
+            order.astype(np.int64).tofile(self.partial_directory / f"order_hosts_{ranking}.bin")
+
+        manifest = {
+            'rows': self.rows,
+            'columns': {name: np.dtype(dtype).str for name, dtype in FLOW_COLUMNS.items()},
+            'ips': self.ips,
+            'threat_labels': self.threat_labels,
+            'host_columns': {name: np.dtype(dtype).str for name, dtype in HOST_COLUMNS.items()},
+            'created_at': time.time()
+        }
+        with open(self.partial_directory / "manifest.json", 'w') as f:
+            json.dump(manifest, f)
+
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        os.replace(self.partial_directory, self.directory)
+        logger.info(f"Stored {self.rows} flow results in {self.directory}")
+
+    def abort(self):
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.partial_directory, ignore_errors=True)
+
+class FlowResultTable:
+    """
+    Read-only view of one analysis' per-flow results. Columns are memory
+    mapped, so a page of results only touches the rows it returns.
+    """
+
+    def __init__(self, directory: Path):
+        with open(directory / "manifest.json", 'r') as f:
+            manifest = json.load(f)
+
+        self.rows: int = manifest['rows']
+        self.ips: List[str] = manifest['ips']
+        self.threat_labels: Tuple[str, ...] = tuple(manifest['threat_labels'])
+        self.columns = {
+            name: self._map(directory / f"{name}.bin", np.dtype(dtype))
+            for name, dtype in manifest['columns'].items()
+        }
+        self.risk_order = self._map(directory / "order_risk.bin", np.dtype(np.int64))
+        self.host_columns = {
+            name: self._map(directory / f"host_{name}.bin", np.dtype(dtype), len(self.ips))
+            for name, dtype in manifest['host_columns'].items()
+        }
+        self.host_orders = {
+            ranking: self._map(directory / f"order_hosts_{ranking}.bin", np.dtype(np.int64), len(self.ips))
+            for ranking in HOST_RANKINGS
+        }
+        self._ip_index: Optional[Dict[str, int]] = None
+        self._network_cache: Dict[int, Tuple[np.ndarray, List[str]]] = {}
+
+    def _map(self, path: Path, dtype: np.dtype, length: Optional[int] = None) -> np.ndarray:
+        length = self.rows if length is None else length
+        # np.memmap refuses empty files
+        if length == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+
+    def ip_code(self, ip: str) -> Optional[int]:
+        if self._ip_index is None:
+            self._ip_index = {value: code for code, value in enumerate(self.ips)}
+        return self._ip_index.get(ip)
+
+    def threat_code(self, threat_type: str) -> Optional[int]:
+        return self.threat_labels.index(threat_type) if threat_type in self.threat_labels else None
+
+    def _filters(
+        self,
+        classification: Optional[str] = None,
+        threat_type: Optional[str] = None,
+        ip: Optional[str] = None,
+        port: Optional[int] = None,
+        protocol: Optional[int] = None,
+        min_risk: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Query parameters as column filters; None if they cannot match any flow
+        (a threat type or IP that never occurs in this analysis)
+        """
+        filters: Dict[str, Any] = {}
+        if classification is not None:
+            if classification.upper() not in ('ATTACK', 'BENIGN'):
+                raise ValueError("Invalid classification. Supported: ['ATTACK', 'BENIGN']")
+            filters['is_attack'] = classification.upper() == 'ATTACK'
+        if threat_type is not None:
+            filters['threat_code'] = self.threat_code(threat_type)
+        if ip is not None:
+            filters['ip_code'] = self.ip_code(ip)
+        if port is not None:
+            filters['port'] = port
+        if protocol is not None:
+            filters['protocol'] = protocol
+        if min_risk is not None:
+            filters['min_risk'] = min_risk
+
+        if any(value is None for value in filters.values()):
+            return None
+        return filters
+
+    def _match(self, rows: Optional[np.ndarray], filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Boolean mask of the given rows (all rows if None) that pass every filter
+        """
+        def column(name: str) -> np.ndarray:
+            return self.columns[name] if rows is None else self.columns[name][rows]
+
+        mask = np.ones(self.rows if rows is None else len(rows), dtype=bool)
+        if 'is_attack' in filters:
+            mask &= column('is_attack') == filters['is_attack']
+        if 'threat_code' in filters:
+            mask &= column('threat_code') == filters['threat_code']
+        if 'ip_code' in filters:
+            code = filters['ip_code']
+            mask &= (column('src_ip') == code) | (column('dst_ip') == code)
+        if 'port' in filters:
+            port = filters['port']
+            mask &= (column('src_port') == port) | (column('dst_port') == port)
+        if 'protocol' in filters:
+            mask &= column('protocol') == filters['protocol']
+        if 'min_risk' in filters:
+            mask &= column('risk_score') >= filters['min_risk']
+        return mask
+
+    def query(
+        self,
+        classification: Optional[str] = None,
+        threat_type: Optional[str] = None,
+        ip: Optional[str] = None,
+        port: Optional[int] = None,
+        protocol: Optional[int] = None,
+        min_risk: Optional[float] = None,
+        sort: str = 'risk',
+        cursor: Optional[str] = None,
+        limit: int = 100
+    ) -> Dict[str, Any]:
+        """
+        One page of flows matching the filters, in risk or flow order.
+
+        The cursor is the position in the sort order to resume from, so each
+        page scans forward from it in growing blocks and stops as soon as the
+        page is full; its cost does not depend on the size of the analysis.
+        """
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"Invalid sort. Supported: {list(SORT_ORDERS)}")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        position = self._decode_cursor(cursor, sort)
+
+        filters = self._filters(classification, threat_type, ip, port, protocol, min_risk)
+        if filters is None:
+            position = self.rows
+
+        matches: List[np.ndarray] = []
+        found = 0
+        block = max(4 * limit, 4096)
+        while position < self.rows and found < limit:
+            end = min(position + block, self.rows)
+            rows = np.asarray(self.risk_order[position:end]) if sort == 'risk' else np.arange(position, end)
+            hits = np.flatnonzero(self._match(rows, filters))
+            if found + len(hits) >= limit:
+                hits = hits[:limit - found]
+                end = position + int(hits[-1]) + 1
+            matches.append(rows[hits])
+            found += len(hits)
+            position = end
+            block = min(block * 2, 1 << 20)
+
+        selected = np.concatenate(matches) if matches else np.zeros(0, dtype=np.int64)
+        return {
+            'flows': self.flow_dicts(selected),
+            'next_cursor': f"{sort}:{position}" if position < self.rows else None,
+            'total_flows': self.rows,
+            'sort': sort
+        }
+
+    def _decode_cursor(self, cursor: Optional[str], sort: str) -> int:
+        if not cursor:
+            return 0
+        cursor_sort, _, position = cursor.partition(':')
+        if cursor_sort != sort or not position.isdigit():
+            raise ValueError("Invalid cursor for this query")
+        return int(position)
+
+    def _networks(self, prefix_length: int) -> Tuple[np.ndarray, List[str]]:
+        """
+        Network of every entry in the IP table, as (network code per IP code, network names)
+        """
+        cached = self._network_cache.get(prefix_length)
+        if cached is None:
+            names = []
+            for ip in self.ips:
+                try:
+                    address = ipaddress.ip_address(ip)
+                    length = min(prefix_length, address.max_prefixlen)
+                    names.append(str(ipaddress.ip_network(f"{ip}/{length}", strict=False)))
+                except ValueError:
+                    names.append(ip)
+            codes, uniques = pd.factorize(np.array(names, dtype=object))
+            cached = (codes.astype(np.int64), list(uniques))
+            self._network_cache[prefix_length] = cached
+        return cached
+
+    def _group_values(
+        self,
+        key: str,
+        rows: np.ndarray,
+        bucket_seconds: float,
+        prefix_length: int
+    ) -> Tuple[np.ndarray, List[Any]]:
+        """
+        Raw group values of the matching rows for one key, as (integer codes, value of each code)
+        """
+        columns = self.columns
+        if key in ('src_ip', 'dst_ip'):
+            return np.asarray(columns[key][rows], dtype=np.int64), self.ips
+        if key in ('src_net', 'dst_net'):
+            network_codes, names = self._networks(prefix_length)
+            return network_codes[columns[key[:3] + '_ip'][rows]], names
+        if key in ('src_port', 'dst_port', 'protocol'):
+            values = np.asarray(columns[key][rows], dtype=np.int64)
+            return values, range(int(values.max()) + 1 if len(values) else 0)
+        if key == 'classification':
+            return np.asarray(columns['is_attack'][rows], dtype=np.int64), ['BENIGN', 'ATTACK']
+        if key == 'threat_type':
+            # Shifted by one so benign rows (-1) get code 0
+            return np.asarray(columns['threat_code'][rows], dtype=np.int64) + 1, [None] + list(self.threat_labels)
+        # key == 'time': bucket start, unknown timestamps grouped as None
+        buckets = np.floor(np.asarray(columns['timestamp'][rows]) / bucket_seconds)
+        codes, uniques = pd.factorize(buckets)
+        return codes.astype(np.int64) + 1, [None] + [float(bucket * bucket_seconds) for bucket in uniques]
+
+    def aggregate(
+        self,
+        group_by: List[str],
+        metrics: List[str],
+        sort: Optional[str] = None,
+        limit: int = 100,
+        bucket_seconds: float = 60.0,
+        prefix_length: int = 24,
+        classification: Optional[str] = None,
+        threat_type: Optional[str] = None,
+        ip: Optional[str] = None,
+        port: Optional[int] = None,
+        protocol: Optional[int] = None,
+        min_risk: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Group the flows matching the filters by the given keys and compute
+        metrics per group, as vectorized group-bys over the stored columns.
+        Groups come back by the sort metric (highest first), or in time order
+        when grouping by time bucket; at most limit groups are returned.
+        """
+        if not group_by or any(key not in GROUP_KEYS for key in group_by):
+            raise ValueError(f"Invalid group_by. Supported: {list(GROUP_KEYS)}")
+        if not metrics or any(metric not in METRICS for metric in metrics):
+            raise ValueError(f"Invalid metrics. Supported: {list(METRICS)}")
+        if sort is None:
+            sort = 'time' if 'time' in group_by else metrics[0]
+        if sort not in metrics and not (sort == 'time' and 'time' in group_by):
+            raise ValueError("Sort by one of the requested metrics, or 'time' when grouping by time")
+        if bucket_seconds <= 0:
+            raise ValueError("bucket_seconds must be positive")
+        if not 0 <= prefix_length <= 128:
+            raise ValueError("prefix_length must be between 0 and 128")
+        limit = max(1, min(limit, MAX_GROUPS))
+
+        filters = self._filters(classification, threat_type, ip, port, protocol, min_risk)
+        rows = np.flatnonzero(self._match(None, filters)) if filters is not None else np.zeros(0, dtype=np.int64)
+
+        # Dense group id per row: combine the keys one at a time, re-densifying
+        # after each step so the combined code never overflows
+        key_values = [self._group_values(key, rows, bucket_seconds, prefix_length) for key in group_by]
+        group_ids = np.zeros(len(rows), dtype=np.int64)
+        groups = 1
+        for codes, values in key_values:
+            group_ids, _ = pd.factorize(group_ids * len(values) + codes)
+            groups = int(group_ids.max()) + 1 if len(group_ids) else 0
+        _, first_rows = np.unique(group_ids, return_index=True)
+
+        counts = np.bincount(group_ids, minlength=groups)
+        columns = {}
+        if 'count' in metrics:
+            columns['count'] = counts
+        if 'attacks' in metrics:
+            columns['attacks'] = np.bincount(group_ids, weights=self.columns['is_attack'][rows], minlength=groups).astype(np.int64)
+        for metric in ('bytes', 'packets'):
+            if metric in metrics:
+                columns[metric] = np.bincount(group_ids, weights=self.columns[metric][rows], minlength=groups).astype(np.int64)
+        if 'mean_risk' in metrics or 'max_risk' in metrics:
+            risk = np.asarray(self.columns['risk_score'][rows])
+            if 'mean_risk' in metrics:
+                columns['mean_risk'] = np.bincount(group_ids, weights=risk, minlength=groups) / np.maximum(counts, 1)
+            if 'max_risk' in metrics:
+                columns['max_risk'] = np.full(groups, -np.inf)
+                np.maximum.at(columns['max_risk'], group_ids, risk)
+
+        if sort == 'time':
+            times = key_values[group_by.index('time')]
+            bucket_starts = np.array([np.inf if value is None else value for value in times[1]])[times[0][first_rows]]
+            selected = np.argsort(bucket_starts, kind='stable')[:limit]
+        else:
+            selected = top_k_indices(np.asarray(columns[sort], dtype=np.float64), limit)
+
+        group_rows = []
+        for group in selected.tolist():
+            row = first_rows[group]
+            group_row = {key: values[int(codes[row])] for key, (codes, values) in zip(group_by, key_values)}
+            group_row.update({metric: columns[metric][group].item() for metric in metrics})
+            group_rows.append(group_row)
+        return {
+            'group_by': group_by,
+            'metrics': metrics,
+            'sort': sort,
+            'groups': group_rows,
+            'total_groups': groups,
+            'flows_matched': len(rows)
+        }
+
+    def host(self, ip: str) -> Optional[Dict[str, Any]]:
+        """
+        Rollup of one host, read straight from its row; None if it never appears
+        """
+        code = self.ip_code(ip)
+        return None if code is None else self.host_dicts(np.array([code]))[0]
+
+    def hosts(self, ranking: str = 'talkers', cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """
+        One page of hosts in the precomputed top-talker or top-risk order
+        """
+        if ranking not in HOST_RANKINGS:
+            raise ValueError(f"Invalid ranking. Supported: {list(HOST_RANKINGS)}")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        position = self._decode_cursor(cursor, ranking)
+        end = min(position + limit, len(self.ips))
+
+        return {
+            'hosts': self.host_dicts(np.asarray(self.host_orders[ranking][position:end])),
+            'next_cursor': f"{ranking}:{end}" if end < len(self.ips) else None,
+            'total_hosts': len(self.ips),
+            'ranking': ranking
+        }
+
+    def host_dicts(self, codes: np.ndarray) -> List[Dict[str, Any]]:
+        columns = {name: np.asarray(column[codes]).tolist() for name, column in self.host_columns.items()}
+        return [
+            {
+                'ip': self.ips[code],
+                **{name: values[i] for name, values in columns.items()},
+                'first_seen': None if np.isnan(columns['first_seen'][i]) else columns['first_seen'][i],
+                'last_seen': None if np.isnan(columns['last_seen'][i]) else columns['last_seen'][i]
+            }
+            for i, code in enumerate(codes.tolist())
+        ]
+
+    def flow_dicts(self, rows: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Materialize result rows (API shape, as in detailed_results) for the given flow indices
+        """
+        columns = {name: np.asarray(column[rows]) for name, column in self.columns.items()}
+        predictions = PredictionBatch(
+            is_attack=columns['is_attack'],
+            confidence=columns['confidence'],
+            risk_score=columns['risk_score'],
+            threat_code=columns['threat_code'],
+            threat_labels=self.threat_labels
+        ).to_dicts()
+
+        flows = []
+        for i, (index, src_code, dst_code, src_port, dst_port, protocol, timestamp, size, packets) in enumerate(zip(
+            rows.tolist(),
+            columns['src_ip'].tolist(),
+            columns['dst_ip'].tolist(),
+            columns['src_port'].tolist(),
+            columns['dst_port'].tolist(),
+            columns['protocol'].tolist(),
+            columns['timestamp'].tolist(),
+            columns['bytes'].tolist(),
+            columns['packets'].tolist()
+        )):
+            src_ip, dst_ip = self.ips[src_code], self.ips[dst_code]
+            flow_key = f"{src_ip}_{src_port}_{dst_ip}_{dst_port}_{protocol}"
+            flows.append({
+                'index': index,
+                # Same ids as the extractor's Flow ID
+                'flow_id': flow_id(flow_key, timestamp) if np.isfinite(timestamp) else flow_key,
+                'src_ip': src_ip,
+                'dst_ip': dst_ip,
+                'src_port': src_port,
+                'dst_port': dst_port,
+                'protocol': protocol,
+                'timestamp': timestamp if np.isfinite(timestamp) else None,
+                'bytes': size,
+                'packets': packets,
+                'prediction': predictions[i]
+            })
+        return flows
+
+class FlowResultStore:
+    """
+    Per-analysis columnar storage of every scored flow, one directory of
+    column files per analysis. Recently read tables are kept open, and
+    aggregation results are cached per (analysis, query); stored tables
+    never change, so cached results only go away with their analysis.
+    """
+
+    def __init__(self, root: Path, open_tables: int = 16, cached_aggregates: int = 256):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.open_tables = open_tables
+        self.cached_aggregates = cached_aggregates
+        self._tables: "OrderedDict[str, FlowResultTable]" = OrderedDict()
+        self._aggregates: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _directory(self, analysis_id: str) -> Path:
+        # Refuse anything that could escape the results dir
+        if not analysis_id or os.path.basename(analysis_id) != analysis_id or analysis_id.startswith('.'):
+            raise KeyError(analysis_id)
+        return self.root / analysis_id
+
+    def create(self, analysis_id: str) -> FlowResultWriter:
+        directory = self._directory(analysis_id)
+        self._forget(analysis_id)
+        return FlowResultWriter(directory, self.root / f".{analysis_id}.partial")
+
+    def _forget(self, analysis_id: str):
+        with self._lock:
+            self._tables.pop(analysis_id, None)
+            for key in [key for key in self._aggregates if key[0] == analysis_id]:
+                del self._aggregates[key]
+
+    def open(self, analysis_id: str) -> FlowResultTable:
+        """
+        Open an analysis' result table; KeyError if it has none
+        """
+        with self._lock:
+            table = self._tables.get(analysis_id)
+            if table is not None:
+                self._tables.move_to_end(analysis_id)
+                return table
+
+        directory = self._directory(analysis_id)
+        if not (directory / "manifest.json").exists():
+            raise KeyError(analysis_id)
+        table = FlowResultTable(directory)
+
+        with self._lock:
+            self._tables[analysis_id] = table
+            while len(self._tables) > self.open_tables:
+                self._tables.popitem(last=False)
+        return table
+
+    def aggregate(self, analysis_id: str, group_by: List[str], metrics: List[str], **query) -> Dict[str, Any]:
+        """
+        FlowResultTable.aggregate for an analysis, served from the cache when
+        the same query was run before; KeyError if the analysis has no table
+        """
+        key = (analysis_id, tuple(group_by), tuple(metrics), tuple(sorted(query.items())))
+        with self._lock:
+            result = self._aggregates.get(key)
+            if result is not None:
+                self._aggregates.move_to_end(key)
+                return result
+
+        result = self.open(analysis_id).aggregate(group_by, metrics, **query)
+
+        with self._lock:
+            self._aggregates[key] = result
+            while len(self._aggregates) > self.cached_aggregates:
+                self._aggregates.popitem(last=False)
+        return result
+
+    def exists(self, analysis_id: str) -> bool:
+        try:
+            return (self._directory(analysis_id) / "manifest.json").exists()
+        except KeyError:
+            return False
+
+    def delete(self, analysis_id: str):
+        self._forget(analysis_id)
+        directory = self._directory(analysis_id)
+        if directory.exists():
+            shutil.rmtree(directory, ignore_errors=True)
+
+# Global instance
+flow_result_store = FlowResultStore(
+    Path(os.environ.get("ANUBIS_RESULTS_DIR", Path(tempfile.gettempdir()) / "anubis_pcap" / "results"))
+)
@@ -0,0 +1,168 @@
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# TCP flags that end a flow
+TCP_FIN = 0x01
+TCP_RST = 0x04
+
+# (timestamp, length, src_ip, tcp_flags) - all a flow needs from a packet
+PacketRecord = Tuple[float, int, str, int]
+FinishedFlow = Tuple[str, List[PacketRecord]]
+
+# Rough memory cost of a held packet record and of a flow's table entries, for the memory budget
+PACKET_RECORD_BYTES = 160
+FLOW_ENTRY_BYTES = 400
+
+# Sampling never drops below one in this many new flows
+MIN_SAMPLE_RATE = 1 / 64
+
+def flow_id(flow_key: str, start_time: float) -> str:
+    """
+    Id of one finished flow. The table can finish several flows with the same
+    key (idle timeout, FIN/RST, eviction), so the key alone is not unique; the
+    flow's start time in microseconds is appended.
+    """
+    return f"{flow_key}_{round(start_time * 1_000_000)}"
+
+class StreamingFlowTable:
+    """
+    Table of active flows that hands back flows as soon as they finish,
+    so a capture can be processed without holding every flow in memory.
+
+    A flow finishes when it has been idle for idle_timeout seconds of
+    capture time, close_timeout seconds after a FIN/RST (leaving room for
+    the closing handshake), or when the table is over max_active_flows
+    and it is the least recently seen flow. State survives across calls,
+    so flows spanning consecutive capture files are stitched together as
+    long as the table is not flushed in between.
+
+    With a memory_budget (bytes), a table whose estimated size exceeds it
+    switches to sampled mode: only a deterministic share of new flows is
+    tracked (halved on every further overrun) and the least recently seen
+    flows are finished early until the table is back under budget.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 120.0,
+        close_timeout: float = 1.0,
+        max_active_flows: int = 100000,
+        memory_budget: Optional[int] = None
+    ):
+        self.idle_timeout = idle_timeout
+        self.close_timeout = close_timeout
+        self.max_active_flows = max_active_flows
+        self.memory_budget = memory_budget
+
+        # Both ordered oldest first, so expiry only looks at the front
+        self.flows: "OrderedDict[str, List[PacketRecord]]" = OrderedDict()
+        self.closing: "OrderedDict[str, float]" = OrderedDict()
+        self.last_seen: Dict[str, float] = {}
+        self.clock = 0.0
+
+        self.packets_seen = 0
+        self.flows_finished = 0
+
+        # Memory budget state
+        self.packets_held = 0
+        self.sample_rate = 1.0
+        self.flows_finished_early = 0
+        self.packets_skipped = 0
+        self.peak_memory = 0
+
+    def __len__(self) -> int:
+        return len(self.flows)
+
+    def memory_estimate(self) -> int:
+        return self.packets_held * PACKET_RECORD_BYTES + len(self.flows) * FLOW_ENTRY_BYTES
+
+    def add(self, flow_key: str, record: PacketRecord):
+        timestamp = record[0]
+        packets = self.flows.get(flow_key)
+        if packets is None:
+            # crc32 rather than hash(): the same flows are kept in every process and run
+            if self.sample_rate < 1.0 and zlib.crc32(flow_key.encode()) % 4096 >= self.sample_rate * 4096:
+                self.packets_skipped += 1
+                self.packets_seen += 1
+                if timestamp > self.clock:
+                    self.clock = timestamp
+                return
+            self.flows[flow_key] = [record]
+        else:
+            packets.append(record)
+            self.flows.move_to_end(flow_key)
+        self.packets_held += 1
+
+        self.last_seen[flow_key] = timestamp
+        if record[3] & (TCP_FIN | TCP_RST):
+            self.closing[flow_key] = timestamp
+            self.closing.move_to_end(flow_key)
+
+        if timestamp > self.clock:
+            self.clock = timestamp
+        self.packets_seen += 1
+
+    def _pop(self, flow_key: str) -> FinishedFlow:
+        self.closing.pop(flow_key, None)
+        del self.last_seen[flow_key]
+        self.flows_finished += 1
+        packets = self.flows.pop(flow_key)
+        self.packets_held -= len(packets)
+        return flow_key, packets
+
+    def expire(self) -> List[FinishedFlow]:
+        """
+        Remove and return every flow that has finished by the current capture time
+        """
+        finished = []
+
+        while self.closing:
+            flow_key, closed_at = next(iter(self.closing.items()))
+            if self.clock - closed_at < self.close_timeout:
+                break
+            finished.append(self._pop(flow_key))
+
+        while self.flows:
+            flow_key = next(iter(self.flows))
+            if self.clock - self.last_seen[flow_key] < self.idle_timeout and len(self.flows) <= self.max_active_flows:
+                break
+            finished.append(self._pop(flow_key))
+
+        if self.memory_budget:
+            estimate = self.memory_estimate()
+            self.peak_memory = max(self.peak_memory, estimate)
+            if estimate > self.memory_budget:
+                self._shed(finished)
+
+        return finished
+
+    def _shed(self, finished: List[FinishedFlow]):
+        """
+        Over budget: track fewer new flows and finish the least recently seen ones early
+        """
+        self.sample_rate = max(MIN_SAMPLE_RATE, self.sample_rate / 2)
+        target = self.memory_budget * 0.8
+        while self.flows and self.memory_estimate() > target:
+            finished.append(self._pop(next(iter(self.flows))))
+            self.flows_finished_early += 1
+
+    def coverage(self) -> Dict[str, Any]:
+        """
+        How much of the traffic was analyzed, and whether the memory budget forced sampling
+        """
+        return {
+            "mode": "sampled" if self.sample_rate < 1.0 else "full",
+            "flow_sample_rate": self.sample_rate,
+            "flows_finished_early": self.flows_finished_early,
+            "packets_skipped": self.packets_skipped,
+            "memory_budget_bytes": self.memory_budget,
+            "peak_memory_estimate_bytes": self.peak_memory
+        }
+
+    def flush(self) -> List[FinishedFlow]:
+        """
+        Remove and return all remaining flows (end of input)
+        """
+        finished = [self._pop(flow_key) for flow_key in list(self.flows)]
+        return finished
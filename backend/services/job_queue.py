@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job priorities, lowest first: captures small enough for the sync endpoint jump the queue
+PRIORITY_SMALL = 0
+PRIORITY_LARGE = 1
+
+# A running job whose worker has not renewed its lease within this window is considered crashed
+LEASE_SECONDS = float(os.environ.get("ANUBIS_JOB_LEASE_SECONDS", 60))
+MAX_ATTEMPTS = int(os.environ.get("ANUBIS_JOB_MAX_ATTEMPTS", 3))
+
+JOB_STATES = ("queued", "running", "completed", "failed", "cancelled")
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    file_size INTEGER NOT NULL DEFAULT 0,
+    priority INTEGER NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker_id TEXT,
+    lease_expires REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    progress INTEGER NOT NULL DEFAULT 0,
+    message TEXT NOT NULL DEFAULT '',
+    partial_results TEXT,
+    stats TEXT,  -- JSON progress counters: bytes, packets, flows, ETA
+    revision INTEGER NOT NULL DEFAULT 0,  -- bumped on every visible change
+    content_sha256 TEXT,  -- of the uploaded capture, to reuse analyses of identical uploads
+    model_version TEXT,  -- the analysis runs with this model version
+    summary TEXT,
+    results BLOB,  -- zlib-compressed JSON
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, created_at);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+"""
+
+# Everything but the (large) results, which are loaded separately
+JOB_COLUMNS = (
+    "job_id, file_path, filename, file_size, priority, status, attempts, max_attempts, worker_id, "
+    "lease_expires, cancel_requested, progress, message, partial_results, stats, revision, content_sha256, "
+    "model_version, summary, error, "
+    "created_at, started_at, finished_at"
+)
+
+class JobQueue:
+    """
+    Durable analysis job queue in SQLite, shared by the API and worker processes.
+
+    Workers claim the next queued job (by priority, then age) under a lease
+    they renew while it runs. A worker that dies stops renewing, so its job
+    is put back in the queue once the lease expires, up to max_attempts.
+    Progress, cancellation requests and results all go through the job row,
+    so queued and finished jobs survive restarts.
+    """
+
+    def __init__(self, db_path: Path, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            # Databases created by earlier versions lack the newer columns
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, definition in (
+                ("stats", "TEXT"),
+                ("revision", "INTEGER NOT NULL DEFAULT 0"),
+                ("content_sha256", "TEXT"),
+                ("model_version", "TEXT")
+            ):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_content ON jobs (content_sha256, model_version)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per operation: safe across threads and processes
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _job(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        for column in ("partial_results", "stats", "summary"):
+            job[column] = json.loads(job[column]) if job[column] else None
+        return job
+
+    def enqueue(
+        self,
+        job_id: str,
+        file_path: Path,
+        filename: str,
+        file_size: int,
+        priority: int = PRIORITY_LARGE,
+        content_sha256: Optional[str] = None,
+        model_version: Optional[str] = None,
+        reuse_existing: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Queue a job. Unless reuse_existing is off, an existing job for the same content_sha256
+        and model version (preferably completed, else queued or running) is returned instead
+        of queueing a new one (check job_id on the result to tell which).
+        """
+        with self._transaction() as db:
+            if content_sha256 and reuse_existing:
+                existing = db.execute(
+                    f"SELECT {JOB_COLUMNS} FROM jobs WHERE content_sha256 = ? AND model_version IS ? "
+                    "AND status IN ('queued', 'running', 'completed') AND cancel_requested = 0 "
+                    "ORDER BY status = 'completed' DESC, created_at DESC LIMIT 1",
+                    (content_sha256, model_version)
+                ).fetchone()
+                if existing is not None:
+                    logger.info(f"Reusing analysis job {existing['job_id']} for {filename} (same content and model)")
+                    return self._job(existing)
+            db.execute(
+                "INSERT INTO jobs (job_id, file_path, filename, file_size, priority, max_attempts, message, "
+                "content_sha256, model_version, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, str(file_path), filename, file_size, priority, self.max_attempts,
+                 "File uploaded, queued for analysis", content_sha256, model_version, time.time())
+            )
+            job = self._job(db.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)).fetchone())
+        logger.info(f"Queued analysis job {job_id} for {filename} (priority {priority})")
+        return job
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Take the next queued job for worker_id, or None if the queue is empty
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY priority, created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET revision = revision + 1, "
+                "status = 'running', worker_id = ?, lease_expires = ?, attempts = attempts + 1, "
+                "started_at = ?, progress = 10, message = 'Validating file...' WHERE job_id = ?",
+                (worker_id, now + self.lease_seconds, now, row["job_id"])
+            )
+            return self._job(db.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone())
+
+    def heartbeat(
+        self,
+        job_id: str,
+        worker_id: str,
+        progress: Optional[int] = None,
+        message: Optional[str] = None,
+        partial_results: Optional[Dict[str, Any]] = None,
+        stats: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Renew a running job's lease and record its progress.
+        Returns False if the job should stop (cancel requested, or no longer owned by this worker).
+        """
+        changed = any(value is not None for value in (progress, message, partial_results, stats))
+        with self._connect() as db:
+            updated = db.execute(
+                "UPDATE jobs SET revision = revision + ?, lease_expires = ?, progress = COALESCE(?, progress), "
+                "message = COALESCE(?, message), partial_results = COALESCE(?, partial_results), "
+                "stats = COALESCE(?, stats) "
+                "WHERE job_id = ? AND worker_id = ? AND status = 'running' AND cancel_requested = 0",
+                (int(changed), time.time() + self.lease_seconds, progress, message,
+                 json.dumps(partial_results) if partial_results is not None else None,
+                 json.dumps(stats) if stats is not None else None, job_id, worker_id)
+            ).rowcount
+        return updated == 1
+
+    def complete(self, job_id: str, worker_id: str, results: Dict[str, Any]):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET revision = revision + 1, "
+                "status = 'completed', progress = 100, message = 'Analysis completed successfully', "
+                "partial_results = NULL, summary = ?, results = ?, finished_at = ?, lease_expires = NULL "
+                "WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                (json.dumps({"filename": results["filename"], **results["summary"]}),
+                 zlib.compress(json.dumps(results).encode(), 6),
+                 time.time(), job_id, worker_id)
+            )
+
+    def fail(self, job_id: str, worker_id: str, error: str):
+        """
+        Record a failed run. Analysis errors are not retried: the same file would fail the same way.
+        """
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET revision = revision + 1, "
+                "status = 'failed', progress = 0, message = ?, error = ?, finished_at = ?, "
+                "lease_expires = NULL WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                (f"Analysis failed: {error}", error, time.time(), job_id, worker_id)
+            )
+
+    def release(self, job_id: str, worker_id: str):
+        """
+        Hand a running job back to the queue without counting the attempt (e.g. worker shutdown)
+        """
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET revision = revision + 1, "
+                "status = 'queued', attempts = MAX(attempts - 1, 0), worker_id = NULL, "
+                "lease_expires = NULL, stats = NULL, message = 'Requeued after worker shutdown' "
+                "WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                (job_id, worker_id)
+            )
+
+    def mark_cancelled(self, job_id: str):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET revision = revision + 1, "
+                "status = 'cancelled', message = 'Analysis cancelled', partial_results = NULL, "
+                "finished_at = ?, lease_expires = NULL WHERE job_id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+            )
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a job: queued jobs are cancelled at once, running ones are
+        flagged and stopped by their worker at its next heartbeat
+        """
+        with self._transaction() as db:
+            row = db.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == "queued":
+                db.execute(
+                    "UPDATE jobs SET revision = revision + 1, "
+                    "status = 'cancelled', message = 'Analysis cancelled', finished_at = ? WHERE job_id = ?",
+                    (time.time(), job_id)
+                )
+            elif row["status"] == "running":
+                db.execute(
+                    "UPDATE jobs SET revision = revision + 1, "
+                    "cancel_requested = 1, message = 'Cancelling...' WHERE job_id = ?", (job_id,)
+                )
+        return self.get(job_id)
+
+    def requeue_expired(self) -> List[Dict[str, Any]]:
+        """
+        Put running jobs with an expired lease (crashed worker) back in the queue,
+        or fail them once they have used up their attempts. Returns the jobs
+        that were given up on, so their input files can be removed.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            expired = db.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs WHERE status = 'running' AND lease_expires < ?", (now,)
+            ).fetchall()
+            abandoned = []
+            for row in expired:
+                if row["cancel_requested"]:
+                    db.execute(
+                        "UPDATE jobs SET revision = revision + 1, "
+                        "status = 'cancelled', message = 'Analysis cancelled', finished_at = ?, "
+                        "lease_expires = NULL WHERE job_id = ?", (now, row["job_id"])
+                    )
+                    abandoned.append(row)
+                elif row["attempts"] >= row["max_attempts"]:
+                    message = f"Analysis failed: worker crashed {row['attempts']} times"
+                    db.execute(
+                        "UPDATE jobs SET revision = revision + 1, "
+                        "status = 'failed', progress = 0, message = ?, error = ?, finished_at = ?, "
+                        "lease_expires = NULL WHERE job_id = ?", (message, message, now, row["job_id"])
+                    )
+                    abandoned.append(row)
+                else:
+                    db.execute(
+                        "UPDATE jobs SET revision = revision + 1, "
+                        "status = 'queued', worker_id = NULL, lease_expires = NULL, progress = 0, "
+                        "partial_results = NULL, stats = NULL, message = 'Requeued after worker crash' WHERE job_id = ?",
+                        (row["job_id"],)
+                    )
+                    logger.warning(f"Requeued job {row['job_id']} after its worker {row['worker_id']} stopped responding")
+        return [self._job(row) for row in abandoned]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as db:
+            return self._job(db.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)).fetchone())
+
+    def revision(self, job_id: str) -> Optional[int]:
+        """
+        A job's revision alone (primary key lookup), or None if it does not exist
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT revision FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row["revision"] if row else None
+
+    def results(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as db:
+            row = db.execute("SELECT results FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(zlib.decompress(row["results"])) if row and row["results"] else None
+
+    def list(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Jobs, most recent first, paged through the created_at index
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs ORDER BY created_at DESC LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def count(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def purge_finished(self, finished_before: float) -> List[str]:
+        """
+        Delete jobs that finished before the given time; returns their ids
+        """
+        with self._transaction() as db:
+            job_ids = [row["job_id"] for row in db.execute(
+                "SELECT job_id FROM jobs WHERE finished_at < ?", (finished_before,)
+            ).fetchall()]
+            db.execute("DELETE FROM jobs WHERE finished_at < ?", (finished_before,))
+        return job_ids
+
+    def delete(self, job_id: str) -> bool:
+        with self._connect() as db:
+            return db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,)).rowcount == 1
+
+# Global instance
+job_queue = JobQueue(
+    Path(os.environ.get("ANUBIS_JOB_DB", Path(tempfile.gettempdir()) / "anubis_pcap" / "jobs.sqlite3"))
+)
@@ -0,0 +1,97 @@
+import threading
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Log-spaced bucket upper bounds from 10 microseconds to ~100 seconds
+DEFAULT_BUCKETS = tuple(float(bound) for bound in np.logspace(-5, 2, 57))
+
+# Batch size classes, from the live scanner (1 flow) to large PCAP batches
+BATCH_SIZE_CLASSES: List[Tuple[str, int]] = [
+    ("1", 1),
+    ("2-10", 10),
+    ("11-100", 100),
+    ("101-1k", 1000),
+    ("1k-10k", 10000),
+    ("10k-100k", 100000),
+    ("100k+", -1)
+]
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram with percentile estimates
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = np.asarray(buckets)
+        self.counts = np.zeros(len(buckets) + 1, dtype=np.int64)  # Last bucket catches overflow
+        self.count = 0
+        self.rows = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float, rows: int = 1):
+        self.counts[np.searchsorted(self.buckets, seconds)] += 1
+        self.count += 1
+        self.rows += rows
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th percentile, in seconds
+        """
+        if not self.count:
+            return 0.0
+        rank = np.searchsorted(np.cumsum(self.counts), q / 100.0 * self.count)
+        if rank >= len(self.buckets):
+            return self.max_seconds
+        return float(min(self.buckets[rank], self.max_seconds))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.count,
+            "rows": self.rows,
+            "rows_per_second": (self.rows / self.total_seconds) if self.total_seconds else 0.0,
+            "mean_ms": (self.total_seconds / self.count * 1000) if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max_seconds * 1000
+        }
+
+class BatchLatencyTracker:
+    """
+    Latency histograms per batch size class, recorded at runtime
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+    @staticmethod
+    def size_class(rows: int) -> str:
+        for name, upper_bound in BATCH_SIZE_CLASSES:
+            if upper_bound < 0 or rows <= upper_bound:
+                return name
+        return BATCH_SIZE_CLASSES[-1][0]
+
+    def record(self, rows: int, seconds: float):
+        size_class = self.size_class(rows)
+        with self._lock:
+            histogram = self.histograms.get(size_class)
+            if histogram is None:
+                histogram = self.histograms[size_class] = LatencyHistogram()
+            histogram.record(seconds, rows)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: self.histograms[name].get_stats()
+                for name, _ in BATCH_SIZE_CLASSES
+                if name in self.histograms
+            }
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import joblib
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class CompiledTreeEnsemble:
+    """
+    Flat, memory-mappable array layout of a fitted scikit-learn tree classifier
+    (DecisionTree, RandomForest, ExtraTrees).
+
+    scikit-learn copies tree nodes into private memory when unpickling, so
+    even joblib mmap_mode leaves every worker with its own copy of a large
+    forest. Here all trees are concatenated into a handful of .npy arrays
+    that are opened read-only with np.load(mmap_mode='r'), so every process
+    shares the same pages through the OS page cache.
+    """
+
+    ARRAYS = ("children_left", "children_right", "feature", "threshold", "value", "roots")
+    SUPPORTED_ESTIMATORS = {
+        "DecisionTreeClassifier", "ExtraTreeClassifier",
+        "RandomForestClassifier", "ExtraTreesClassifier"
+    }
+
+    def __init__(self, arrays: Dict[str, np.ndarray], classes: np.ndarray, max_depth: int, chunk_rows: int = 8192):
+        self.children_left = arrays["children_left"]
+        self.children_right = arrays["children_right"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.classes_ = np.asarray(classes)
+        self.max_depth = int(max_depth)
+        self.chunk_rows = chunk_rows
+
+    @classmethod
+    def supports(cls, estimator: Any) -> bool:
+        return (
+            type(estimator).__name__ in cls.SUPPORTED_ESTIMATORS
+            and getattr(estimator, "n_outputs_", 1) == 1
+        )
+
+    @classmethod
+    def from_estimator(cls, estimator: Any) -> "CompiledTreeEnsemble":
+        """
+        Flatten every tree of a fitted classifier into shared arrays
+        """
+        trees = [tree.tree_ for tree in getattr(estimator, "estimators_", [estimator])]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+
+        children_left, children_right, feature, threshold, value = [], [], [], [], []
+        for offset, tree in zip(offsets, trees):
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point at themselves so traversal can run a fixed number of steps
+            children_left.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            children_right.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+
+            # Per-node class distribution, normalized like DecisionTreeClassifier.predict_proba
+            node_values = tree.value[:, 0, :].astype(np.float64)
+            normalizer = node_values.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            value.append(node_values / normalizer)
+
+        arrays = {
+            "children_left": np.concatenate(children_left).astype(np.int32),
+            "children_right": np.concatenate(children_right).astype(np.int32),
+            "feature": np.concatenate(feature).astype(np.int32),
+            "threshold": np.concatenate(threshold).astype(np.float64),
+            "value": np.concatenate(value),
+            "roots": offsets.astype(np.int32)
+        }
+        return cls(arrays, estimator.classes_, max(tree.max_depth for tree in trees))
+
+    def save(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(directory / f"{name}.npy", getattr(self, name))
+        with open(directory / "meta.json", 'w') as f:
+            json.dump({"classes": self.classes_.tolist(), "max_depth": self.max_depth}, f)
+
+    @classmethod
+    def load(cls, directory: Path) -> "CompiledTreeEnsemble":
+        with open(directory / "meta.json", 'r') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode='r') for name in cls.ARRAYS}
+        return cls(arrays, np.array(meta["classes"]), meta["max_depth"])
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        # scikit-learn evaluates splits on float32 inputs
+        X = np.asarray(X, dtype=np.float32)
+        probabilities = np.empty((len(X), self.value.shape[1]), dtype=np.float64)
+        n_features = X.shape[1]
+
+        for start in range(0, len(X), self.chunk_rows):
+            chunk = X[start:start + self.chunk_rows]
+            flat_chunk = chunk.ravel()
+            row_offsets = (np.arange(len(chunk), dtype=np.int64) * n_features)[:, None]
+            nodes = np.broadcast_to(self.roots, (len(chunk), len(self.roots))).copy()
+
+            for _ in range(self.max_depth):
+                values = np.take(flat_chunk, row_offsets + np.take(self.feature, nodes))
+                next_nodes = np.where(
+                    values <= np.take(self.threshold, nodes),
+                    np.take(self.children_left, nodes),
+                    np.take(self.children_right, nodes)
+                )
+                # Every row has reached a leaf in every tree
+                if np.array_equal(next_nodes, nodes):
+                    break
+                nodes = next_nodes
+
+            probabilities[start:start + len(chunk)] = np.take(self.value, nodes, axis=0).mean(axis=1)
+
+        return probabilities
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+def _source_signature(source: Path) -> Dict[str, int]:
+    stat = source.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def load_shared_artifact(source: Path, cache_dir: Path, compile_trees: bool = False) -> Any:
+    """
+    Load a pickled artifact from a memory-mappable copy, converting it on first use.
+
+    By default the artifact is re-dumped uncompressed so joblib can mmap its
+    NumPy arrays (scalers, linear models, histogram boosting). With
+    compile_trees, tree classifiers are compiled into a CompiledTreeEnsemble,
+    which shares forests too at the cost of slower NumPy tree traversal.
+    The copy is regenerated whenever the source artifact changes. If it
+    cannot be written or read (e.g. a read-only model directory) the
+    source is loaded as a private copy instead.
+    """
+    target_dir = cache_dir / source.stem
+    manifest_file = target_dir / "manifest.json"
+    signature = _source_signature(source)
+
+    manifest: Optional[Dict[str, Any]] = None
+    if manifest_file.exists():
+        try:
+            with open(manifest_file, 'r') as f:
+                manifest = json.load(f)
+        except Exception:
+            manifest = None
+
+    try:
+        if not manifest or manifest.get("source") != signature or manifest.get("compile_trees") != compile_trees:
+            manifest = _convert_artifact(source, target_dir, signature, compile_trees)
+
+        if manifest["format"] == "compiled-trees":
+            return CompiledTreeEnsemble.load(target_dir / manifest["path"])
+        return joblib.load(target_dir / manifest["path"], mmap_mode='r')
+    except Exception as e:
+        logger.warning(f"No memory-mappable copy of {source.name} ({str(e)}); loading a private copy")
+        return joblib.load(source)
+
+def _convert_artifact(source: Path, target_dir: Path, signature: Dict[str, int], compile_trees: bool) -> Dict[str, Any]:
+    """
+    Write the memory-mappable copy of an artifact. Copies are named after the
+    source signature and each worker writes under its own temporary name before
+    renaming into place, so concurrent startups never see a partial copy.
+    """
+    logger.info(f"Converting {source.name} to a memory-mappable layout")
+    artifact = joblib.load(source)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    suffix = f".tmp{os.getpid()}"
+    name = f"{signature['mtime_ns']}-{signature['size']}"
+
+    if compile_trees and CompiledTreeEnsemble.supports(artifact):
+        artifact_format, path = "compiled-trees", f"compiled-{name}"
+        tmp_path = target_dir / f"{path}{suffix}"
+        CompiledTreeEnsemble.from_estimator(artifact).save(tmp_path)
+    else:
+        artifact_format, path = "joblib", f"artifact-{name}.joblib"
+        tmp_path = target_dir / f"{path}{suffix}"
+        joblib.dump(artifact, tmp_path)  # Uncompressed, so arrays can be mmapped
+
+    try:
+        os.replace(tmp_path, target_dir / path)
+    except OSError:
+        # Another worker already put an identical copy in place
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    manifest = {"source": signature, "compile_trees": compile_trees, "format": artifact_format, "path": path}
+    tmp_manifest = target_dir / f"manifest.json{suffix}"
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_manifest, target_dir / "manifest.json")
+
+    # Copies of earlier versions of the source are no longer referenced
+    for stale in target_dir.iterdir():
+        if stale.name not in (path, "manifest.json") and ".tmp" not in stale.name:
+            if stale.is_dir():
+                shutil.rmtree(stale, ignore_errors=True)
+            else:
+                stale.unlink(missing_ok=True)
+    return manifest
+
+def current_rss_bytes() -> Optional[int]:
+    """
+    Resident set size of this process (Linux), used to report model memory per worker
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import joblib
+import numpy as np
+
+from services.cascade import CascadeStage
+from services.model_mmap import load_shared_artifact
+from services.threat_rules import ThreatRuleTable
+
+logger = logging.getLogger(__name__)
+
+# The original flat artifacts in trained_models/ are exposed as this version
+LEGACY_VERSION = "v0"
+
+@dataclass(frozen=True)
+class ModelBundle:
+    """
+    Immutable set of artifacts that must always be used together.
+    Inference grabs one bundle reference per call, so swapping the
+    service's bundle never mixes a model with another version's scaler.
+    """
+    version: str
+    model: Any
+    scaler: Any
+    selected_features: tuple
+    threat_rules: ThreatRuleTable
+    source_dir: Path
+    loaded_at: datetime = field(default_factory=datetime.utcnow)
+    storage: str = "pickle"  # "joblib"/"compiled" when artifacts are memory-mapped
+    load_seconds: float = 0.0
+    cascade: Optional[CascadeStage] = None  # Cheap pre-classifier, if configured
+
+    @property
+    def model_name(self) -> str:
+        return f"ANUBIS-NetworkSecurityModel-{self.version}"
+
+class ModelRegistry:
+    """
+    Versioned model registry under models/trained_models
+
+    Layout:
+        trained_models/ANUBIS_AI_Model_v0.pkl, ANUBIS_AI_Scaler.pkl,
+        selected_features.json, threat_rules.json,
+        cascade.json                                -> version "v0"
+        trained_models/versions/<version>/model.pkl, scaler.pkl,
+        selected_features.json, threat_rules.json,
+        cascade.json                                -> version "<version>"
+        trained_models/ACTIVE_VERSION               -> version loaded at startup
+        <version dir>/mmap/                         -> memory-mappable copies of the pickles
+    """
+
+    def __init__(self, root: Path, mmap_mode: str = None):
+        self.root = Path(root)
+        self.versions_dir = self.root / "versions"
+        self.active_version_file = self.root / "ACTIVE_VERSION"
+        
+        # Share model pages between server workers through the OS page cache:
+        # "joblib" mmaps NumPy arrays of an uncompressed dump (scalers, linear
+        # models; scikit-learn still copies tree nodes of forests per process),
+        # "compiled" also flattens tree ensembles into shared arrays, "off"
+        # loads private copies
+        if mmap_mode is None:
+            mmap_mode = os.environ.get("ANUBIS_MODEL_MMAP", "joblib").lower()
+        if mmap_mode in ("0", "false", "no"):
+            mmap_mode = "off"
+        if mmap_mode not in ("off", "joblib", "compiled"):
+            logger.warning(f"Unknown ANUBIS_MODEL_MMAP mode '{mmap_mode}', using joblib")
+            mmap_mode = "joblib"
+        self.mmap_mode = mmap_mode
+        self._logged_override = None
+
+    @staticmethod
+    def _version_sort_key(version: str):
+        return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', version)]
+
+    def artifact_paths(self, version: str) -> Dict[str, Path]:
+        """
+        Get the artifact paths for a version
+        """
+        if version == LEGACY_VERSION:
+            return {
+                "dir": self.root,
+                "model": self.root / "ANUBIS_AI_Model_v0.pkl",
+                "scaler": self.root / "ANUBIS_AI_Scaler.pkl",
+                "features": self.root / "selected_features.json",
+                "threat_rules": self.root / "threat_rules.json",
+                "cascade": self.root / "cascade.json"
+            }
+
+        version_dir = self.versions_dir / version
+        return {
+            "dir": version_dir,
+            "model": version_dir / "model.pkl",
+            "scaler": version_dir / "scaler.pkl",
+            "features": version_dir / "selected_features.json",
+            "threat_rules": version_dir / "threat_rules.json",
+            "cascade": version_dir / "cascade.json"
+        }
+
+    def _is_complete(self, version: str) -> bool:
+        paths = self.artifact_paths(version)
+        return all(paths[name].exists() for name in ("model", "scaler", "features"))
+
+    def list_versions(self) -> List[str]:
+        """
+        List every version with a complete set of artifacts, oldest first
+        """
+        versions = []
+        if self._is_complete(LEGACY_VERSION):
+            versions.append(LEGACY_VERSION)
+
+        if self.versions_dir.exists():
+            for version_dir in self.versions_dir.iterdir():
+                if version_dir.is_dir() and version_dir.name != LEGACY_VERSION and self._is_complete(version_dir.name):
+                    versions.append(version_dir.name)
+
+        return sorted(versions, key=self._version_sort_key)
+
+    def pinned_version(self) -> Optional[str]:
+        """
+        Version pinned with ANUBIS_MODEL_VERSION, if any
+        """
+        return os.environ.get("ANUBIS_MODEL_VERSION") or None
+
+    def active_version(self) -> str:
+        """
+        Version to load at startup: ANUBIS_MODEL_VERSION, then ACTIVE_VERSION, then the newest
+        """
+        persisted = None
+        if self.active_version_file.exists():
+            persisted = self.active_version_file.read_text().strip() or None
+
+        version = self.pinned_version()
+        if version:
+            if persisted and persisted != version and self._logged_override != (version, persisted):
+                logger.warning(f"ANUBIS_MODEL_VERSION={version} overrides ACTIVE_VERSION {persisted}")
+                self._logged_override = (version, persisted)
+            return version
+        if persisted:
+            return persisted
+
+        versions = self.list_versions()
+        return versions[-1] if versions else LEGACY_VERSION
+
+    def active_version_stamp(self) -> Optional[tuple]:
+        """
+        Inode and modification time of ACTIVE_VERSION, changed by every reload in any process
+        """
+        try:
+            stat = self.active_version_file.stat()
+            return stat.st_ino, stat.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def set_active_version(self, version: str):
+        """
+        Persist the active version so restarts pick it up
+        """
+        tmp_file = self.active_version_file.with_suffix(".tmp")
+        tmp_file.write_text(version)
+        os.replace(tmp_file, self.active_version_file)
+
+    def load_bundle(self, version: str) -> ModelBundle:
+        """
+        Load a version's artifacts into a new bundle (blocking, run off the event loop)
+        """
+        paths = self.artifact_paths(version)
+
+        if not paths["model"].exists():
+            raise FileNotFoundError(f"Model file not found: {paths['model']}")
+        if not paths["scaler"].exists():
+            raise FileNotFoundError(f"Scaler file not found: {paths['scaler']}")
+        if not paths["features"].exists():
+            raise FileNotFoundError(f"Features file not found: {paths['features']}")
+
+        start_time = time.perf_counter()
+        if self.mmap_mode != "off":
+            cache_dir = paths["dir"] / "mmap"
+            compile_trees = self.mmap_mode == "compiled"
+            model = load_shared_artifact(paths["model"], cache_dir, compile_trees)
+            scaler = load_shared_artifact(paths["scaler"], cache_dir)
+        else:
+            model = joblib.load(paths["model"])
+            scaler = joblib.load(paths["scaler"])
+
+        with open(paths["features"], 'r') as f:
+            selected_features = tuple(json.load(f))
+
+        # Operators can override the rule table globally with ANUBIS_THREAT_RULES
+        threat_rules_file = os.environ.get("ANUBIS_THREAT_RULES", paths["threat_rules"])
+        threat_rules = ThreatRuleTable.from_config(Path(threat_rules_file))
+        
+        # Optional two-stage cascade, disabled globally with ANUBIS_CASCADE=0
+        cascade = None
+        if os.environ.get("ANUBIS_CASCADE", "1").lower() not in ("0", "false", "no"):
+            cascade = CascadeStage.from_config(paths["cascade"], selected_features)
+
+        return ModelBundle(
+            version=version,
+            model=model,
+            scaler=scaler,
+            selected_features=selected_features,
+            threat_rules=threat_rules,
+            source_dir=paths["dir"],
+            storage=self.mmap_mode if self.mmap_mode != "off" else "pickle",
+            load_seconds=time.perf_counter() - start_time,
+            cascade=cascade
+        )
+
+def synthetic_batch(bundle: ModelBundle, rows: int, seed: int = 0) -> np.ndarray:
+    """
+    Build a plausible raw input batch by sampling in the scaler's output space
+    """
+    rng = np.random.default_rng(seed)
+    scaled = rng.standard_normal((rows, len(bundle.selected_features)))
+    if hasattr(bundle.scaler, "inverse_transform"):
+        try:
+            return bundle.scaler.inverse_transform(scaled)
+        except Exception:
+            pass
+    return scaled
+
+def smoke_test_bundle(candidate: ModelBundle, reference: Optional[ModelBundle] = None, rows: int = 256, min_agreement: float = 0.0) -> Dict[str, Any]:
+    """
+    Warm up a candidate bundle with a synthetic batch and check it behaves
+    like a model we can serve. Raises ValueError if it doesn't.
+    """
+    batch = synthetic_batch(candidate, rows)
+
+    start_time = time.perf_counter()
+    scaled = candidate.scaler.transform(batch)
+    predictions = np.asarray(candidate.model.predict(scaled))
+    probabilities = np.asarray(candidate.model.predict_proba(scaled))
+    warmup_seconds = time.perf_counter() - start_time
+
+    if predictions.shape != (rows,):
+        raise ValueError(f"Unexpected prediction shape {predictions.shape}")
+    if probabilities.ndim != 2 or probabilities.shape[0] != rows or probabilities.shape[1] < 2:
+        raise ValueError(f"Unexpected probability shape {probabilities.shape}")
+    if not np.all(np.isfinite(probabilities)) or not np.allclose(probabilities.sum(axis=1), 1.0, atol=1e-3):
+        raise ValueError("Model probabilities are not a valid distribution")
+    if not set(np.unique(predictions).tolist()) <= {0, 1}:
+        raise ValueError(f"Model predicts unexpected classes {np.unique(predictions).tolist()}")
+
+    report = {
+        "version": candidate.version,
+        "warmup_rows": rows,
+        "warmup_seconds": warmup_seconds,
+        "attack_rate": float(np.mean(predictions == 1)),
+        "reference_version": reference.version if reference else None,
+        "agreement": None
+    }
+
+    # Parity against the bundle currently being served, on the same raw inputs
+    if reference is not None:
+        if tuple(reference.selected_features) != tuple(candidate.selected_features):
+            report["agreement"] = None
+            report["parity_note"] = "Feature set changed; parity check skipped"
+        else:
+            reference_predictions = reference.model.predict(reference.scaler.transform(batch))
+            agreement = float(np.mean(np.asarray(reference_predictions) == predictions))
+            report["agreement"] = agreement
+            if agreement < min_agreement:
+                raise ValueError(
+                    f"Parity check failed: {agreement:.1%} agreement with {reference.version}, "
+                    f"minimum is {min_agreement:.1%}"
+                )
+
+    return report
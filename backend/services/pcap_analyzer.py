@@ -1,18 +1,74 @@
 import os
+import shutil
 import tempfile
+import threading
+import time
 import pandas as pd
-import numpy as np
 import logging
 import asyncio
-from typing import Dict, List, Tuple, Any
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Any, Union
 from pathlib import Path
-import json
-from datetime import datetime
 import uuid
-from services.cicflow_extractor import cicflow_extractor
+from services.analysis_aggregator import AnalysisAggregator
+from services.cicflow_extractor import CICFlowExtractor, cicflow_extractor
+from services.feature_schema import FeaturePlan
+from services.flow_result_store import FlowResultWriter, flow_result_store
+from services.flow_table import StreamingFlowTable
+from models.prediction_models import PredictionBatch
 
 logger = logging.getLogger(__name__)
 
+CAPTURE_EXTENSIONS = ('.pcap', '.pcapng', '.cap')
+
+class AnalysisDeadlineExceeded(Exception):
+    """
+    Raised when an analysis is still running at its deadline
+    """
+
+@dataclass(frozen=True)
+class AnalysisLimits:
+    deadline_seconds: Optional[float] = None  # Wall-clock limit for reading and scoring the capture
+    memory_budget_bytes: Optional[int] = None  # Flow table size at which the analysis switches to sampling
+
+# Feature extraction processes shared by every analysis (and spool ingestion) in this process
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+_extraction_pool_lock = threading.Lock()
+
+def extraction_pool() -> ProcessPoolExecutor:
+    """
+    The process's extraction pool, started and warmed up on first use so
+    analyses never wait for worker processes to start
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            workers = cicflow_extractor.max_workers
+            _extraction_pool = ProcessPoolExecutor(max_workers=workers)
+            for _ in range(workers):
+                _extraction_pool.submit(CICFlowExtractor._process_flow_chunk, [])
+            logger.info(f"Started {workers} flow extraction processes")
+        return _extraction_pool
+
+def reset_extraction_pool(pool: ProcessPoolExecutor):
+    """
+    Replace a pool whose worker died: the next analysis starts a fresh one
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is pool:
+            _extraction_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_extraction_pool():
+    global _extraction_pool
+    with _extraction_pool_lock:
+        pool, _extraction_pool = _extraction_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
 class PcapAnalyzer:
     """
     Service for analyzing network packet files using cicflowmeter
@@ -22,10 +78,79 @@ class PcapAnalyzer:
         # Automatically uses the correct temp folder for the OS
         self.temp_dir = Path(tempfile.gettempdir()) / "anubis_pcap"
         self.temp_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Streaming pipeline: finished flows move between stages in chunks
+        # through bounded queues, so a slow stage throttles the ones before it
+        self.chunk_flows = int(os.environ.get("ANUBIS_PIPELINE_CHUNK_FLOWS", "2000"))
+        self.queue_size = int(os.environ.get("ANUBIS_PIPELINE_QUEUE_SIZE", "4"))
+        # Progress is also reported on this interval between scored chunks
+        self.progress_interval = float(os.environ.get("ANUBIS_PROGRESS_SECONDS", "1.0"))
+        
+        # Limits applied to every analysis unless the caller passes its own (0 disables either)
+        self.default_limits = AnalysisLimits(
+            deadline_seconds=float(os.environ.get("ANUBIS_ANALYSIS_DEADLINE_SECONDS", "3600")) or None,
+            memory_budget_bytes=int(float(os.environ.get("ANUBIS_ANALYSIS_MEMORY_MB", "1024")) * 1024 ** 2) or None
+        )
+        
+        # Captures up to this size are analyzed straight from memory, without a temp file
+        self.in_memory_max_bytes = int(os.environ.get("ANUBIS_INMEMORY_MAX_BYTES", 10 * 1024 * 1024))
     
-    async def analyze_pcap_file(self, file_content: bytes, filename: str, analysis_id: str = None) -> Dict[str, Any]:
+    async def analyze_pcap_file(
+        self,
+        file_content: bytes,
+        filename: str,
+        analysis_id: str = None,
+        progress_callback: Callable[[Dict[str, Any]], None] = None,
+        store_flows: bool = False,
+        limits: AnalysisLimits = None
+    ) -> Dict[str, Any]:
         """
-        Complete pipeline for analyzing a pcap/pcapng file
+        Complete pipeline for analyzing a pcap/pcapng file held in memory.
+        Small captures are parsed straight from the buffer; larger ones are
+        written to the analysis temp dir first.
+        """
+        if not analysis_id:
+            analysis_id = str(uuid.uuid4())
+        
+        if len(file_content) <= self.in_memory_max_bytes:
+            try:
+                self._validate_extension(filename)
+                logger.info(f"Starting in-memory analysis {analysis_id} for file: {filename}")
+                return await self._analyze_source(
+                    memoryview(file_content), filename, analysis_id, progress_callback, store_flows, limits
+                )
+            except Exception as e:
+                logger.error(f"Analysis {analysis_id} failed: {str(e)}")
+                raise Exception(f"Analysis failed: {str(e)}")
+        
+        try:
+            # Save uploaded file temporarily
+            temp_file_path = await self._save_temp_file(file_content, filename, analysis_id)
+        except Exception as e:
+            logger.error(f"Analysis {analysis_id} failed: {str(e)}")
+            await self._cleanup_temp_files(analysis_id)
+            raise Exception(f"Analysis failed: {str(e)}")
+        
+        return await self.analyze_pcap_path(
+            temp_file_path, filename, analysis_id, progress_callback, store_flows, limits
+        )
+    
+    async def analyze_pcap_path(
+        self,
+        pcap_file: Path,
+        filename: str,
+        analysis_id: str = None,
+        progress_callback: Callable[[Dict[str, Any]], None] = None,
+        store_flows: bool = False,
+        limits: AnalysisLimits = None
+    ) -> Dict[str, Any]:
+        """
+        Complete pipeline for analyzing a pcap/pcapng file already on disk
+        (e.g. spooled by the upload endpoint). The analysis temp dir is removed afterwards.
+        progress_callback, if given, receives progress counters (bytes, packets, flows finished and
+        scored, ETA) every progress_interval seconds, plus partial results after every scored chunk.
+        With store_flows, every flow's result is kept in the flow result store.
+        limits (default: default_limits) bound the analysis' run time and flow table memory.
         """
         if not analysis_id:
             analysis_id = str(uuid.uuid4())
@@ -33,27 +158,65 @@ class PcapAnalyzer:
         logger.info(f"Starting analysis {analysis_id} for file: {filename}")
         
         try:
-            # Step 1: Save uploaded file temporarily
-            temp_file_path = await self._save_temp_file(file_content, filename, analysis_id)
+            results = await self._analyze_source(
+                pcap_file, filename, analysis_id, progress_callback, store_flows, limits
+            )
             
-            # Step 2: Extract flow features using cicflowmeter
-            flow_features_df = await self._extract_flow_features(temp_file_path, analysis_id)
+            # Cleanup temporary files
+            await self._cleanup_temp_files(analysis_id)
+            return results
             
-            # Step 3: Preprocess the data
-            processed_data = await self._preprocess_data(flow_features_df)
+        except Exception as e:
+            logger.error(f"Analysis {analysis_id} failed: {str(e)}")
+            await self._cleanup_temp_files(analysis_id)
+            raise Exception(f"Analysis failed: {str(e)}")
+    
+    async def analyze_pcap_batch(
+        self,
+        captures_dir: Path,
+        name: str,
+        analysis_id: str = None,
+        progress_callback: Callable[[Dict[str, Any]], None] = None,
+        store_flows: bool = False,
+        limits: AnalysisLimits = None
+    ) -> Dict[str, Any]:
+        """
+        Analyze every capture in a directory (e.g. one batch upload) as one
+        traffic stream, in the order they start. Flows still open at the end
+        of one capture carry over into the next, so connections split across
+        files by a rotating capture are stitched back together. Results cover
+        the whole batch, plus a per-capture report under 'captures' (each flow
+        counted in the capture it finished in). Arguments as for analyze_pcap_path.
+        """
+        if not analysis_id:
+            analysis_id = str(uuid.uuid4())
+        
+        logger.info(f"Starting batch analysis {analysis_id} for {name}")
+        
+        try:
+            captures = [
+                path for path in sorted(captures_dir.iterdir())
+                if path.is_file() and path.suffix.lower() in CAPTURE_EXTENSIONS
+            ]
+            if not captures:
+                raise ValueError("No capture files in batch")
             
-            # Step 4: Get AI model predictions
-            predictions = await self._get_model_predictions(processed_data)
+            loop = asyncio.get_running_loop()
+            start_times = await loop.run_in_executor(
+                None, lambda: [cicflow_extractor.capture_start_time(path) for path in captures]
+            )
+            # Captures without a readable start go last, by name
+            captures = [
+                path for _, path in sorted(
+                    zip(start_times, captures), key=lambda item: (item[0] is None, item[0] or 0.0, item[1].name)
+                )
+            ]
             
-            # Step 5: Generate analysis results
-            results = await self._generate_analysis_results(
-                flow_features_df, processed_data, predictions, filename, analysis_id
+            results = await self._analyze_source(
+                captures, name, analysis_id, progress_callback, store_flows, limits
             )
             
-            # Step 6: Cleanup temporary files
             await self._cleanup_temp_files(analysis_id)
-            
-            logger.info(f"Analysis {analysis_id} completed successfully")
             return results
             
         except Exception as e:
@@ -61,147 +224,289 @@ class PcapAnalyzer:
             await self._cleanup_temp_files(analysis_id)
             raise Exception(f"Analysis failed: {str(e)}")
     
-    async def _save_temp_file(self, file_content: bytes, filename: str, analysis_id: str) -> Path:
+    async def _analyze_source(
+        self,
+        source: Union[Path, memoryview, List[Path]],
+        filename: str,
+        analysis_id: str,
+        progress_callback: Callable[[Dict[str, Any]], None] = None,
+        store_flows: bool = False,
+        limits: AnalysisLimits = None
+    ) -> Dict[str, Any]:
         """
-        Save uploaded file to temporary directory
+        Stream packets -> flows -> features -> predictions -> running aggregates
+        (and, with store_flows, the per-flow result table). A list of captures
+        is read in order into one flow table, with a report per capture.
         """
+        loop = asyncio.get_running_loop()
+        limits = limits or self.default_limits
+        sources = source if isinstance(source, list) else [source]
+        aggregator = AnalysisAggregator()
+        capture_aggregators = [AnalysisAggregator(detail_limit=0, top_k=10) for _ in sources] if len(sources) > 1 else None
+        flow_table = StreamingFlowTable(memory_budget=limits.memory_budget_bytes)
+        result_writer = flow_result_store.create(analysis_id) if store_flows else None
+        try:
+            try:
+                await self._run_streaming_pipeline(
+                    sources, aggregator, progress_callback, result_writer, flow_table, limits.deadline_seconds,
+                    capture_aggregators
+                )
+            except AnalysisDeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.error(f"Flow feature extraction failed: {str(e)}")
+                raise
+            
+            # A capture without any flows is reported as such (0 flows, CLEAN)
+            results = aggregator.finalize(filename, analysis_id)
+            results['statistics']['coverage'] = flow_table.coverage()
+            if capture_aggregators:
+                results['captures'] = [
+                    capture_aggregator.finalize(path.name, analysis_id)
+                    for path, capture_aggregator in zip(sources, capture_aggregators)
+                ]
+            if flow_table.sample_rate < 1.0:
+                logger.warning(
+                    f"Analysis {analysis_id} exceeded its memory budget and sampled "
+                    f"{flow_table.sample_rate:.1%} of new flows"
+                )
+            
+            if result_writer:
+                await loop.run_in_executor(None, result_writer.close)
+        except BaseException:
+            if result_writer:
+                result_writer.abort()
+            raise
+        
+        logger.info(f"Analysis {analysis_id} completed successfully")
+        return results
+    
+    def _validate_extension(self, filename: str) -> str:
         # Validate file extension
-        valid_extensions = ['.pcap', '.pcapng', '.cap']
         file_ext = Path(filename).suffix.lower()
         
-        if file_ext not in valid_extensions:
-            raise ValueError(f"Invalid file type. Supported types: {valid_extensions}")
+        if file_ext not in CAPTURE_EXTENSIONS:
+            raise ValueError(f"Invalid file type. Supported types: {list(CAPTURE_EXTENSIONS)}")
+        
+        return file_ext
+    
+    def input_path(self, analysis_id: str, filename: str) -> Path:
+        """
+        Path an analysis input file is stored at, in its own temp directory
+        """
+        file_ext = self._validate_extension(filename)
         
         # Create analysis-specific directory
         analysis_dir = self.temp_dir / analysis_id
         analysis_dir.mkdir(exist_ok=True)
         
-        # Save file
-        temp_file_path = analysis_dir / f"input{file_ext}"
+        return analysis_dir / f"input{file_ext}"
+    
+    async def _save_temp_file(self, file_content: bytes, filename: str, analysis_id: str) -> Path:
+        """
+        Save uploaded file to temporary directory
+        """
+        temp_file_path = self.input_path(analysis_id, filename)
         
-        with open(temp_file_path, 'wb') as f:
-            f.write(file_content)
+        # Blocking write, kept off the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, temp_file_path.write_bytes, file_content)
             
         logger.info(f"Saved {len(file_content)} bytes to {temp_file_path}")
         return temp_file_path
     
-    async def _extract_flow_features(self, pcap_file: Path, analysis_id: str) -> pd.DataFrame:
+    async def cleanup_analysis(self, analysis_id: str):
         """
-        Extract flow features using enhanced cicflow_extractor service
+        Remove an analysis' temp directory (e.g. after a rejected upload)
         """
-        logger.info(f"Extracting flow features from {pcap_file}")
-        
-        try:
-            # Use the enhanced cicflow_extractor service
-            output_dir = self.temp_dir / analysis_id / "features"
-            features_df = await cicflow_extractor.extract_features_from_pcap(pcap_file, output_dir)
-            
-            if features_df is not None and not features_df.empty:
-                logger.info(f"Extracted {len(features_df)} flow records using cicflow_extractor")
-                return features_df
-            else:
-                raise Exception("No features extracted by cicflow_extractor")
-            
-        except Exception as e:
-            logger.error(f"Flow feature extraction failed: {str(e)}")
-            # Fallback to mock data
-            logger.info("Using mock flow features as fallback")
-            return self._generate_mock_flow_features()
+        await self._cleanup_temp_files(analysis_id)
     
-    def _generate_mock_flow_features(self) -> pd.DataFrame:
+    async def _run_streaming_pipeline(
+        self,
+        sources: List[Union[Path, memoryview]],
+        aggregator: AnalysisAggregator,
+        progress_callback: Callable[[Dict[str, Any]], None] = None,
+        result_writer: FlowResultWriter = None,
+        flow_table: StreamingFlowTable = None,
+        deadline_seconds: float = None,
+        capture_aggregators: List[AnalysisAggregator] = None
+    ):
         """
-        Generate mock flow features for demonstration
-        This mimics cicflowmeter output structure
+        Run the analysis as overlapping stages connected by bounded queues:
+        a reader thread turns packets into finished flows, worker processes
+        extract their features and the scorer folds predictions into the
+        aggregator (and appends them to result_writer, if given).
+        
+        Several sources are read one after another into the same flow table,
+        only the last one flushing it; each chunk of flows is also folded into
+        the capture_aggregators entry of the source it finished in.
+        
+        Extraction runs in the process's shared pool. Every stage checks for
+        a stop between chunks; when the pipeline is cancelled, fails or runs
+        past deadline_seconds its queued chunks are cancelled, and chunks
+        already being extracted finish in the pool and are discarded.
         """
-        np.random.seed(42)
-        
-        # Common cicflowmeter features
-        num_flows = np.random.randint(50, 500)
-        
-        mock_data = {
-            'Flow ID': [f"192.168.1.{np.random.randint(1,255)}-{np.random.randint(1000,9999)}-8.8.8.8-{np.random.choice([80,443,53])}-{np.random.choice([6,17])}" for _ in range(num_flows)],
-            'Src IP': [f"192.168.1.{np.random.randint(1,255)}" for _ in range(num_flows)],
-            'Src Port': np.random.randint(1024, 65535, num_flows),
-            'Dst IP': np.random.choice(['8.8.8.8', '1.1.1.1', '208.67.222.222', '4.4.4.4'], num_flows),
-            'Dst Port': np.random.choice([80, 443, 53, 25, 110], num_flows),
-            'Protocol': np.random.choice([6, 17], num_flows),  # TCP=6, UDP=17
-            'Flow Duration': np.random.uniform(0.1, 300.0, num_flows),
-            'Tot Fwd Pkts': np.random.randint(1, 100, num_flows),
-            'Tot Bwd Pkts': np.random.randint(0, 50, num_flows),
-            'TotLen Fwd Pkts': np.random.randint(64, 1500, num_flows),
-            'TotLen Bwd Pkts': np.random.randint(0, 1000, num_flows),
-            'Fwd Pkt Len Max': np.random.randint(64, 1500, num_flows),
-            'Fwd Pkt Len Min': np.random.randint(20, 100, num_flows),
-            'Fwd Pkt Len Mean': np.random.uniform(100, 800, num_flows),
-            'Fwd Pkt Len Std': np.random.uniform(10, 200, num_flows),
-            'Bwd Pkt Len Max': np.random.randint(0, 1500, num_flows),
-            'Bwd Pkt Len Min': np.random.randint(0, 100, num_flows),
-            'Bwd Pkt Len Mean': np.random.uniform(0, 400, num_flows),
-            'Bwd Pkt Len Std': np.random.uniform(0, 100, num_flows),
-            'Flow Byts/s': np.random.uniform(100, 100000, num_flows),
-            'Flow Pkts/s': np.random.uniform(0.1, 100, num_flows),
-            'Flow IAT Mean': np.random.uniform(0, 1000, num_flows),
-            'Flow IAT Std': np.random.uniform(0, 500, num_flows),
-            'Flow IAT Max': np.random.uniform(0, 5000, num_flows),
-            'Flow IAT Min': np.random.uniform(0, 100, num_flows),
-            'Fwd IAT Tot': np.random.uniform(0, 10000, num_flows),
-            'Fwd IAT Mean': np.random.uniform(0, 1000, num_flows),
-            'Fwd IAT Std': np.random.uniform(0, 500, num_flows),
-            'Fwd IAT Max': np.random.uniform(0, 5000, num_flows),
-            'Fwd IAT Min': np.random.uniform(0, 100, num_flows),
-            'Bwd IAT Tot': np.random.uniform(0, 10000, num_flows),
-            'Bwd IAT Mean': np.random.uniform(0, 1000, num_flows),
-            'Bwd IAT Std': np.random.uniform(0, 500, num_flows),
-            'Bwd IAT Max': np.random.uniform(0, 5000, num_flows),
-            'Bwd IAT Min': np.random.uniform(0, 100, num_flows),
-            'Timestamp': [datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S') for _ in range(num_flows)]
-        }
-        
-        return pd.DataFrame(mock_data)
+        loop = asyncio.get_running_loop()
+        flow_table = flow_table if flow_table is not None else StreamingFlowTable()
+        flow_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        feature_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        stop_event = threading.Event()
+        capture_progress: List[Dict[str, Any]] = []  # Reader counters of every source started so far
+        bytes_total = sum(len(source) if isinstance(source, memoryview) else os.path.getsize(source) for source in sources)
+        workers = cicflow_extractor.max_workers
+        started = time.monotonic()
+        
+        def read_counters() -> Dict[str, Any]:
+            counters = {"bytes_total": bytes_total, "bytes_read": 0, "packets_read": 0, "flows_finished": 0}
+            for counts in list(capture_progress):
+                for key in ("bytes_read", "packets_read", "flows_finished"):
+                    counters[key] += counts.get(key, 0)
+            if len(sources) > 1:
+                counters.update({"captures_total": len(sources), "capture": len(capture_progress)})
+            return counters
+        
+        def report_progress(partial: bool):
+            # Flows are scored in roughly the order they are read, so the read position
+            # scaled by the share of finished flows already scored tracks the whole pipeline
+            progress = read_counters()
+            read_fraction = progress["bytes_read"] / progress["bytes_total"] if progress["bytes_total"] else 0.0
+            scored_fraction = aggregator.total_flows / progress["flows_finished"] if progress["flows_finished"] else 0.0
+            fraction_done = read_fraction * min(1.0, scored_fraction)
+            elapsed = time.monotonic() - started
+            update = {
+                **progress,
+                "flows_scored": aggregator.total_flows,
+                "flow_sample_rate": flow_table.sample_rate,
+                "memory_estimate_bytes": flow_table.memory_estimate(),
+                "fraction_done": fraction_done,
+                "elapsed_seconds": elapsed,
+                "eta_seconds": elapsed * (1 - fraction_done) / fraction_done if fraction_done > 0 else None
+            }
+            if partial:
+                update["partial"] = aggregator.snapshot()
+            progress_callback(update)
+        
+        def read_flows():
+            for capture, source in enumerate(sources):
+                if stop_event.is_set():
+                    return
+                counts: Dict[str, Any] = {}
+                capture_progress.append(counts)
+                # Flows still open at the end of a capture may continue in the next one
+                last = capture == len(sources) - 1
+                for flow_chunk in cicflow_extractor.iter_flow_chunks(
+                    source, self.chunk_flows, flow_table=flow_table, flush=last, progress=counts, stop_event=stop_event
+                ):
+                    # Blocks while the queue is full; gives up once the pipeline stops
+                    put = asyncio.run_coroutine_threadsafe(flow_queue.put((capture, flow_chunk)), loop)
+                    while True:
+                        try:
+                            put.result(timeout=0.5)
+                            break
+                        except FutureTimeoutError:
+                            if stop_event.is_set():
+                                put.cancel()
+                                return
+        
+        async def read_stage():
+            try:
+                await loop.run_in_executor(None, read_flows)
+            finally:
+                # After a stop nobody drains the queue, so a full one would block here forever
+                if not stop_event.is_set():
+                    for _ in range(workers):
+                        await flow_queue.put(None)
+        
+        async def extract_worker(executor: ProcessPoolExecutor):
+            while not stop_event.is_set():
+                item = await flow_queue.get()
+                if item is None:
+                    break
+                capture, flow_chunk = item
+                try:
+                    features = await loop.run_in_executor(executor, CICFlowExtractor._process_flow_chunk, flow_chunk)
+                except BrokenProcessPool:
+                    reset_extraction_pool(executor)
+                    raise
+                if features:
+                    await feature_queue.put((capture, pd.DataFrame(features)))
+        
+        async def extract_stage(executor: ProcessPoolExecutor):
+            try:
+                await asyncio.gather(*(extract_worker(executor) for _ in range(workers)))
+            finally:
+                if not stop_event.is_set():
+                    await feature_queue.put(None)
+        
+        async def score_stage():
+            plan, plan_checked = None, False
+            while not stop_event.is_set():
+                item = await feature_queue.get()
+                if item is None:
+                    break
+                capture, flow_features_df = item
+                if not plan_checked:
+                    plan, plan_checked = self._build_feature_plan(flow_features_df), True
+                predictions = await self._get_model_predictions(flow_features_df, plan)
+                first_index = aggregator.total_flows
+                aggregator.update(flow_features_df, predictions)
+                if capture_aggregators:
+                    capture_aggregators[capture].update(flow_features_df, predictions, first_index)
+                if result_writer:
+                    await loop.run_in_executor(None, result_writer.append, flow_features_df, predictions)
+                
+                if progress_callback:
+                    report_progress(partial=True)
+        
+        async def progress_stage():
+            # Keeps progress moving while the first chunks are still being read and extracted
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                report_progress(partial=False)
+        
+        executor = extraction_pool()
+        tasks = [
+            asyncio.create_task(read_stage()),
+            asyncio.create_task(extract_stage(executor)),
+            asyncio.create_task(score_stage())
+        ]
+        reporter = asyncio.create_task(progress_stage()) if progress_callback else None
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=deadline_seconds, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()  # Raises the stage's error, if any
+            if pending:
+                raise AnalysisDeadlineExceeded(f"Analysis did not finish within its {deadline_seconds:.0f}s deadline")
+        finally:
+            stop_event.set()
+            if reporter:
+                reporter.cancel()
+            # Cancelling the stages cancels their extraction futures still waiting in the pool
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        logger.info(
+            f"Streamed {read_counters()['packets_read']} packets into {aggregator.total_flows} flows "
+            f"in {aggregator.chunks} chunks"
+        )
     
-    async def _preprocess_data(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _build_feature_plan(self, flow_df: pd.DataFrame) -> Optional[FeaturePlan]:
         """
-        Preprocess the cicflowmeter output for model prediction
+        Validate the flow columns against the model's training schema, once per analysis
         """
-        logger.info("Preprocessing flow features for AI model")
-        
-        # Create a copy for processing
-        processed_df = df.copy()
-        
-        # Handle missing values
-        processed_df = processed_df.fillna(0)
-        
-        # Handle infinite values
-        processed_df = processed_df.replace([np.inf, -np.inf], 0)
-        
-        # Select numerical features commonly used in network security models
-        feature_columns = [
-            'Flow Duration', 'Tot Fwd Pkts', 'Tot Bwd Pkts', 'TotLen Fwd Pkts', 
-            'TotLen Bwd Pkts', 'Fwd Pkt Len Max', 'Fwd Pkt Len Min', 'Fwd Pkt Len Mean',
-            'Fwd Pkt Len Std', 'Bwd Pkt Len Max', 'Bwd Pkt Len Min', 'Bwd Pkt Len Mean',
-            'Bwd Pkt Len Std', 'Flow Byts/s', 'Flow Pkts/s', 'Flow IAT Mean',
-            'Flow IAT Std', 'Flow IAT Max', 'Flow IAT Min', 'Fwd IAT Tot',
-            'Fwd IAT Mean', 'Fwd IAT Std', 'Fwd IAT Max', 'Fwd IAT Min',
-            'Bwd IAT Tot', 'Bwd IAT Mean', 'Bwd IAT Std', 'Bwd IAT Max', 'Bwd IAT Min'
-        ]
-        
-        # Keep only available feature columns
-        available_features = [col for col in feature_columns if col in processed_df.columns]
-        
-        if not available_features:
-            raise Exception("No suitable features found in the data")
-        
-        # Extract feature matrix
-        feature_matrix = processed_df[available_features]
-        
-        # Basic normalization (you might want to use your training normalization parameters)
-        feature_matrix = (feature_matrix - feature_matrix.mean()) / (feature_matrix.std() + 1e-8)
-        feature_matrix = feature_matrix.fillna(0)
+        # Import here to avoid circular imports
+        from services.ai_model_service import ai_model_service
         
-        logger.info(f"Preprocessed {len(feature_matrix)} flows with {len(available_features)} features")
-        return feature_matrix
+        try:
+            plan = ai_model_service.feature_plan(list(flow_df.columns))
+            logger.info(f"Scoring with model {plan.bundle.version} using {len(plan.columns)} mapped features")
+            return plan
+        except Exception as e:
+            logger.error(f"AI model unavailable for this analysis: {str(e)}")
+            return None
     
-    async def _get_model_predictions(self, processed_data: pd.DataFrame) -> List[Dict[str, Any]]:
+    async def _get_model_predictions(self, flow_df: pd.DataFrame, plan: Optional[FeaturePlan]) -> PredictionBatch:
         """
         Get predictions from the AI model
         """
@@ -210,173 +515,33 @@ class PcapAnalyzer:
         # Import here to avoid circular imports
         from services.ai_model_service import ai_model_service
         
-        predictions = []
-        
         try:
-            # Process in batches for efficiency
-            batch_size = 100
-            for i in range(0, len(processed_data), batch_size):
-                batch = processed_data.iloc[i:i+batch_size]
-                
-                # Convert batch to list of feature dictionaries
-                batch_features = []
-                for _, row in batch.iterrows():
-                    features = row.to_dict()
-                    batch_features.append(features)
-                
-                # Get predictions from AI model service
-                batch_predictions = await ai_model_service.predict_batch_features(batch_features)
-                
-                # Convert AIModelOutput objects to dictionary format
-                for ai_output in batch_predictions:
-                    prediction = {
-                        'classification': ai_output.classification,
-                        'confidence': ai_output.confidence,
-                        'risk_score': ai_output.risk_score,
-                        'threat_type': ai_output.threat_type
-                    }
-                    predictions.append(prediction)
+            if plan is None:
+                raise Exception("No feature plan for this analysis")
+            
+            # Scoring is CPU-bound, keep it off the event loop
+            loop = asyncio.get_running_loop()
+            predictions = await loop.run_in_executor(None, ai_model_service.score_feature_frame, flow_df, plan)
         
         except Exception as e:
             logger.error(f"AI model prediction failed: {str(e)}")
-            logger.info("Falling back to mock predictions")
+            logger.info("Marking flows BENIGN with 0.5 confidence")
             
-            # Fallback to mock predictions
-            for _, row in processed_data.iterrows():
-                features = row.to_dict()
-                is_malicious = self._mock_prediction_logic(features)
-                
-                prediction = {
-                    'classification': 'ATTACK' if is_malicious else 'BENIGN',
-                    'confidence': np.random.uniform(0.8, 0.99),
-                    'risk_score': np.random.uniform(0.7, 1.0) if is_malicious else np.random.uniform(0.0, 0.3),
-                    'threat_type': np.random.choice(['DDoS', 'Port_Scan', 'Malware', 'Intrusion']) if is_malicious else None
-                }
-                predictions.append(prediction)
+            # No verdicts rather than made-up ones: the flows are still reported
+            predictions = PredictionBatch.fallback(len(flow_df))
         
         logger.info(f"Generated {len(predictions)} predictions")
         return predictions
     
-    def _mock_prediction_logic(self, features: Dict) -> bool:
-        """
-        Mock prediction logic - replace with actual model inference
-        """
-        # Simple heuristic based on flow characteristics
-        suspicious_conditions = [
-            features.get('Flow Pkts/s', 0) > 50,  # High packet rate
-            features.get('Flow Byts/s', 0) > 50000,  # High byte rate
-            features.get('Tot Fwd Pkts', 0) > 100,  # Too many forward packets
-            features.get('Flow Duration', 0) < 0.1,  # Very short flows
-        ]
-        
-        # If multiple conditions are met, classify as attack
-        return sum(suspicious_conditions) >= 2
-    
-    async def _generate_analysis_results(
-        self, 
-        flow_df: pd.DataFrame, 
-        processed_data: pd.DataFrame, 
-        predictions: List[Dict], 
-        filename: str, 
-        analysis_id: str
-    ) -> Dict[str, Any]:
-        """
-        Generate comprehensive analysis results
-        """
-        logger.info("Generating analysis results")
-        
-        # Count predictions
-        benign_count = sum(1 for p in predictions if p['classification'] == 'BENIGN')
-        malicious_count = sum(1 for p in predictions if p['classification'] == 'ATTACK')
-        
-        # Extract malicious IPs
-        malicious_ips = set()
-        for i, prediction in enumerate(predictions):
-            if prediction['classification'] == 'ATTACK' and i < len(flow_df):
-                src_ip = str(flow_df.iloc[i].get('Src IP', 'Unknown'))
-                dst_ip = str(flow_df.iloc[i].get('Dst IP', 'Unknown'))
-                malicious_ips.add(src_ip)
-                malicious_ips.add(dst_ip)
-        
-        # Remove 'Unknown' if present
-        malicious_ips.discard('Unknown')
-        
-        # Generate threat breakdown
-        threat_types = {}
-        for prediction in predictions:
-            if prediction['classification'] == 'ATTACK' and prediction['threat_type']:
-                threat_type = str(prediction['threat_type'])
-                threat_types[threat_type] = threat_types.get(threat_type, 0) + 1
-        
-        # Calculate risk score
-        overall_risk_score = float(np.mean([p['risk_score'] for p in predictions]))
-        
-        # Determine overall status
-        malicious_percentage = (malicious_count / len(predictions)) * 100 if predictions else 0
-        
-        if malicious_percentage > 20:
-            overall_status = "CRITICAL"
-        elif malicious_percentage > 10:
-            overall_status = "WARNING" 
-        elif malicious_percentage > 5:
-            overall_status = "SUSPICIOUS"
-        else:
-            overall_status = "CLEAN"
-        
-        results = {
-            'analysis_id': analysis_id,
-            'filename': filename,
-            'timestamp': datetime.utcnow().isoformat(),
-            'summary': {
-                'total_flows': int(len(predictions)),
-                'benign_flows': int(benign_count),
-                'malicious_flows': int(malicious_count),
-                'benign_percentage': float((benign_count / len(predictions)) * 100 if predictions else 0),
-                'malicious_percentage': float(malicious_percentage),
-                'overall_status': str(overall_status),
-                'overall_risk_score': float(overall_risk_score)
-            },
-            'threats': {
-                'malicious_ips': list(malicious_ips),
-                'threat_types': threat_types,
-                'top_threats': sorted(threat_types.items(), key=lambda x: x[1], reverse=True)[:5]
-            },
-            'detailed_results': [
-                {
-                    'flow_id': str(flow_df.iloc[i].get('Flow ID', f'Flow_{i}') if i < len(flow_df) else f'Flow_{i}'),
-                    'src_ip': str(flow_df.iloc[i].get('Src IP', 'Unknown') if i < len(flow_df) else 'Unknown'),
-                    'dst_ip': str(flow_df.iloc[i].get('Dst IP', 'Unknown') if i < len(flow_df) else 'Unknown'),
-                    'src_port': int(flow_df.iloc[i].get('Src Port', 0) if i < len(flow_df) else 0),
-                    'dst_port': int(flow_df.iloc[i].get('Dst Port', 0) if i < len(flow_df) else 0),
-                    'protocol': int(flow_df.iloc[i].get('Protocol', 0) if i < len(flow_df) else 0),
-                    'prediction': {
-                        'classification': str(prediction['classification']),
-                        'confidence': float(prediction['confidence']),
-                        'risk_score': float(prediction['risk_score']),
-                        'threat_type': str(prediction['threat_type']) if prediction['threat_type'] else None
-                    }
-                } for i, prediction in enumerate(predictions[:100])  # Limit to first 100 for performance
-            ],
-            'statistics': {
-                'average_confidence': float(np.mean([p['confidence'] for p in predictions])),
-                'flows_analyzed': int(len(predictions)),
-                'unique_src_ips': int(len(set(flow_df['Src IP'].tolist())) if 'Src IP' in flow_df.columns else 0),
-                'unique_dst_ips': int(len(set(flow_df['Dst IP'].tolist())) if 'Dst IP' in flow_df.columns else 0),
-                'analysis_duration': '< 1 minute'  # You can track actual duration
-            }
-        }
-        
-        return results
-    
     async def _cleanup_temp_files(self, analysis_id: str):
         """
         Clean up temporary files
         """
         try:
-            import shutil
             temp_dir = self.temp_dir / analysis_id
             if temp_dir.exists():
-                shutil.rmtree(temp_dir)
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, shutil.rmtree, temp_dir)
                 logger.info(f"Cleaned up temporary files for analysis {analysis_id}")
         except Exception as e:
             logger.warning(f"Failed to cleanup temp files for {analysis_id}: {str(e)}")
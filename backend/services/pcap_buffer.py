@@ -0,0 +1,110 @@
+import socket
+import struct
+from typing import Iterator, Optional, Tuple
+
+# Classic pcap magic -> (byte order, timestamp fraction unit)
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9)
+}
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+SUPPORTED_LINKTYPES = {LINKTYPE_NULL, LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL, LINKTYPE_IPV4}
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = (0x8100, 0x88a8)
+GLOBAL_HEADER_BYTES = 24
+RECORD_HEADER_BYTES = 16
+
+# (src_ip, dst_ip, protocol, src_port, dst_port, tcp_flags, timestamp, length)
+PacketFields = Tuple[str, str, int, int, int, int, float, int]
+
+def pcap_linktype(buffer: memoryview) -> Optional[int]:
+    """
+    Link type of a classic pcap buffer, or None if it is not one (e.g. pcapng)
+    """
+    if len(buffer) < GLOBAL_HEADER_BYTES:
+        return None
+    layout = PCAP_MAGIC.get(bytes(buffer[:4]))
+    if layout is None:
+        return None
+    return struct.unpack_from(layout[0] + 'I', buffer, 20)[0] & 0x0FFFFFFF
+
+def supports_buffer(buffer: memoryview) -> bool:
+    return pcap_linktype(buffer) in SUPPORTED_LINKTYPES
+
+def _ip_offset(buffer: memoryview, start: int, end: int, linktype: int) -> int:
+    """
+    Offset of the IPv4 header within a packet, or -1 if the packet is not IPv4
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        offset = start + 12
+        while offset + 2 <= end:
+            ethertype = (buffer[offset] << 8) | buffer[offset + 1]
+            if ethertype in ETHERTYPE_VLAN:
+                offset += 4
+                continue
+            return offset + 2 if ethertype == ETHERTYPE_IPV4 else -1
+        return -1
+    if linktype == LINKTYPE_LINUX_SLL:
+        if start + 16 > end:
+            return -1
+        return start + 16 if ((buffer[start + 14] << 8) | buffer[start + 15]) == ETHERTYPE_IPV4 else -1
+    if linktype == LINKTYPE_NULL:
+        # 4-byte address family in the capturing host's byte order; AF_INET is 2 everywhere
+        if start + 4 > end:
+            return -1
+        return start + 4 if buffer[start] == 2 or buffer[start + 3] == 2 else -1
+    return start
+
+def iter_buffer_packets(buffer: memoryview) -> Iterator[Tuple[int, Optional[PacketFields]]]:
+    """
+    Walk a classic pcap capture held in memory, decoding only the IPv4 and
+    TCP/UDP header fields flow extraction needs, straight from the buffer.
+    Yields (end offset, fields), with fields None for non-IPv4 packets.
+    """
+    linktype = pcap_linktype(buffer)
+    if linktype not in SUPPORTED_LINKTYPES:
+        raise ValueError("Not a classic pcap capture with a supported link type")
+
+    byte_order, fraction_unit = PCAP_MAGIC[bytes(buffer[:4])]
+    record_header = struct.Struct(byte_order + 'IIII')
+    ports = struct.Struct('>HH')
+    size = len(buffer)
+    position = GLOBAL_HEADER_BYTES
+
+    while position + RECORD_HEADER_BYTES <= size:
+        ts_sec, ts_fraction, captured_length, _ = record_header.unpack_from(buffer, position)
+        start = position + RECORD_HEADER_BYTES
+        end = start + captured_length
+        if end > size:
+            break  # Truncated last packet
+        position = end
+
+        ip = _ip_offset(buffer, start, end, linktype)
+        if ip < 0 or ip + 20 > end or buffer[ip] >> 4 != 4:
+            yield position, None
+            continue
+
+        header_length = (buffer[ip] & 0x0F) * 4
+        protocol = buffer[ip + 9]
+        src_ip = socket.inet_ntoa(buffer[ip + 12:ip + 16])
+        dst_ip = socket.inet_ntoa(buffer[ip + 16:ip + 20])
+        first_fragment = (((buffer[ip + 6] & 0x1F) << 8) | buffer[ip + 7]) == 0
+
+        src_port = dst_port = flags = 0
+        transport = ip + header_length
+        if first_fragment and protocol == 6 and transport + 14 <= end:
+            src_port, dst_port = ports.unpack_from(buffer, transport)
+            flags = ((buffer[transport + 12] & 0x01) << 8) | buffer[transport + 13]
+        elif first_fragment and protocol == 17 and transport + 4 <= end:
+            src_port, dst_port = ports.unpack_from(buffer, transport)
+
+        timestamp = ts_sec + ts_fraction * fraction_unit
+        yield position, (src_ip, dst_ip, protocol, src_port, dst_port, flags, timestamp, captured_length)
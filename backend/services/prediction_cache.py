@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class PredictionCache:
+    """
+    LRU/TTL cache for model predictions keyed by a hash of the quantized
+    model-input vector. Repetitive flows (DNS lookups, health checks,
+    keepalives) produce identical feature vectors and can skip inference.
+    """
+
+    def __init__(self, max_entries: int = 50000, ttl_seconds: float = 300.0, decimals: int = 3):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.decimals = decimals
+        self._entries: "OrderedDict[bytes, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on invalidation so in-flight writers from an older model are ignored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def make_keys(self, feature_matrix: np.ndarray) -> List[bytes]:
+        """
+        Hash each quantized row of the (unscaled) model-input matrix
+        """
+        quantized = np.round(np.asarray(feature_matrix, dtype=np.float64), self.decimals)
+        # Normalize -0.0 so it hashes like 0.0
+        quantized += 0.0
+        quantized = np.ascontiguousarray(quantized)
+        return [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in quantized]
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[Tuple[int, Any]]]:
+        """
+        Look up a batch of keys. Returns (prediction, probabilities) or None per key
+        """
+        now = time.monotonic()
+        results: List[Optional[Tuple[int, Any]]] = []
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+
+                stored_at, prediction, probabilities = entry
+                if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+                    del self._entries[key]
+                    self.expirations += 1
+                    self.misses += 1
+                    results.append(None)
+                    continue
+
+                self._entries.move_to_end(key)
+                self.hits += 1
+                results.append((prediction, probabilities))
+
+        return results
+
+    def put_many(self, keys: List[bytes], predictions: np.ndarray, probabilities: np.ndarray, generation: int):
+        """
+        Store a batch of predictions computed against the given cache generation
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            if generation != self.generation:
+                return
+
+            for key, prediction, probs in zip(keys, predictions, probabilities):
+                self._entries[key] = (now, int(prediction), probs.copy())
+                self._entries.move_to_end(key)
+
+            overflow = len(self._entries) - self.max_entries
+            for _ in range(max(0, overflow)):
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """
+        Drop every entry, e.g. after a new model has been loaded
+        """
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+        logger.info("Prediction cache invalidated")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
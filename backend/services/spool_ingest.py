@@ -0,0 +1,369 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from models.network_models import NetworkFlow, ScanResult, ScanSession
+from models.prediction_models import PredictionBatch
+from services.ai_model_service import ai_model_service
+from services.cicflow_extractor import CICFlowExtractor, cicflow_extractor
+from services.feature_schema import FeaturePlan
+from services.flow_table import FinishedFlow, StreamingFlowTable
+from services.latency_histogram import LatencyHistogram
+from services.pcap_analyzer import CAPTURE_EXTENSIONS, extraction_pool, pcap_analyzer
+from services.pcap_buffer import GLOBAL_HEADER_BYTES, supports_buffer
+
+logger = logging.getLogger(__name__)
+
+# MongoDB connection (history store)
+mongo_url = os.environ.get('MONGO_URL')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+PROTOCOL_NAMES = {1: "ICMP", 6: "TCP", 17: "UDP"}
+
+class SpoolIngestService:
+    """
+    Continuous analysis of rotating sensor captures (e.g. tcpdump -G) written
+    to a spool directory, without uploads.
+
+    Capture files are consumed in name order, which is capture order for
+    tcpdump's strftime file names. The newest file is tailed while the
+    sensor writes it: every poll reads the complete packets added since the
+    last one. A file counts as finished once a later one appears. One flow
+    table is kept across files, so open flows carry over from one file into
+    the next. Finished flows are extracted in the process's shared extraction pool,
+    scored and written to the scan history (one session per session_seconds).
+
+    After every increment the file and offset reached are checkpointed, and
+    a restart resumes there. Flows still open at a crash lose their earlier
+    packets, and the last increment may be recorded twice.
+    pcapng files cannot be tailed and are read whole once finished.
+    """
+
+    def __init__(
+        self,
+        spool_dir: Optional[Path],
+        checkpoint_file: Path,
+        poll_seconds: float = 1.0,
+        session_seconds: float = 3600.0,
+        user_id: str = "spool",
+        max_read_bytes: int = 64 * 1024 ** 2,
+        history_db: Any = None
+    ):
+        self.spool_dir = Path(spool_dir) if spool_dir else None
+        self.checkpoint_file = Path(checkpoint_file)
+        self.poll_seconds = poll_seconds
+        self.session_seconds = session_seconds
+        self.user_id = user_id
+        self.max_read_bytes = max_read_bytes
+
+        self.checkpoint: Dict[str, Any] = {"file": None, "offset": 0}
+        self.flow_table = StreamingFlowTable(memory_budget=pcap_analyzer.default_limits.memory_budget_bytes)
+        self.task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self.session: Optional[ScanSession] = None
+        self._lock_handle = None
+        self._plan: Optional[FeaturePlan] = None
+
+        self.files_finished = 0
+        self.packets_read = 0
+        self.flows_scored = 0
+        self.attacks = 0
+        self.lag_seconds: Optional[float] = None  # Wall clock minus the newest packet scored
+        self.increment_time = LatencyHistogram()
+        self.last_error: Optional[str] = None
+
+        # Scan history database (MONGO_URL by default); without one, verdicts are only counted
+        if history_db is None and mongo_url:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            history_db = AsyncIOMotorClient(mongo_url)[db_name]
+        self.db = history_db
+
+    @property
+    def enabled(self) -> bool:
+        return self.spool_dir is not None
+
+    def _acquire_lock(self) -> bool:
+        # Every uvicorn worker runs startup; only one of them may consume the spool
+        handle = open(self.checkpoint_file.with_suffix(".lock"), 'w')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._lock_handle = handle
+        return True
+
+    def _load_checkpoint(self):
+        if self.checkpoint_file.exists():
+            with open(self.checkpoint_file, 'r') as f:
+                self.checkpoint = json.load(f)
+
+    def _save_checkpoint(self):
+        self.checkpoint["updated_at"] = time.time()
+        tmp_file = self.checkpoint_file.with_suffix(".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def start(self) -> bool:
+        """
+        Start consuming the spool directory, if one is configured and no other process does
+        """
+        if not self.enabled:
+            return False
+        self.checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+        if not self._acquire_lock():
+            logger.info("Spool ingestion already running in another process")
+            return False
+
+        self._load_checkpoint()
+        # Started now, so the first flows do not wait for process start-up
+        extraction_pool()
+
+        self._stopping.clear()
+        self.task = asyncio.create_task(self._run())
+        logger.info(
+            f"Ingesting captures from {self.spool_dir} "
+            f"(resuming at {self.checkpoint['file'] or 'the first file'}, offset {self.checkpoint['offset']})"
+        )
+        return True
+
+    async def stop(self, timeout: float = 30.0):
+        """
+        Stop ingesting once the increment in progress is recorded (cancelled after timeout;
+        it is read again on restart). The flows still open are scored and the history session is closed.
+        """
+        if self.task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self.task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Spool ingestion did not stop in time; the last increment was cancelled")
+        self.task = None
+
+        try:
+            await self._score(self.flow_table.flush())
+            await self._close_session("STOPPED")
+        except Exception as e:
+            logger.error(f"Failed to finish spool ingestion: {str(e)}")
+        self._lock_handle.close()
+        logger.info(f"Stopped ingesting captures from {self.spool_dir}")
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.poll()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Spool ingestion failed: {str(e)}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _capture_files(self) -> List[Path]:
+        return sorted(
+            path for path in self.spool_dir.iterdir()
+            if path.is_file() and path.suffix.lower() in CAPTURE_EXTENSIONS
+        )
+
+    async def poll(self) -> int:
+        """
+        Consume whatever the sensor has written since the last poll; returns the number of flows scored
+        """
+        loop = asyncio.get_running_loop()
+        scored = 0
+        while not self._stopping.is_set():
+            files = await loop.run_in_executor(None, self._capture_files)
+            current = self.checkpoint["file"]
+            if current is None or current not in {path.name for path in files}:
+                # First run, or the current file was removed: continue with the next one
+                upcoming = [path for path in files if current is None or path.name > current]
+                if not upcoming:
+                    return scored
+                self.checkpoint = {"file": upcoming[0].name, "offset": 0}
+                current = upcoming[0].name
+
+            finished = any(path.name > current for path in files)
+            previous_offset = self.checkpoint["offset"]
+            started = time.monotonic()
+            offset, flows, caught_up = await loop.run_in_executor(
+                None, self._read_increment, self.spool_dir / current, self.checkpoint["offset"], finished
+            )
+            await self._score(flows)
+            scored += len(flows)
+            if flows or offset != self.checkpoint["offset"]:
+                self.increment_time.record(time.monotonic() - started, len(flows))
+
+            self.checkpoint["offset"] = offset
+            if finished and caught_up:
+                # The sensor has moved on; the file's open flows stay in the table for the next one
+                logger.info(f"Finished capture {current}")
+                self.files_finished += 1
+                later = [path.name for path in files if path.name > current]
+                self.checkpoint = {"file": later[0], "offset": 0}
+                self._save_checkpoint()
+                continue
+            self._save_checkpoint()
+            if caught_up:
+                return scored
+            if not flows and offset == previous_offset:
+                raise ValueError(f"Packet at offset {offset} of {current} is larger than the read window")
+            # More than one read window behind (e.g. a backlog): read the next one right away
+        return scored
+
+    def _read_increment(self, path: Path, offset: int, finished: bool) -> Tuple[int, List[FinishedFlow], bool]:
+        """
+        Feed a capture's new packets into the flow table (blocking, run in a thread).
+        Returns the offset reached, the flows that finished and whether the read got
+        to the end of the file as it was, leaving at most a partly written packet.
+        """
+        size = path.stat().st_size
+        if size < GLOBAL_HEADER_BYTES:
+            return offset, [], True
+        with open(path, 'rb') as f:
+            tailable = supports_buffer(memoryview(f.read(GLOBAL_HEADER_BYTES)))
+
+        if tailable:
+            # Everything up to size fits in this read window, so what the decoder leaves is a cut-off packet
+            caught_up = max(offset, GLOBAL_HEADER_BYTES) + self.max_read_bytes >= size
+            records = cicflow_extractor.iter_packet_records_from(path, offset, self.max_read_bytes)
+        elif finished:
+            caught_up = True
+            records = ((size, parsed) for _, parsed in cicflow_extractor._iter_packet_records(path))
+        else:
+            return offset, [], True
+
+        flows: List[FinishedFlow] = []
+        for packets, (position, parsed) in enumerate(records, 1):
+            offset = position
+            if parsed is not None:
+                self.flow_table.add(*parsed)
+            if packets % cicflow_extractor.batch_size == 0:
+                flows.extend(self.flow_table.expire())
+            self.packets_read += 1
+        flows.extend(self.flow_table.expire())
+        return offset, flows, caught_up
+
+    async def _score(self, flows: List[FinishedFlow]):
+        """
+        Extract features in the warm pool, score them and record the verdicts
+        """
+        if not flows:
+            return
+        loop = asyncio.get_running_loop()
+        chunk_flows = pcap_analyzer.chunk_flows
+        feature_chunks = await asyncio.gather(*(
+            loop.run_in_executor(extraction_pool(), CICFlowExtractor._process_flow_chunk, flows[i:i + chunk_flows])
+            for i in range(0, len(flows), chunk_flows)
+        ))
+        features = [row for chunk in feature_chunks for row in chunk]
+        if not features:
+            return
+
+        flow_df = pd.DataFrame(features)
+        if self._plan is None or self._plan.bundle.version != ai_model_service.registry.active_version():
+            self._plan = pcap_analyzer._build_feature_plan(flow_df)
+        predictions = await pcap_analyzer._get_model_predictions(flow_df, self._plan)
+        await self._record(flow_df, predictions)
+
+    async def _record(self, flow_df: pd.DataFrame, predictions: PredictionBatch):
+        """
+        Write scored flows to the scan history, as the live scanner does
+        """
+        if self.session is None or (datetime.utcnow() - self.session.start_time).total_seconds() >= self.session_seconds:
+            await self._close_session("COMPLETED")
+            self.session = ScanSession(user_id=self.user_id, settings={"source": "spool", "spool_dir": str(self.spool_dir)})
+            if self.db is not None:
+                await self.db.scan_sessions.insert_one(self.session.dict())
+
+        records = flow_df.to_dict('records')
+        results = [
+            ScanResult(
+                network_flow=NetworkFlow(
+                    src_ip=str(record.get('Src IP', 'Unknown')),
+                    src_port=int(record.get('Src Port', 0)),
+                    dst_ip=str(record.get('Dst IP', 'Unknown')),
+                    dst_port=int(record.get('Dst Port', 0)),
+                    protocol=PROTOCOL_NAMES.get(int(record.get('Protocol', 0)), str(record.get('Protocol', 0))),
+                    flow_duration=float(record.get('Flow Duration', 0)) / 1_000_000,
+                    total_bytes=int(record.get('TotLen Fwd Pkts', 0) + record.get('TotLen Bwd Pkts', 0)),
+                    packet_count=int(record.get('Tot Fwd Pkts', 0) + record.get('Tot Bwd Pkts', 0)),
+                    timestamp=datetime.utcfromtimestamp(float(record.get('Timestamp', 0)))
+                ),
+                ai_prediction=prediction,
+                scan_id=self.session.id
+            )
+            for record, prediction in zip(records, predictions.to_outputs())
+        ]
+
+        attacks = int(predictions.is_attack.sum())
+        self.flows_scored += len(results)
+        self.attacks += attacks
+        self.session.total_flows += len(results)
+        self.session.attack_count += attacks
+        self.session.benign_count += len(results) - attacks
+        if 'Timestamp' in flow_df.columns:
+            self.lag_seconds = time.time() - float(flow_df['Timestamp'].max())
+
+        if self.db is not None:
+            await self.db.scan_results.insert_many([result.dict() for result in results])
+            await self.db.scan_sessions.update_one(
+                {"id": self.session.id},
+                {"$set": {
+                    "total_flows": self.session.total_flows,
+                    "benign_count": self.session.benign_count,
+                    "attack_count": self.session.attack_count
+                }}
+            )
+
+    async def _close_session(self, status: str):
+        if self.session is None:
+            return
+        self.session.status = status
+        self.session.end_time = datetime.utcnow()
+        if self.db is not None:
+            await self.db.scan_sessions.update_one(
+                {"id": self.session.id},
+                {"$set": {"status": status, "end_time": self.session.end_time}}
+            )
+        logger.info(f"Closed spool session {self.session.id}: {self.session.total_flows} flows, {self.session.attack_count} attacks")
+        self.session = None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self.task is not None,
+            "spool_dir": str(self.spool_dir) if self.spool_dir else None,
+            "current_file": self.checkpoint["file"],
+            "offset": self.checkpoint["offset"],
+            "files_finished": self.files_finished,
+            "packets_read": self.packets_read,
+            "open_flows": len(self.flow_table),
+            "flows_scored": self.flows_scored,
+            "attacks": self.attacks,
+            "session_id": self.session.id if self.session else None,
+            "lag_seconds": self.lag_seconds,
+            "increment_time": self.increment_time.get_stats(),
+            "last_error": self.last_error
+        }
+
+# Global instance; ingestion is off unless ANUBIS_SPOOL_DIR is set
+spool_ingest_service = SpoolIngestService(
+    os.environ.get("ANUBIS_SPOOL_DIR") or None,
+    Path(os.environ.get("ANUBIS_SPOOL_CHECKPOINT", Path(tempfile.gettempdir()) / "anubis_pcap" / "spool_checkpoint.json")),
+    poll_seconds=float(os.environ.get("ANUBIS_SPOOL_POLL_SECONDS", 1.0)),
+    session_seconds=float(os.environ.get("ANUBIS_SPOOL_SESSION_SECONDS", 3600)),
+    user_id=os.environ.get("ANUBIS_SPOOL_USER_ID", "spool")
+)
@@ -0,0 +1,136 @@
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Heuristic threat typing for flows the model classified as ATTACK.
+# Rules are evaluated in order and the first match wins.
+DEFAULT_THREAT_RULES: List[Dict[str, Any]] = [
+    {"threat_type": "Brute_Force", "ports": [22, 23]},  # SSH, Telnet
+    {"threat_type": "DDoS", "ports": [80, 443, 8080], "min_packet_rate": 100},  # HTTP/HTTPS floods
+    {"threat_type": "Web_Attack", "ports": [80, 443, 8080]},
+    {"threat_type": "Lateral_Movement", "ports": [135, 139, 445]},  # SMB, NetBIOS
+    {"threat_type": "High_Confidence_Attack", "min_confidence": 0.9}
+]
+DEFAULT_THREAT_TYPE = "Suspicious_Activity"
+
+def rule_packet_rates(packet_rates: np.ndarray, durations: np.ndarray, packets: np.ndarray) -> np.ndarray:
+    """
+    Packet rates as the rules see them. The extractor reports 0 packets/s for
+    a flow whose packets all share one timestamp (zero duration); several
+    packets in no measurable time are the fastest flow there is, so they get +inf.
+    """
+    rates = np.array(packet_rates, dtype=np.float64)
+    burst = (np.asarray(durations, dtype=np.float64) <= 0) & (np.asarray(packets, dtype=np.float64) > 1)
+    rates[burst] = np.inf
+    return rates
+
+class ThreatRuleTable:
+    """
+    Ordered rule table mapping attack flows to threat types, evaluated
+    with vectorized selects over a whole prediction batch.
+
+    Each rule may constrain:
+      - ports: destination port must be one of these
+      - min_packet_rate: Flow Pkts/s must be strictly greater
+      - min_confidence: model confidence must be strictly greater
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]] = None, default_threat_type: str = DEFAULT_THREAT_TYPE):
+        self.rules = [self._validate_rule(rule) for rule in (rules if rules is not None else DEFAULT_THREAT_RULES)]
+        self.default_threat_type = default_threat_type
+
+        # Code i -> label; the default label always takes the last code
+        self.labels: List[str] = []
+        for rule in self.rules:
+            if rule["threat_type"] not in self.labels:
+                self.labels.append(rule["threat_type"])
+        if default_threat_type not in self.labels:
+            self.labels.append(default_threat_type)
+        self._label_codes = {label: code for code, label in enumerate(self.labels)}
+        self._rule_codes = np.array([self._label_codes[rule["threat_type"]] for rule in self.rules], dtype=np.int16)
+        self.default_code = self._label_codes[default_threat_type]
+
+    @classmethod
+    def from_config(cls, config_path: Optional[Path]) -> "ThreatRuleTable":
+        """
+        Load a rule table from a JSON file, falling back to the built-in rules
+        """
+        if config_path is None or not Path(config_path).exists():
+            return cls()
+
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+
+            # Either a bare list of rules or {"rules": [...], "default_threat_type": "..."}
+            if isinstance(config, list):
+                table = cls(config)
+            else:
+                table = cls(
+                    config.get("rules", DEFAULT_THREAT_RULES),
+                    config.get("default_threat_type", DEFAULT_THREAT_TYPE)
+                )
+
+            logger.info(f"Loaded {len(table.rules)} threat rules from {config_path}")
+            return table
+
+        except Exception as e:
+            logger.error(f"Failed to load threat rules from {config_path}: {str(e)}. Using defaults")
+            return cls()
+
+    @staticmethod
+    def _validate_rule(rule: Dict[str, Any]) -> Dict[str, Any]:
+        if not rule.get("threat_type"):
+            raise ValueError(f"Threat rule is missing 'threat_type': {rule}")
+
+        unknown = set(rule) - {"threat_type", "ports", "min_packet_rate", "min_confidence"}
+        if unknown:
+            raise ValueError(f"Unknown threat rule keys {sorted(unknown)} in {rule}")
+
+        validated = {"threat_type": str(rule["threat_type"])}
+        if rule.get("ports") is not None:
+            validated["ports"] = np.asarray(rule["ports"], dtype=np.int64)
+        if rule.get("min_packet_rate") is not None:
+            validated["min_packet_rate"] = float(rule["min_packet_rate"])
+        if rule.get("min_confidence") is not None:
+            validated["min_confidence"] = float(rule["min_confidence"])
+        return validated
+
+    def classify_codes(self, dst_ports: np.ndarray, packet_rates: np.ndarray, confidences: np.ndarray) -> np.ndarray:
+        """
+        Get the threat-type code for every row of a batch
+        """
+        dst_ports = np.nan_to_num(np.asarray(dst_ports, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0).astype(np.int64)
+        # An infinite rate (zero-duration burst, see rule_packet_rates) must still pass min_packet_rate
+        packet_rates = np.nan_to_num(
+            np.asarray(packet_rates, dtype=np.float64), nan=0.0, posinf=np.finfo(np.float64).max, neginf=0.0
+        )
+        confidences = np.asarray(confidences, dtype=np.float64)
+
+        if not self.rules:
+            return np.full(len(dst_ports), self.default_code, dtype=np.int16)
+
+        conditions = []
+        for rule in self.rules:
+            condition = np.ones(len(dst_ports), dtype=bool)
+            if "ports" in rule:
+                condition &= np.isin(dst_ports, rule["ports"])
+            if "min_packet_rate" in rule:
+                condition &= packet_rates > rule["min_packet_rate"]
+            if "min_confidence" in rule:
+                condition &= confidences > rule["min_confidence"]
+            conditions.append(condition)
+
+        return np.select(conditions, self._rule_codes, default=self.default_code).astype(np.int16)
+
+    def classify(self, dst_ports: np.ndarray, packet_rates: np.ndarray, confidences: np.ndarray) -> np.ndarray:
+        """
+        Get the threat-type label for every row of a batch
+        """
+        codes = self.classify_codes(dst_ports, packet_rates, confidences)
+        return np.asarray(self.labels, dtype=object)[codes]
@@ -0,0 +1,480 @@
+import asyncio
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Several GB by default; uploads are streamed to disk so memory use does not grow with size
+MAX_UPLOAD_BYTES = int(os.environ.get("ANUBIS_MAX_UPLOAD_BYTES", 8 * 1024 ** 3))
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+# Resumable uploads: suggested and maximum chunk size, and how long an idle upload is kept
+CHUNK_SIZE_BYTES = int(os.environ.get("ANUBIS_UPLOAD_CHUNK_BYTES", 16 * 1024 ** 2))
+MAX_CHUNK_BYTES = 64 * 1024 ** 2
+UPLOAD_EXPIRY_SECONDS = float(os.environ.get("ANUBIS_UPLOAD_EXPIRY_SECONDS", 24 * 3600))
+
+# Allowance for the multipart boundaries and part headers around an uploaded file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+class UploadTooLarge(ValueError):
+    """
+    Raised when an upload exceeds its size limit while being spooled
+    """
+
+class UploadError(ValueError):
+    """
+    Raised for invalid chunked upload operations (bad offset, checksum mismatch, incomplete upload)
+    """
+
+@dataclass(frozen=True)
+class SpooledUpload:
+    path: Path
+    size: int
+    sha256: str
+
+async def spool_upload(upload: UploadFile, destination: Path, max_bytes: int = None) -> SpooledUpload:
+    """
+    Stream an upload to disk in fixed-size chunks (see spool_stream)
+    """
+    async def pieces():
+        while True:
+            chunk = await upload.read(SPOOL_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+    return await spool_stream(pieces(), destination, max_bytes)
+
+async def spool_stream(pieces: AsyncIterator[bytes], destination: Path, max_bytes: int = None) -> SpooledUpload:
+    """
+    Write a stream of body pieces to disk, enforcing the size limit
+    and computing the SHA-256 on the fly. Writes run in a worker thread so the
+    event loop never blocks on disk. The partial file is removed on failure.
+    """
+    max_bytes = max_bytes if max_bytes is not None else MAX_UPLOAD_BYTES
+    loop = asyncio.get_running_loop()
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(destination, 'wb') as f:
+            async for chunk in pieces:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File too large. Maximum size is {format_size(max_bytes)}")
+
+                digest.update(chunk)
+                await loop.run_in_executor(None, f.write, chunk)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+
+    logger.info(f"Spooled {size} bytes to {destination}")
+    return SpooledUpload(path=destination, size=size, sha256=digest.hexdigest())
+
+def check_content_length(content_length: Optional[str], max_bytes: int = None):
+    """
+    Reject a multipart upload whose declared body size already exceeds the
+    limit, before any of it is read
+    """
+    max_bytes = max_bytes if max_bytes is not None else MAX_UPLOAD_BYTES
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLarge(f"File too large. Maximum size is {format_size(max_bytes)}")
+
+class MultipartUpload:
+    """
+    The file field of a multipart/form-data request body, parsed as the body
+    arrives. Unlike UploadFile the form is not spooled first, so the file
+    goes straight from the socket to where it is analyzed, and nothing is
+    read until the caller asks for it. Other fields are skipped; a field
+    repeated for several files is read one file after another with next_file.
+    """
+
+    def __init__(self, body: AsyncIterator[bytes], content_type: Optional[str], field_name: str = "file"):
+        mime_type, options = parse_options_header(content_type or "")
+        if mime_type != b"multipart/form-data" or not options.get(b"boundary"):
+            raise UploadError("Expected a multipart/form-data upload")
+
+        self.filename: Optional[str] = None
+        self._body = body.__aiter__()
+        self._field_name = field_name.encode()
+        self._events: Deque[Tuple[str, Any]] = deque()
+        self._header = [b"", b""]
+        self._headers: Dict[bytes, bytes] = {}
+        self._in_file = False
+
+        def on_header_field(data, start, end):
+            self._header[0] += data[start:end]
+
+        def on_header_value(data, start, end):
+            self._header[1] += data[start:end]
+
+        def on_header_end():
+            self._headers[self._header[0].lower()] = self._header[1]
+            self._header = [b"", b""]
+
+        def on_headers_finished():
+            self._events.append(("headers", self._headers))
+            self._headers = {}
+
+        def on_part_data(data, start, end):
+            self._events.append(("data", data[start:end]))
+
+        def on_part_end():
+            self._events.append(("end", None))
+
+        self._parser = MultipartParser(options[b"boundary"], callbacks={
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end
+        })
+
+    async def _next_event(self) -> Optional[Tuple[str, Any]]:
+        while not self._events:
+            try:
+                chunk = await self._body.__anext__()
+            except StopAsyncIteration:
+                return None
+            try:
+                self._parser.write(chunk)
+            except ValueError as e:
+                raise UploadError(f"Malformed upload: {str(e)}")
+        return self._events.popleft()
+
+    async def open(self) -> str:
+        """
+        Read up to the start of the file's content and return its filename
+        """
+        filename = await self.next_file()
+        if filename is None:
+            raise UploadError(f"No '{self._field_name.decode()}' file in upload")
+        return filename
+
+    async def next_file(self) -> Optional[str]:
+        """
+        Read up to the start of the next file's content and return its filename,
+        or None at the end of the body. Unread content of the current file is skipped.
+        """
+        self._in_file = False
+        while True:
+            event = await self._next_event()
+            if event is None:
+                return None
+
+            kind, headers = event
+            if kind != "headers":
+                continue
+            _, options = parse_options_header(headers.get(b"content-disposition", b""))
+            if options.get(b"name") == self._field_name:
+                self._in_file = True
+                self.filename = options.get(b"filename", b"").decode('utf-8', errors='replace')
+                return self.filename
+
+    async def pieces(self) -> AsyncIterator[bytes]:
+        """
+        The file's content, as it arrives (after open)
+        """
+        while self._in_file:
+            event = await self._next_event()
+            if event is None:
+                raise UploadError("Upload ended before the file was complete")
+
+            kind, data = event
+            if kind == "data":
+                yield data
+            elif kind == "end":
+                self._in_file = False
+
+def format_size(size: float) -> str:
+    """
+    Size in the style of the API's error messages, e.g. "100MB"
+    """
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.0f}GB"
+
+def merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    """
+    Merge overlapping or adjacent [start, end) byte ranges
+    """
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+class ChunkedUploadManager:
+    """
+    Resumable chunked uploads for large captures.
+
+    Each upload is a spool file plus a JSON manifest of the byte ranges
+    received so far. Each chunk is spooled to its own file and verified,
+    then copied in place at its offset, so chunks can arrive in any order
+    and a failed chunk is simply sent again without touching what was
+    already received. The manifest is rewritten atomically after every verified chunk, so uploads
+    also survive a server restart. On finalize the spool file is moved (not
+    copied, unless the analysis directory is on another filesystem) to where
+    the analysis reads it. File I/O runs in worker threads.
+    """
+
+    def __init__(self, spool_dir: Path):
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _paths(self, upload_id: str) -> Dict[str, Path]:
+        # Upload ids are generated here; refuse anything that could escape the spool dir
+        if not upload_id or os.path.basename(upload_id) != upload_id or upload_id.startswith('.'):
+            raise KeyError(upload_id)
+        return {
+            "data": self.spool_dir / f"{upload_id}.part",
+            "manifest": self.spool_dir / f"{upload_id}.json"
+        }
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(upload_id, asyncio.Lock())
+
+    async def _run(self, func, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        manifest_file = self._paths(upload_id)["manifest"]
+        if not manifest_file.exists():
+            raise KeyError(upload_id)
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+
+    def _save(self, manifest: Dict[str, Any]):
+        manifest_file = self._paths(manifest["upload_id"])["manifest"]
+        tmp_file = manifest_file.with_suffix(".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_file, manifest_file)
+
+    @staticmethod
+    def _status(manifest: Dict[str, Any]) -> Dict[str, Any]:
+        received = sum(end - start for start, end in manifest["received_ranges"])
+        return {
+            "upload_id": manifest["upload_id"],
+            "filename": manifest["filename"],
+            "total_size": manifest["total_size"],
+            "chunk_size": CHUNK_SIZE_BYTES,
+            "bytes_received": received,
+            "received_ranges": manifest["received_ranges"],
+            "complete": received == manifest["total_size"],
+            "created_at": manifest["created_at"]
+        }
+
+    async def create(self, filename: str, total_size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Start a new upload of total_size bytes
+        """
+        if total_size <= 0:
+            raise UploadError("Empty file")
+        if total_size > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"File too large. Maximum size is {format_size(MAX_UPLOAD_BYTES)}")
+
+        return await self._run(self._create, filename, total_size, sha256)
+
+    def _create(self, filename: str, total_size: int, sha256: Optional[str]) -> Dict[str, Any]:
+        self.cleanup_expired()
+
+        upload_id = str(uuid.uuid4())
+        paths = self._paths(upload_id)
+        with open(paths["data"], 'wb') as f:
+            f.truncate(total_size)  # Sparse on most filesystems
+
+        manifest = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "total_size": total_size,
+            "sha256": sha256.lower() if sha256 else None,
+            "received_ranges": [],
+            "created_at": time.time(),
+            "updated_at": time.time()
+        }
+        self._save(manifest)
+        logger.info(f"Started chunked upload {upload_id} for {filename} ({total_size} bytes)")
+        return self._status(manifest)
+
+    async def status(self, upload_id: str) -> Dict[str, Any]:
+        return self._status(await self._run(self._load, upload_id))
+
+    async def write_chunk(
+        self,
+        upload_id: str,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+        chunk_sha256: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Write one chunk at offset from a stream of body pieces. The chunk is
+        spooled and its size and checksum (if given) verified before it is
+        copied into the upload and its range recorded, under the upload's lock.
+        """
+        manifest = await self._run(self._load, upload_id)
+        total_size = manifest["total_size"]
+        if offset < 0 or offset >= total_size:
+            raise UploadError(f"Offset {offset} is outside the file (0-{total_size - 1})")
+
+        # The chunk goes to its own file first: nothing reaches the upload until it is verified
+        loop = asyncio.get_running_loop()
+        chunk_file = self.spool_dir / f"{upload_id}.{offset}.{uuid.uuid4().hex}.chunk"
+        digest = hashlib.sha256()
+        length = 0
+        try:
+            with open(chunk_file, 'wb') as f:
+                async for piece in chunks:
+                    length += len(piece)
+                    if length > MAX_CHUNK_BYTES or offset + length > total_size:
+                        raise UploadError(
+                            f"Chunk at offset {offset} is too large "
+                            f"(maximum {format_size(MAX_CHUNK_BYTES)}, file ends at {total_size})"
+                        )
+                    digest.update(piece)
+                    await loop.run_in_executor(None, f.write, piece)
+
+            if length == 0:
+                raise UploadError("Empty chunk")
+            if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+                raise UploadError(f"Checksum mismatch for chunk at offset {offset}; send it again")
+
+            async with self._lock(upload_id):
+                manifest = await self._run(self._record_chunk, upload_id, chunk_file, offset, length)
+        finally:
+            await self._run(partial(chunk_file.unlink, missing_ok=True))
+
+        return self._status(manifest)
+
+    def _record_chunk(self, upload_id: str, chunk_file: Path, offset: int, length: int) -> Dict[str, Any]:
+        # Raises KeyError if the upload was aborted or finalized meanwhile
+        manifest = self._load(upload_id)
+        copy_chunk(chunk_file, self._paths(upload_id)["data"], offset)
+        manifest["received_ranges"] = merge_ranges(manifest["received_ranges"] + [[offset, offset + length]])
+        manifest["updated_at"] = time.time()
+        self._save(manifest)
+        return manifest
+
+    async def finalize(self, upload_id: str, destination: Path) -> SpooledUpload:
+        """
+        Check the upload is complete and matches its checksum, then move it to destination
+        """
+        async with self._lock(upload_id):
+            manifest = await self._run(self._load, upload_id)
+            status = self._status(manifest)
+            if not status["complete"]:
+                raise UploadError(
+                    f"Upload incomplete: {status['bytes_received']} of {status['total_size']} bytes received"
+                )
+
+            paths = self._paths(upload_id)
+            sha256 = await self._run(file_sha256, paths["data"])
+            if manifest["sha256"] and sha256 != manifest["sha256"]:
+                raise UploadError("Checksum mismatch for the assembled file")
+
+            await self._run(move_file, paths["data"], destination)
+            await self._run(partial(paths["manifest"].unlink, missing_ok=True))
+
+        self._locks.pop(upload_id, None)
+        logger.info(f"Finalized chunked upload {upload_id} ({manifest['total_size']} bytes)")
+        return SpooledUpload(path=destination, size=manifest["total_size"], sha256=sha256)
+
+    async def abort(self, upload_id: str):
+        """
+        Discard an upload and everything received for it
+        """
+        try:
+            async with self._lock(upload_id):
+                await self._run(self._abort, upload_id)
+        finally:
+            self._locks.pop(upload_id, None)
+
+    def _abort(self, upload_id: str):
+        paths = self._paths(upload_id)
+        if not paths["manifest"].exists():
+            raise KeyError(upload_id)
+        for path in paths.values():
+            path.unlink(missing_ok=True)
+        for chunk_file in self.spool_dir.glob(f"{upload_id}.*.chunk"):
+            chunk_file.unlink(missing_ok=True)
+        self._locks.pop(upload_id, None)
+
+    def cleanup_expired(self):
+        """
+        Drop uploads that have not received a chunk within the expiry window
+        """
+        cutoff = time.time() - UPLOAD_EXPIRY_SECONDS
+        for manifest_file in self.spool_dir.glob("*.json"):
+            try:
+                with open(manifest_file, 'r') as f:
+                    manifest = json.load(f)
+                if manifest["updated_at"] < cutoff:
+                    logger.info(f"Removing expired upload {manifest['upload_id']}")
+                    self._abort(manifest["upload_id"])
+            except Exception as e:
+                logger.warning(f"Failed to check upload {manifest_file.name}: {str(e)}")
+        # Chunks left behind by a crash mid-write
+        for chunk_file in self.spool_dir.glob("*.chunk"):
+            try:
+                if chunk_file.stat().st_mtime < cutoff:
+                    chunk_file.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+def copy_chunk(chunk_file: Path, data_file: Path, offset: int):
+    """
+    Copy a verified chunk file into the upload's spool file at offset
+    """
+    with open(chunk_file, 'rb') as source, open(data_file, 'r+b') as f:
+        f.seek(offset)
+        for block in iter(lambda: source.read(SPOOL_CHUNK_BYTES), b''):
+            f.write(block)
+
+def move_file(source: Path, destination: Path):
+    """
+    Move a file, copying it when the destination is on another filesystem
+    """
+    try:
+        os.replace(source, destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(source), str(destination))
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(SPOOL_CHUNK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Global instance
+chunked_upload_manager = ChunkedUploadManager(
+    Path(os.environ.get("ANUBIS_UPLOAD_SPOOL_DIR", Path(tempfile.gettempdir()) / "anubis_pcap" / "uploads"))
+)
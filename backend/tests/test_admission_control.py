@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from services.admission_control import AdmissionController, AdmissionRejected
+
+def test_full_queue_is_refused_before_any_work():
+    controller = AdmissionController("test", max_concurrent=1, max_queue=1, max_wait_seconds=5)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.admit():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert (controller.running, controller.waiting) == (1, 1)
+
+        with pytest.raises(AdmissionRejected, match="already waiting") as rejection:
+            controller.check_capacity()
+        assert rejection.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(holder, waiter)
+        controller.check_capacity()
+
+    asyncio.run(scenario())
+    assert (controller.admitted, controller.rejected_queue_full) == (2, 1)
+
+def test_waiting_too_long_is_refused():
+    controller = AdmissionController("test", max_concurrent=1, max_queue=1, max_wait_seconds=0.01)
+
+    async def scenario():
+        async with controller.admit():
+            controller.check_capacity()
+            with pytest.raises(AdmissionRejected, match="no slot free"):
+                async with controller.admit():
+                    pass
+
+    asyncio.run(scenario())
+    assert (controller.admitted, controller.rejected_timeout, controller.running) == (1, 1, 0)
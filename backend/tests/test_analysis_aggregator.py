@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from models.prediction_models import PredictionBatch
+from services.analysis_aggregator import AnalysisAggregator, format_duration
+
+def chunk(risks):
+    """
+    Flow frame and predictions where every flow with risk above 50 is a DDoS attack
+    """
+    risk = np.asarray(risks, dtype=float)
+    is_attack = risk > 50
+    flow_df = pd.DataFrame({
+        'Flow ID': [f'flow-{value:g}' for value in risk],
+        'Src IP': ['10.0.0.1'] * len(risk),
+        'Dst IP': ['10.0.0.2'] * len(risk)
+    })
+    predictions = PredictionBatch(
+        is_attack=is_attack,
+        confidence=np.full(len(risk), 0.9),
+        risk_score=risk,
+        threat_code=np.where(is_attack, 0, -1).astype(np.int16),
+        threat_labels=('DDoS',)
+    )
+    return flow_df, predictions
+
+def test_result_rows_keep_the_baseline_schema():
+    aggregator = AnalysisAggregator(detail_limit=3, top_k=2)
+    aggregator.update(*chunk([10, 80, 60]))
+    aggregator.update(*chunk([80, 95]))
+
+    results = aggregator.finalize('capture.pcap', 'analysis-1')
+
+    assert [row['flow_id'] for row in results['top_flows']['overall']] == ['flow-95', 'flow-80']
+    assert [row['flow_id'] for row in results['top_flows']['by_threat_type']['DDoS']] == ['flow-95', 'flow-80']
+    assert len(results['detailed_results']) == 3
+    rows = results['detailed_results'] + results['top_flows']['overall']
+    assert all('index' not in row for row in rows)
+    assert results['statistics']['analysis_duration'] == '< 1 minute'
+
+def test_equal_risk_keeps_capture_order():
+    aggregator = AnalysisAggregator(top_k=1)
+    aggregator.update(*chunk([70]))
+    flow_df, predictions = chunk([70])
+    flow_df['Flow ID'] = ['later']
+    aggregator.update(flow_df, predictions)
+
+    assert aggregator.top_flows[0]['flow_id'] == 'flow-70'
+
+def test_format_duration():
+    assert format_duration(59.9) == '< 1 minute'
+    assert format_duration(60) == '1 minute'
+    assert format_duration(185) == '3 minutes'
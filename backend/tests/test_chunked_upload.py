@@ -0,0 +1,63 @@
+import asyncio
+import errno
+import hashlib
+import os
+
+import pytest
+
+import services.upload_spool as upload_spool
+from services.upload_spool import ChunkedUploadManager, UploadError
+
+DATA = bytes(range(256)) * 40
+
+async def body(data: bytes):
+    yield data[:100]
+    yield data[100:]
+
+def test_chunks_in_any_order_assemble_the_file(tmp_path, monkeypatch):
+    manager = ChunkedUploadManager(tmp_path / "uploads")
+
+    # The analysis directory may be on another filesystem than the spool
+    real_replace = os.replace
+
+    def replace(source, destination):
+        if str(source).endswith(".part"):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        real_replace(source, destination)
+
+    monkeypatch.setattr(upload_spool.os, "replace", replace)
+
+    async def scenario():
+        upload = await manager.create("capture.pcap", len(DATA), hashlib.sha256(DATA).hexdigest())
+        upload_id = upload["upload_id"]
+
+        await manager.write_chunk(upload_id, 4096, body(DATA[4096:]))
+        with pytest.raises(UploadError, match="Checksum mismatch"):
+            await manager.write_chunk(upload_id, 0, body(DATA[:4096]), chunk_sha256="0" * 64)
+        with pytest.raises(UploadError, match="Upload incomplete"):
+            await manager.finalize(upload_id, tmp_path / "input.pcap")
+
+        status = await manager.write_chunk(upload_id, 0, body(DATA[:4096]), hashlib.sha256(DATA[:4096]).hexdigest())
+        assert status["complete"] and status["received_ranges"] == [[0, len(DATA)]]
+        return await manager.finalize(upload_id, tmp_path / "input.pcap"), upload_id
+
+    spooled, upload_id = asyncio.run(scenario())
+
+    assert (tmp_path / "input.pcap").read_bytes() == DATA
+    assert spooled.sha256 == hashlib.sha256(DATA).hexdigest()
+    assert list((tmp_path / "uploads").iterdir()) == []
+    with pytest.raises(KeyError):
+        asyncio.run(manager.status(upload_id))
+
+def test_abort_discards_the_upload(tmp_path):
+    manager = ChunkedUploadManager(tmp_path / "uploads")
+
+    async def scenario():
+        upload = await manager.create("capture.pcap", len(DATA))
+        await manager.write_chunk(upload["upload_id"], 0, body(DATA[:1000]))
+        await manager.abort(upload["upload_id"])
+        with pytest.raises(KeyError):
+            await manager.abort(upload["upload_id"])
+
+    asyncio.run(scenario())
+    assert list((tmp_path / "uploads").iterdir()) == []
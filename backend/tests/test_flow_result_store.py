@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from models.prediction_models import PredictionBatch
+from services.flow_result_store import FlowResultStore
+
+FLOWS = 2500
+
+def store_analysis(root) -> FlowResultStore:
+    """
+    A stored analysis of FLOWS flows, written in chunks; every third flow is an attack
+    """
+    store = FlowResultStore(root)
+    writer = store.create("analysis-1")
+    rng = np.random.default_rng(0)
+    for start in range(0, FLOWS, 1000):
+        index = np.arange(start, min(start + 1000, FLOWS))
+        is_attack = index % 3 == 0
+        flow_df = pd.DataFrame({
+            'Src IP': [f'10.0.0.{value % 7}' for value in index],
+            'Dst IP': ['10.0.1.1'] * len(index),
+            'Src Port': 1024 + index % 100,
+            'Dst Port': np.where(is_attack, 80, 53),
+            'Protocol': 6,
+            'Timestamp': 1000.0 + index
+        })
+        writer.append(flow_df, PredictionBatch(
+            is_attack=is_attack,
+            confidence=np.full(len(index), 0.9),
+            # Coarse risk so many flows tie
+            risk_score=np.round(rng.random(len(index)), 1),
+            threat_code=np.where(is_attack, 0, -1).astype(np.int16),
+            threat_labels=('DDoS',)
+        ))
+    writer.close()
+    return store
+
+def all_pages(table, **query):
+    flows, cursor, pages = [], None, 0
+    while True:
+        page = table.query(cursor=cursor, limit=97, **query)
+        flows += page['flows']
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            return flows, pages
+
+def test_cursor_pages_cover_every_match_once(tmp_path):
+    table = store_analysis(tmp_path).open("analysis-1")
+
+    flows, pages = all_pages(table, sort='index', classification='ATTACK')
+    assert [flow['index'] for flow in flows] == list(range(0, FLOWS, 3))
+    assert flows[1]['flow_id'] == "10.0.0.3_1027_10.0.1.1_80_6_1003000000"
+    assert pages == -(-len(flows) // 97)
+
+    flows, _ = all_pages(table, sort='risk')
+    assert sorted(flow['index'] for flow in flows) == list(range(FLOWS))
+    ranked = [(-flow['prediction']['risk_score'], flow['index']) for flow in flows]
+    assert ranked == sorted(ranked)
+
+def test_filters_that_cannot_match_return_an_empty_page(tmp_path):
+    table = store_analysis(tmp_path).open("analysis-1")
+
+    page = table.query(ip='192.0.2.1')
+    assert page['flows'] == [] and page['next_cursor'] is None
+
+def test_bad_cursor_and_missing_analysis(tmp_path):
+    store = store_analysis(tmp_path)
+
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        store.open("analysis-1").query(sort='risk', cursor='index:10')
+    with pytest.raises(KeyError):
+        store.open("analysis-2")
@@ -0,0 +1,44 @@
+from services.cicflow_extractor import CICFlowExtractor
+from services.flow_table import TCP_FIN, StreamingFlowTable, flow_id
+
+KEY = "10.0.0.1_40000_10.0.0.2_80_6"
+
+def packet(timestamp: float, flags: int = 0x10):
+    return (timestamp, 60, "10.0.0.1", flags)
+
+def feed(table: StreamingFlowTable, flow_key: str, timestamps, flags=None):
+    finished = []
+    for index, timestamp in enumerate(timestamps):
+        table.add(flow_key, packet(timestamp, (flags or {}).get(index, 0x10)))
+        finished += table.expire()
+    return finished
+
+def test_one_key_splits_into_uniquely_identified_flows():
+    table = StreamingFlowTable(idle_timeout=60, close_timeout=1)
+    # FIN at 2s closes the first flow and a long gap idles out the second, once
+    # other traffic has moved the capture clock on
+    finished = feed(table, KEY, [0, 1, 2], flags={2: TCP_FIN})
+    finished += feed(table, "other", [4])
+    finished += feed(table, KEY, [5, 6])
+    finished += feed(table, "other", [100])
+    finished += feed(table, KEY, [106, 107])
+    finished = [flow for flow in finished + table.flush() if flow[0] == KEY]
+
+    assert [[record[0] for record in packets] for _, packets in finished] == [[0, 1, 2], [5, 6], [106, 107]]
+
+    rows = CICFlowExtractor._process_flow_chunk(finished)
+    assert [row['Flow ID'] for row in rows] == [f"{KEY}_0", f"{KEY}_5000000", f"{KEY}_106000000"]
+    assert len({row['Flow ID'] for row in rows}) == 3
+
+def test_least_recently_seen_flow_is_evicted_when_full():
+    table = StreamingFlowTable(max_active_flows=2)
+    table.add("a", packet(1))
+    table.add("b", packet(2))
+    table.add("a", packet(3))
+    table.add("c", packet(4))
+
+    assert [flow_key for flow_key, _ in table.expire()] == ["b"]
+    assert sorted(table.flows) == ["a", "c"]
+
+def test_flow_id_uses_microseconds():
+    assert flow_id(KEY, 1700000000.25) == f"{KEY}_1700000000250000"
@@ -0,0 +1,55 @@
+import time
+
+from services.job_queue import PRIORITY_LARGE, PRIORITY_SMALL, JobQueue
+
+def enqueue(queue: JobQueue, job_id: str, **options):
+    return queue.enqueue(job_id, f"/tmp/{job_id}.pcap", f"{job_id}.pcap", 100, **options)
+
+def test_small_jobs_are_claimed_first_and_each_job_once(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3")
+    enqueue(queue, "large", priority=PRIORITY_LARGE)
+    enqueue(queue, "small", priority=PRIORITY_SMALL)
+
+    assert queue.claim("worker-1")["job_id"] == "small"
+    assert queue.claim("worker-2")["job_id"] == "large"
+    assert queue.claim("worker-3") is None
+
+def test_expired_lease_is_requeued_until_attempts_run_out(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=0.05, max_attempts=2)
+    enqueue(queue, "job")
+
+    assert queue.claim("worker-1")["attempts"] == 1
+    time.sleep(0.1)
+    assert queue.requeue_expired() == []
+    # The crashed worker lost the job and cannot renew or complete it
+    assert not queue.heartbeat("job", "worker-1", progress=50)
+
+    assert queue.claim("worker-2")["attempts"] == 2
+    time.sleep(0.1)
+    assert [job["job_id"] for job in queue.requeue_expired()] == ["job"]
+    assert queue.get("job")["status"] == "failed"
+
+def test_heartbeat_keeps_the_lease_and_reports_cancellation(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=0.2)
+    enqueue(queue, "job")
+    queue.claim("worker-1")
+
+    for _ in range(3):
+        time.sleep(0.1)
+        assert queue.heartbeat("job", "worker-1", progress=50)
+        assert queue.requeue_expired() == []
+
+    queue.cancel("job")
+    assert not queue.heartbeat("job", "worker-1")
+    assert queue.get("job")["cancel_requested"]
+
+def test_same_content_and_model_reuses_the_job(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3")
+    first = enqueue(queue, "first", content_sha256="abc", model_version="v1")
+
+    assert enqueue(queue, "second", content_sha256="abc", model_version="v1")["job_id"] == first["job_id"]
+    assert enqueue(queue, "other-model", content_sha256="abc", model_version="v2")["job_id"] == "other-model"
+    assert enqueue(queue, "no-reuse", content_sha256="abc", model_version="v1", reuse_existing=False)["job_id"] == "no-reuse"
+
+    queue.cancel("first")
+    assert enqueue(queue, "after-cancel", content_sha256="abc", model_version="v1")["job_id"] == "no-reuse"
@@ -0,0 +1,40 @@
+import os
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from services.model_mmap import CompiledTreeEnsemble, load_shared_artifact
+
+def fitted_forest() -> RandomForestClassifier:
+    rng = np.random.default_rng(0)
+    X = rng.random((200, 5))
+    return RandomForestClassifier(n_estimators=5, random_state=0).fit(X, (X[:, 0] > 0.5).astype(int))
+
+def test_compiled_copy_matches_the_forest(tmp_path):
+    forest = fitted_forest()
+    joblib.dump(forest, tmp_path / "model.pkl")
+
+    compiled = load_shared_artifact(tmp_path / "model.pkl", tmp_path / "mmap", compile_trees=True)
+
+    X = np.random.default_rng(1).random((50, 5))
+    assert isinstance(compiled, CompiledTreeEnsemble)
+    assert np.allclose(compiled.predict_proba(X), forest.predict_proba(X))
+
+def test_stale_copies_are_pruned_when_the_source_changes(tmp_path):
+    joblib.dump(fitted_forest(), tmp_path / "model.pkl")
+    load_shared_artifact(tmp_path / "model.pkl", tmp_path / "mmap")
+
+    os.utime(tmp_path / "model.pkl", ns=(1, 1))
+    load_shared_artifact(tmp_path / "model.pkl", tmp_path / "mmap")
+
+    copies = [path.name for path in (tmp_path / "mmap" / "model").iterdir() if path.name != "manifest.json"]
+    assert copies == [f"artifact-1-{(tmp_path / 'model.pkl').stat().st_size}.joblib"]
+
+def test_unwritable_cache_falls_back_to_a_private_copy(tmp_path):
+    joblib.dump(fitted_forest(), tmp_path / "model.pkl")
+    (tmp_path / "mmap").write_text("not a directory")
+
+    model = load_shared_artifact(tmp_path / "model.pkl", tmp_path / "mmap", compile_trees=True)
+
+    assert isinstance(model, RandomForestClassifier)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from services.ai_model_service import AIModelService
+from services.model_registry import ModelRegistry
+
+FEATURES = [f"feature_{index}" for index in range(6)]
+
+def write_version(root: Path, version: str, flip: bool = False):
+    """
+    Version directory with a small forest; flip inverts its labels so it disagrees with the others
+    """
+    rng = np.random.default_rng(0)
+    X = rng.random((300, len(FEATURES))) * 100
+    y = (X[:, 0] > 50).astype(int)
+    if flip:
+        y = 1 - y
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(scaler.transform(X), y)
+
+    version_dir = root / "versions" / version
+    version_dir.mkdir(parents=True)
+    joblib.dump(model, version_dir / "model.pkl")
+    joblib.dump(scaler, version_dir / "scaler.pkl")
+    (version_dir / "selected_features.json").write_text(json.dumps(FEATURES))
+
+def make_service(root: Path) -> AIModelService:
+    service = AIModelService()
+    service.registry = ModelRegistry(root, mmap_mode="off")
+    return service
+
+@pytest.fixture
+def model_root(tmp_path, monkeypatch):
+    monkeypatch.delenv("ANUBIS_MODEL_VERSION", raising=False)
+    write_version(tmp_path, "v1")
+    write_version(tmp_path, "v2")
+    write_version(tmp_path, "v3", flip=True)
+    return tmp_path
+
+def test_reload_requires_parity_unless_skipped(model_root):
+    service = make_service(model_root)
+
+    async def scenario():
+        await service.reload_model("v1")
+        assert (await service.reload_model("v2"))["agreement"] == 1.0
+        with pytest.raises(ValueError, match="Parity check failed"):
+            await service.reload_model("v3")
+        assert service.model_version == "v2"
+        await service.reload_model("v3", skip_parity=True)
+
+    asyncio.run(scenario())
+    assert service.model_version == "v3"
+    assert service.registry.active_version() == "v3"
+
+def test_other_processes_follow_active_version(model_root):
+    reloading, following = make_service(model_root), make_service(model_root)
+
+    async def scenario():
+        await reloading.reload_model("v1")
+        await following.use_version("v1")
+        watcher = asyncio.create_task(following.follow_active_version(interval=0.01))
+        await asyncio.sleep(0.05)
+        await reloading.reload_model("v2")
+        for _ in range(200):
+            if following.model_version == "v2":
+                break
+            await asyncio.sleep(0.01)
+        watcher.cancel()
+
+    asyncio.run(scenario())
+    assert following.model_version == "v2"
+
+def test_pinned_version_refuses_reload(model_root, monkeypatch):
+    monkeypatch.setenv("ANUBIS_MODEL_VERSION", "v1")
+    service = make_service(model_root)
+
+    with pytest.raises(ValueError, match="ANUBIS_MODEL_VERSION"):
+        asyncio.run(service.reload_model("v2"))
+    assert service.model_version is None
+
+def test_invalid_cascade_config_disables_the_cascade(model_root):
+    registry = ModelRegistry(model_root, mmap_mode="off")
+    (model_root / "versions" / "v1" / "cascade.json").write_text(json.dumps({"rules": [{"min": {"No such feature": 1}}]}))
+    (model_root / "versions" / "v2" / "cascade.json").write_text("{not json")
+
+    assert registry.load_bundle("v1").cascade is None
+    assert registry.load_bundle("v2").cascade is None
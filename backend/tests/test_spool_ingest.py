@@ -0,0 +1,122 @@
+import asyncio
+import json
+import socket
+import struct
+from pathlib import Path
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from services.ai_model_service import ai_model_service
+from services.model_registry import ModelBundle
+from services.pcap_analyzer import shutdown_extraction_pool
+from services.spool_ingest import SpoolIngestService
+from services.threat_rules import ThreatRuleTable
+
+PACKETS = 3000
+
+def udp_packet(index: int) -> bytes:
+    payload = bytes(64)
+    udp = struct.pack('>HHHH', 10000 + index % 500, 53, 8 + len(payload), 0) + payload
+    ip = struct.pack(
+        '>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), index & 0xFFFF, 0, 64, 17, 0,
+        socket.inet_aton('10.0.0.1'), socket.inet_aton(f'10.0.{index % 200}.2')
+    )
+    return b'\x00' * 12 + b'\x08\x00' + ip + udp
+
+def write_capture(path: Path, packets: int, cut_last: int = 0) -> int:
+    """
+    Classic pcap of UDP packets one millisecond apart; cut_last bytes of the last packet left out
+    """
+    data = struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+    for index in range(packets):
+        frame = udp_packet(index)
+        data += struct.pack('<IIII', 1000 + index // 1000, (index % 1000) * 1000, len(frame), len(frame)) + frame
+    data = data[:len(data) - cut_last]
+    path.write_bytes(data)
+    return len(data)
+
+class Collection:
+    def __init__(self):
+        self.documents = []
+        self.updates = []
+
+    async def insert_one(self, document):
+        self.documents.append(document)
+
+    async def insert_many(self, documents):
+        self.documents.extend(documents)
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update))
+
+class HistoryRecorder:
+    """
+    Stands in for the scan history database
+    """
+
+    def __init__(self):
+        self.scan_sessions = Collection()
+        self.scan_results = Collection()
+
+def make_service(tmp_path: Path, max_read_bytes: int, history_db: HistoryRecorder = None) -> SpoolIngestService:
+    return SpoolIngestService(
+        tmp_path, tmp_path / "checkpoint.json", max_read_bytes=max_read_bytes, history_db=history_db or HistoryRecorder()
+    )
+
+def small_model_bundle() -> ModelBundle:
+    features = json.loads((Path(__file__).parent.parent / "models" / "trained_models" / "selected_features.json").read_text())
+    rng = np.random.default_rng(0)
+    X = rng.random((300, len(features))) * 1000
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(scaler.transform(X), (X[:, 0] > 500).astype(int))
+    return ModelBundle("test", model, scaler, tuple(features), ThreatRuleTable(), Path("."))
+
+def test_finished_file_is_read_to_the_end_across_read_windows(tmp_path):
+    size = write_capture(tmp_path / "cap-00.pcap", PACKETS)
+    service = make_service(tmp_path, max_read_bytes=40_000)
+
+    offset, reads = 0, 0
+    while True:
+        offset, _, caught_up = service._read_increment(tmp_path / "cap-00.pcap", offset, finished=True)
+        reads += 1
+        if caught_up:
+            break
+
+    assert reads > 1
+    assert offset == size
+    assert service.packets_read == PACKETS
+
+def test_partly_written_last_packet_is_left_for_the_next_read(tmp_path):
+    size = write_capture(tmp_path / "cap-00.pcap", PACKETS, cut_last=30)
+    service = make_service(tmp_path, max_read_bytes=64 * 1024 ** 2)
+
+    offset, _, caught_up = service._read_increment(tmp_path / "cap-00.pcap", 0, finished=False)
+
+    assert caught_up
+    assert service.packets_read == PACKETS - 1
+    assert size - offset == len(udp_packet(PACKETS - 1)) + 16 - 30
+
+def test_spooled_flows_are_scored_into_the_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_model_service, "_bundle", small_model_bundle())
+    write_capture(tmp_path / "cap-00.pcap", PACKETS)
+    history = HistoryRecorder()
+    service = make_service(tmp_path, max_read_bytes=64 * 1024 ** 2, history_db=history)
+
+    async def scenario():
+        await service.poll()
+        # The sensor is still on the newest file: its flows stay open until stop
+        await service._score(service.flow_table.flush())
+        await service._close_session("STOPPED")
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        shutdown_extraction_pool()
+
+    assert (service.checkpoint["file"], service.checkpoint["offset"]) == ("cap-00.pcap", (tmp_path / "cap-00.pcap").stat().st_size)
+    assert service.flows_scored == 1000
+    assert len(history.scan_sessions.documents) == 1
+    assert len(history.scan_results.documents) == 1000
+    assert history.scan_sessions.updates[-1][1]["$set"]["status"] == "STOPPED"
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from services.cicflow_extractor import CICFlowExtractor
+from services.threat_rules import ThreatRuleTable, rule_packet_rates
+
+def extractor_rows(flows) -> pd.DataFrame:
+    """
+    Extractor output for flows given as (flow key, [(timestamp, length, src_ip, tcp_flags), ...])
+    """
+    return pd.DataFrame(CICFlowExtractor._process_flow_chunk(flows))
+
+def threat_types(flow_df: pd.DataFrame, confidence: float = 0.6):
+    packet_rates = rule_packet_rates(
+        flow_df['Flow Pkts/s'], flow_df['Flow Duration'], flow_df['Tot Fwd Pkts'] + flow_df['Tot Bwd Pkts']
+    )
+    return ThreatRuleTable().classify(flow_df['Dst Port'], packet_rates, [confidence] * len(flow_df)).tolist()
+
+def test_zero_duration_burst_counts_as_the_fastest_rate():
+    flow_df = extractor_rows([
+        # 200 packets in the same microsecond: the extractor reports 0 packets/s
+        ("10.0.0.1_40000_10.0.0.2_80_6", [(1000.0, 60, "10.0.0.1", 2)] * 200),
+        # Two packets a second apart: 2 packets/s
+        ("10.0.0.3_40001_10.0.0.2_80_6", [(1000.0, 60, "10.0.0.3", 2), (1001.0, 60, "10.0.0.3", 16)]),
+        # A lone packet has no rate at all
+        ("10.0.0.4_40002_10.0.0.2_443_6", [(1000.0, 60, "10.0.0.4", 2)])
+    ])
+
+    assert flow_df['Flow Duration'].tolist()[0] == 0 and flow_df['Flow Pkts/s'].tolist()[0] == 0
+    assert threat_types(flow_df) == ["DDoS", "Web_Attack", "Web_Attack"]
@@ -0,0 +1,46 @@
+import asyncio
+
+from services.upload_spool import MultipartUpload
+
+BOUNDARY = "capture-boundary"
+
+def multipart_body(files, field_name="files") -> bytes:
+    body = b""
+    for filename, content in files:
+        body += (
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+async def trickle(body: bytes, size: int = 7):
+    """
+    The body in small pieces, so part boundaries fall inside pieces
+    """
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+def read_all(upload: MultipartUpload, skip=()):
+    async def collect():
+        files = []
+        while True:
+            filename = await upload.next_file()
+            if filename is None:
+                return files
+            if filename in skip:
+                continue
+            files.append((filename, b"".join([piece async for piece in upload.pieces()])))
+    return asyncio.run(collect())
+
+def test_reads_repeated_file_fields_in_order():
+    files = [("a.pcap", b"\xd4\xc3\xb2\xa1" * 100), ("b.zip", b"PK\x03\x04"), ("c.pcapng", b"")]
+    upload = MultipartUpload(trickle(multipart_body(files)), f"multipart/form-data; boundary={BOUNDARY}", "files")
+
+    assert read_all(upload) == files
+
+def test_unread_files_are_skipped():
+    files = [("a.pcap", b"first"), ("b.pcap", b"second"), ("c.pcap", b"third")]
+    upload = MultipartUpload(trickle(multipart_body(files)), f"multipart/form-data; boundary={BOUNDARY}", "files")
+
+    assert read_all(upload, skip={"b.pcap"}) == [("a.pcap", b"first"), ("c.pcap", b"third")]
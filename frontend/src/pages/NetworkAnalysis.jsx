@@ -32,34 +32,41 @@ const NetworkAnalysis = () => {
   const [analysisResults, setAnalysisResults] = useState(null);
   const [isUploading, setIsUploading] = useState(false);
 
-  // Polling for analysis status
-  const pollAnalysisStatus = useCallback(async (id) => {
+  // Handle a status update; returns false once the analysis has finished
+  const handleAnalysisStatus = useCallback(async (id, status) => {
+    setAnalysisStatus(status);
+
+    if (status.status === 'completed') {
+      // Get the results
+      const resultsResponse = await axios.get(`${API}/pcap/analysis/${id}/results`);
+      setAnalysisResults(resultsResponse.data);
+      
+      toast({
+        title: "Analysis Complete",
+        description: "Your PCAP file has been analyzed successfully.",
+      });
+      
+      return false;
+    } else if (status.status === 'failed' || status.status === 'cancelled') {
+      toast({
+        title: "Analysis Failed",
+        description: status.message,
+        variant: "destructive"
+      });
+      return false;
+    }
+    
+    return true;
+  }, [toast]);
+
+  // Long-poll the status endpoint: each request returns as soon as the status changes
+  const longPollAnalysisStatus = useCallback(async (id, since = null) => {
     try {
-      const response = await axios.get(`${API}/pcap/analysis/${id}/status`);
-      const status = response.data;
-      setAnalysisStatus(status);
-
-      if (status.status === 'completed') {
-        // Get the results
-        const resultsResponse = await axios.get(`${API}/pcap/analysis/${id}/results`);
-        setAnalysisResults(resultsResponse.data);
-        
-        toast({
-          title: "Analysis Complete",
-          description: "Your PCAP file has been analyzed successfully.",
-        });
-        
-        return false; // Stop polling
-      } else if (status.status === 'failed') {
-        toast({
-          title: "Analysis Failed",
-          description: status.message,
-          variant: "destructive"
-        });
-        return false; // Stop polling
+      const params = since === null ? {} : { since, wait: 25 };
+      const response = await axios.get(`${API}/pcap/analysis/${id}/status`, { params });
+      if (await handleAnalysisStatus(id, response.data)) {
+        longPollAnalysisStatus(id, response.data.revision);
       }
-      
-      return true; // Continue polling
     } catch (error) {
       console.error('Failed to poll status:', error);
       toast({
@@ -67,9 +74,34 @@ const NetworkAnalysis = () => {
         description: "Failed to check analysis status",
         variant: "destructive"
       });
-      return false; // Stop polling
     }
-  }, [toast]);
+  }, [handleAnalysisStatus, toast]);
+
+  // Follow progress pushed by the server, falling back to long-polling
+  const watchAnalysisStatus = useCallback((id) => {
+    if (!window.EventSource) {
+      longPollAnalysisStatus(id);
+      return;
+    }
+
+    let finished = false;
+    const events = new EventSource(`${API}/pcap/analysis/${id}/events`);
+    events.onmessage = (event) => {
+      const status = JSON.parse(event.data);
+      finished = ['completed', 'failed', 'cancelled'].includes(status.status);
+      if (finished) {
+        events.close();
+      }
+      handleAnalysisStatus(id, status);
+    };
+    events.onerror = () => {
+      // The stream closes after the final status; otherwise fall back to long-polling
+      events.close();
+      if (!finished) {
+        longPollAnalysisStatus(id);
+      }
+    };
+  }, [handleAnalysisStatus, longPollAnalysisStatus]);
 
   const handleFileSelect = (selectedFile) => {
     if (!selectedFile) {
@@ -92,12 +124,12 @@ const NetworkAnalysis = () => {
       return;
     }
 
-    // Check file size (100MB limit)
-    const maxSize = 100 * 1024 * 1024;
+    // Check file size (8GB limit, matches ANUBIS_MAX_UPLOAD_BYTES default)
+    const maxSize = 8 * 1024 * 1024 * 1024;
     if (selectedFile.size > maxSize) {
       toast({
         title: "File Too Large",
-        description: "File size must be less than 100MB",
+        description: "File size must be less than 8GB",
         variant: "destructive"
       });
       console.log("File too large:", selectedFile.size);
@@ -189,13 +221,8 @@ const NetworkAnalysis = () => {
         description: "File uploaded. Analysis started.",
       });
 
-      // Start polling for status
-      const pollInterval = setInterval(async () => {
-        const shouldContinue = await pollAnalysisStatus(analysis_id);
-        if (!shouldContinue) {
-          clearInterval(pollInterval);
-        }
-      }, 2000);
+      // Follow the analysis' progress
+      watchAnalysisStatus(analysis_id);
 
     } catch (error) {
       console.error('Upload failed:', error);
@@ -291,7 +318,7 @@ const NetworkAnalysis = () => {
                 Drop your file here or click to browse
               </p>
               <p className="text-gray-500 dark:text-gray-400 mb-4">
-                Supported formats: .pcap, .pcapng, .cap (Max 100MB)
+                Supported formats: .pcap, .pcapng, .cap (Max 8GB)
               </p>
               <input
                 type="file"
@@ -365,6 +392,14 @@ const NetworkAnalysis = () => {
             </div>
             <Progress value={analysisStatus.progress} className="w-full" />
             <p className="text-sm text-gray-600 dark:text-gray-300">{analysisStatus.message}</p>
+            {analysisStatus.stats?.bytes_total && analysisStatus.status === 'processing' && (
+              <p className="text-xs text-gray-500 dark:text-gray-400">
+                {(analysisStatus.stats.bytes_read / (1024 * 1024)).toFixed(1)} / {(analysisStatus.stats.bytes_total / (1024 * 1024)).toFixed(1)} MB read
+                {' · '}{analysisStatus.stats.packets_read} packets
+                {' · '}{analysisStatus.stats.flows_finished} flows
+                {' · '}{analysisStatus.stats.flows_scored} scored
+              </p>
+            )}
             
             <div className="flex items-center space-x-4 text-sm text-gray-500 dark:text-gray-400">
               <div className="flex items-center space-x-1">